@@ -0,0 +1,253 @@
+import os, re, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import file_store
+import clock_archive
+import time_engine
+import work_calendar
+
+# ----------------------
+# Clock Anomaly Scanner (all employees, month or year)
+# ----------------------
+#
+# Scans the clock month files of clock_hours_data/{year}/month_MM/ and the
+# months packed into the year's archive, without opening each employee's
+# month page. A unit is one employee-month (one file, or one archive month
+# not shadowed by a file); units are split into shards and scanned by a
+# process pool. Results are cached in clock_hours_data/{year}/
+# clock_anomalies_{year}.json together with the source generation (file
+# stat, or the archive's stat), so unchanged months are not scanned again.
+#
+# Anomalies per day:
+#   open_shift          clock-in without clock-out (today excluded)
+#   end_without_start   clock-out without clock-in
+#   bad_time            start / end text that is not HH:MM
+#   overlap             two shifts of the day overlap
+#   over_12_hours       more than 12 hours worked in the day
+#   night_across_month  the last shift of the month's last day ends next month
+#   saturday_unmarked   worked on Saturday, שבת mark missing
+#   holiday_unmarked    worked on a holiday (work_calendar), חג mark missing
+
+CLOCK_FILE_RE = re.compile(r"^clock_hours_(.+)_(\d{4})-(\d{2})\.json$")
+
+MAX_DAY_MINUTES = 12 * 60
+SHARD_SIZE = int(os.getenv("ANOMALY_SHARD_SIZE", "64"))
+WORKERS = int(os.getenv("ANOMALY_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+CACHE_VERSION = 1
+
+
+def cache_path(base_dir, year):
+    return os.path.join(base_dir, str(year), f"clock_anomalies_{year}.json")
+
+
+# ----------------------
+# Rules (one employee-month)
+# ----------------------
+
+def _anomaly(d, kind, detail=""):
+    return {"date": d.isoformat(), "kind": kind, "detail": detail}
+
+
+def scan_entries(year, month, entries, today=None):
+    """Anomalies of one month of work_day_entries, ordered by date."""
+    year, month = int(year), int(month)
+    days = work_calendar.month_arrays(year, month)
+    last_day = len(days["weekday"])
+    found = []
+
+    for entry in sorted(entries or [], key=lambda e: str(e.get("date", ""))):
+        try:
+            d = date.fromisoformat(str(entry.get("date", ""))[:10])
+        except ValueError:
+            continue
+        if d.year != year or d.month != month:
+            continue
+
+        pairs = entry.get("shifts") or [[entry.get("start_time"), entry.get("end_time")]]
+        closed, worked = [], False
+        for i, (start_text, end_text) in enumerate(pairs):
+            start_text, end_text = str(start_text or "").strip(), str(end_text or "").strip()
+            start, end = time_engine.parse_hm(start_text), time_engine.parse_hm(end_text)
+            for text, value in ((start_text, start), (end_text, end)):
+                if text and value is None:
+                    found.append(_anomaly(d, "bad_time", text))
+            if start is not None and end is None and not end_text:
+                if not (d == today and i == len(pairs) - 1):
+                    found.append(_anomaly(d, "open_shift", start_text))
+            elif end is not None and start is None and not start_text:
+                found.append(_anomaly(d, "end_without_start", end_text))
+            worked = worked or start is not None or end is not None
+            if start is not None and end is not None:
+                closed.append(time_engine.day_shift(d, start_text, end_text))
+
+        ordered = sorted(closed)
+        for previous, current in zip(ordered, ordered[1:]):
+            if current[0] < previous[1]:
+                found.append(_anomaly(d, "overlap",
+                                      f"{time_engine.stamp_hm(previous[0])}-{time_engine.stamp_hm(previous[1])} / "
+                                      f"{time_engine.stamp_hm(current[0])}-{time_engine.stamp_hm(current[1])}"))
+
+        minutes = time_engine.total_minutes(closed)
+        if minutes > MAX_DAY_MINUTES:
+            found.append(_anomaly(d, "over_12_hours", f"{time_engine.hours(minutes):.2f}"))
+
+        last_end = max((e for _, e in closed), default=None)
+        if d.day == last_day and last_end is not None and last_end > (time_engine.day_number(d) + 1) * time_engine.MINUTES_PER_DAY:
+            found.append(_anomaly(d, "night_across_month", time_engine.stamp_hm(last_end)))
+
+        if worked and days["saturday"][d.day - 1] and not str(entry.get("saturday") or "").strip():
+            found.append(_anomaly(d, "saturday_unmarked"))
+        if worked and days["holiday"][d.day - 1] and not str(entry.get("holiday") or "").strip():
+            found.append(_anomaly(d, "holiday_unmarked", work_calendar.month_days(year, month)[d.day - 1]["holiday"]))
+
+    return found
+
+
+# ----------------------
+# Units And Shards
+# ----------------------
+
+def _live_months(today):
+    """Months whose result depends on today's date (open shift of today is not flagged)."""
+    yesterday = today - timedelta(days=1)
+    return {(today.year, today.month), (yesterday.year, yesterday.month)}
+
+
+def list_units(base_dir, year, months, today):
+    """[(key, source, path, employee_id, month, generation)] of the months to report."""
+    year = int(year)
+    live = _live_months(today)
+    units, file_names = [], {}
+
+    for month in months:
+        folder = os.path.join(base_dir, str(year), f"month_{month:02d}")
+        if not os.path.isdir(folder):
+            continue
+        for item in os.scandir(folder):
+            m = CLOCK_FILE_RE.match(item.name)
+            if not m or int(m.group(2)) != year or int(m.group(3)) != month:
+                continue
+            st = item.stat()
+            generation = [st.st_ino, st.st_mtime_ns, st.st_size]
+            if (year, month) in live:
+                generation.append(today.isoformat())
+            units.append((f"file:{month:02d}/{item.name}", "file", item.path, None, month, generation))
+            file_names.setdefault(month, set()).add(m.group(1))
+
+    archive = clock_archive.open_archive(base_dir, year)
+    if archive is not None:
+        generation = list(archive.stat or ())
+        for employee_id in archive.employee_ids():
+            file_name = archive.employee(employee_id)["file_name"]
+            for month in months:
+                if archive.has_month(employee_id, month) and file_name not in file_names.get(month, ()):
+                    units.append((f"archive:{employee_id}:{month:02d}", "archive", archive.path, employee_id, month,
+                                  generation + ([today.isoformat()] if (year, month) in live else [])))
+    return units
+
+
+def scan_shard(base_dir, year, units, today_iso):
+    """Worker: scan a list of units -> [(key, result)]."""
+    today = date.fromisoformat(today_iso)
+    done = []
+    for key, source, path, employee_id, month, generation in units:
+        if source == "file":
+            doc = file_store.read_json(path, {}) or {}
+            entries = doc.get("hours_table_clock", {}).get("work_day_entries", [])
+        else:
+            archive = clock_archive.open_archive(base_dir, year)
+            if archive is None:
+                continue
+            doc = archive.employee(employee_id) or {}
+            entries = archive.month_entries(employee_id, month)
+        done.append((key, {
+            "generation": generation,
+            "employee_id": str(doc.get("employee_id", employee_id or "")),
+            "employee_name": doc.get("employee_name", ""),
+            "month": month,
+            "source": source,
+            "anomalies": scan_entries(year, month, entries, today),
+        }))
+    return done
+
+
+def _unit_month(key):
+    # "file:MM/name.json" or "archive:id:MM"
+    return int(key.rsplit(":", 1)[1]) if key.startswith("archive:") else int(key[5:7])
+
+
+def _shards(units, size):
+    return [units[i:i + size] for i in range(0, len(units), size)]
+
+
+# ----------------------
+# Scan (cached)
+# ----------------------
+
+def scan(base_dir, year, months=None, workers=None, today=None, shard_size=None):
+    """
+    Anomalies of every employee for a year (or some of its months).
+    Returns {"year", "months", "units", "scanned", "cached", "counts", "anomalies"}.
+    """
+    year = int(year)
+    months = sorted({int(m) for m in (months or range(1, 13))})
+    today = today or date.today()
+    workers = workers or WORKERS
+    shard_size = shard_size or SHARD_SIZE
+    base_dir = os.path.abspath(base_dir)
+
+    units = list_units(base_dir, year, months, today)
+    path = cache_path(base_dir, year)
+    cache = file_store.read_json(path, {}) or {}
+    if cache.get("version") != CACHE_VERSION:
+        cache = {"version": CACHE_VERSION, "units": {}}
+    cached = cache["units"]
+
+    todo = [u for u in units if (cached.get(u[0]) or {}).get("generation") != u[5]]
+    shards = _shards(todo, shard_size)
+    fresh = []
+    if len(shards) > 1 and workers > 1:
+        # spawn: workers import only this module, never the Flask app
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=context) as pool:
+            futures = [pool.submit(scan_shard, base_dir, year, shard, today.isoformat()) for shard in shards]
+            for future in futures:
+                fresh.extend(future.result())
+    else:
+        for shard in shards:
+            fresh.extend(scan_shard(base_dir, year, shard, today.isoformat()))
+
+    keys = {u[0] for u in units}
+    if fresh or any(_unit_month(k) in months and k not in keys for k in cached):
+        def update(current):
+            current = current if (current or {}).get("version") == CACHE_VERSION else {"version": CACHE_VERSION, "units": {}}
+            stored = current["units"]
+            for key in list(stored):
+                if _unit_month(key) in months and key not in keys:
+                    del stored[key]      # file / archive month gone
+            stored.update(dict(fresh))
+            return current
+        cache = file_store.update_json(path, update, default={}, indent=None)
+        cached = cache["units"]
+
+    anomalies, counts = [], {}
+    for key in keys:
+        result = cached.get(key)
+        if not result:
+            continue
+        for item in result["anomalies"]:
+            anomalies.append({"employee_id": result["employee_id"], "employee_name": result["employee_name"],
+                              "source": result["source"], **item})
+            counts[item["kind"]] = counts.get(item["kind"], 0) + 1
+    anomalies.sort(key=lambda a: (a["date"], a["employee_name"], a["kind"]))
+
+    return {
+        "year": year,
+        "months": months,
+        "units": len(units),
+        "scanned": len(fresh),
+        "cached": len(units) - len(fresh),
+        "counts": counts,
+        "anomalies": anomalies,
+    }
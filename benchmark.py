@@ -0,0 +1,396 @@
+"""
+Synthetic payroll dataset + benchmark for the hot routes.
+
+    python benchmark.py --employees 1000 --requests 50
+    python benchmark.py --employees 10000 --generate-only --workdir /tmp/payroll_10k
+
+The app is copied into a throw-away work directory (hours_data/,
+clock_hours_data/ and the SQLite DB live next to main.py), so real data is
+never touched. Reports p50/p95 latency, bytes written and peak RSS per route
+(Linux: VmHWM, reset through /proc/self/clear_refs before each route) and the
+peak RSS of the whole process.
+"""
+import os, sys, json, time, random, shutil, argparse, tempfile, calendar, statistics
+from datetime import date
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Data folders / files that are never copied into the work directory
+SKIP_ON_COPY = {".git", "hours_data", "clock_hours_data", "instance", "flask_session", "__pycache__"}
+
+HEBREW_DAYS = ["שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת", "ראשון"]
+FIRST_NAMES = ["דנה", "יוסי", "מיכל", "אבי", "נועה", "רון", "שירה", "עומר", "טל", "אלון"]
+LAST_NAMES = ["כהן", "לוי", "מזרחי", "פרץ", "ביטון", "דהן", "אברהם", "פרידמן", "שפירא", "גולן"]
+
+TAX_FIELDS = [
+    "gross_taxable", "income_tax", "national_insurance_deductions", "health_insurance_deductions",
+    "study_fund_deductions", "employee_pension_fund", "self_employed_pension_fund", "pension_fund",
+    "compensation", "disability", "study_fund", "miscellaneous", "national_insurance", "salary_tax",
+    "total_employer_contributions", "total_salary_cost", "sick_days_salary", "vacation_days_salary",
+    "amount_tax_credit_points_monthly", "final_city_tax_benefit", "basic_salary", "net_payment",
+]
+
+ROUTES = ["/save_hours", "index", "/get_hours_data", "/form_102", "/form_106", "/api/clockin"]
+
+
+# ----------------------
+# Work Directory
+# ----------------------
+
+def prepare_workdir(workdir):
+    os.makedirs(workdir, exist_ok=True)
+    for name in os.listdir(APP_DIR):
+        if name in SKIP_ON_COPY or name.endswith((".db", ".sqlite")):
+            continue
+        src = os.path.join(APP_DIR, name)
+        dst = os.path.join(workdir, name)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, dirs_exist_ok=True, ignore=shutil.ignore_patterns("__pycache__"))
+        else:
+            shutil.copy2(src, dst)
+
+
+def load_app(workdir):
+    """Import main.py from the work directory with a private SQLite DB."""
+    os.environ["DB_CHOICE"] = "sqlite"
+    os.environ["SQLITE_URI"] = "sqlite:///" + os.path.join(workdir, "benchmark.db")
+    os.environ.setdefault("OWNER_USERNAME", "benchmark")
+    os.environ.setdefault("OWNER_PASSWORD", "benchmark")
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+    import main
+    return main
+
+
+# ----------------------
+# Synthetic Data
+# ----------------------
+
+def money(value):
+    return f"{value:,.2f}"
+
+
+def work_days(year, month):
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        d = date(year, month, day)
+        if d.weekday() != 5:        # no Saturdays
+            yield d
+
+
+def hours_table(rng, year, month, date_of_birth):
+    from hours_export import DAILY_FIELDS, MONTHLY_FIELDS, PAID_FIELDS
+
+    entries = []
+    for d in work_days(year, month):
+        start = rng.choice(["07:00", "07:30", "08:00", "08:30", "09:00"])
+        length = rng.choice([8, 8.5, 9, 9.5, 10, 12])
+        end_minutes = int(start[:2]) * 60 + int(start[3:]) + int(length * 60)
+        entry = {
+            "day": HEBREW_DAYS[d.weekday()],
+            "date": d.strftime("%d-%m-%Y"),
+            "saturday": "",
+            "holiday": "",
+        }
+        entry.update({field: "" for field in DAILY_FIELDS})
+        entry.update({
+            "start_time": start,
+            "end_time": f"{end_minutes // 60 % 24:02d}:{end_minutes % 60:02d}",
+            "hours_calculated": f"{length:.2f}",
+            "hours_calculated_regular_day": f"{min(length, 8.6):.2f}",
+            "extra_hours125_regular_day": f"{min(max(length - 8.6, 0), 2):.2f}",
+            "extra_hours150_regular_day": f"{max(length - 10.6, 0):.2f}",
+            "final_totals_hours": f"{length:.2f}",
+            "work_day": "1",
+        })
+        entries.append(entry)
+
+    total_hours = sum(float(e["hours_calculated"]) for e in entries)
+    monthly = {field: "0.00" for field in MONTHLY_FIELDS}
+    monthly.update({"hours_calculated_monthly": f"{total_hours:.2f}", "work_day_monthly": str(len(entries))})
+    paid = {field: "0.00" for field in PAID_FIELDS}
+    paid.update({"hours_calculated_paid": f"{total_hours:.2f}"})
+
+    gross = total_hours * rng.uniform(35, 120)
+    tax = {field: money(gross * rng.uniform(0.0, 0.08)) for field in TAX_FIELDS}
+    tax.update({
+        "gross_taxable": money(gross),
+        "basic_salary": money(gross),
+        "income_tax": money(gross * rng.uniform(0.0, 0.2)),
+        "sick_days_salary": str(rng.choice([0, 0, 0, 1, 2])),
+        "vacation_days_salary": str(rng.choice([0, 0, 1])),
+        "date_of_birth": date_of_birth,
+    })
+    return {"work_day_entries": entries, "monthly_totals": monthly, "paid_totals": paid, "tax": tax}
+
+
+def generate(main, employees, year, months, seed=1):
+    """EmployeeData rows, a legacy hours_data_{year}.json and clock_hours_data/ month files."""
+    from database import db, EmployeeData
+
+    rng = random.Random(seed)
+    stats = {"employees": employees, "months": months, "started": time.perf_counter()}
+
+    with main.app.app_context():
+        first_id = (db.session.query(db.func.max(EmployeeData.id)).scalar() or 0) + 1
+        rows = []
+        for i in range(employees):
+            birth = date(rng.randint(1950, 2009), rng.randint(1, 12), rng.randint(1, 28))
+            rows.append({
+                "employee_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {first_id + i}",
+                "id_number": f"9{first_id + i:08d}",
+                "role": "employee",
+                "date_of_birth": birth.isoformat(),
+                "hourly_rate": str(rng.randint(35, 120)),
+            })
+        db.session.execute(EmployeeData.__table__.insert(), rows)
+        db.session.commit()
+        people = [
+            (e.id, e.employee_name, e.id_number, e.date_of_birth)
+            for e in EmployeeData.query.filter(EmployeeData.id >= first_id).order_by(EmployeeData.id)
+        ]
+
+        # Legacy single-file year (the store shards it on first access)
+        year_dir = os.path.join(main.get_base_dir(), f"hours_data_{year}")
+        os.makedirs(year_dir, exist_ok=True)
+        all_hours = {}
+        for emp_id, name, _, dob in people:
+            emp = all_hours.setdefault(str(emp_id), {"employee_name": name})
+            for month in range(1, months + 1):
+                emp[f"{year}-{month:02d}"] = {"hours_table": hours_table(rng, year, month, dob)}
+        with open(os.path.join(year_dir, f"hours_data_{year}.json"), "w", encoding="utf-8") as f:
+            json.dump(all_hours, f, ensure_ascii=False, indent=2)
+
+        # Clock files
+        for emp_id, name, id_number, _ in people:
+            for month in range(1, months + 1):
+                entries = []
+                for d in work_days(year, month):
+                    start = rng.choice(["07:00", "08:00", "09:00"])
+                    total = rng.choice([8, 8.5, 9])
+                    end_minutes = int(start[:2]) * 60 + int(total * 60)
+                    entries.append({
+                        "date": d.isoformat(), "day": HEBREW_DAYS[d.weekday()], "saturday": "", "holiday": "",
+                        "start_time": start, "end_time": f"{end_minutes // 60:02d}:{end_minutes % 60:02d}",
+                        "task": "", "totalHours": str(total),
+                    })
+                safe_name = name.replace(" ", "_")
+                main.save_clock_hours_file(safe_name, year, f"{month:02d}", {
+                    "employee_id": str(emp_id), "employee_name": name, "id_number": id_number,
+                    "hours_table_clock": {"work_day_entries": entries},
+                })
+
+    stats["seconds"] = round(time.perf_counter() - stats.pop("started"), 2)
+    stats["employee_ids"] = [p[0] for p in people]
+    stats["names"] = {p[0]: p[1] for p in people}
+    stats["dates_of_birth"] = {p[0]: p[3] for p in people}
+    return stats
+
+
+# ----------------------
+# Measurements
+# ----------------------
+
+def process_peak_rss_mb():
+    # ru_maxrss never goes down: the peak of the whole run, not of one route
+    try:
+        import resource
+    except ImportError:     # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def reset_route_peak_rss():
+    """Reset VmHWM to the current RSS (Linux); False when it cannot be reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def route_peak_rss_mb():
+    # VmHWM since the last reset_route_peak_rss()
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def io_write_bytes():
+    # Linux only; falls back to the size of the data folders
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def folder_bytes(*paths):
+    total = 0
+    for path in paths:
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+    return total
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+# ----------------------
+# Route Drivers
+# ----------------------
+
+def make_client(main, employee_id, year, month):
+    client = main.app.test_client()
+    with client.session_transaction() as s:
+        s["owner_access"] = True
+        s["role"] = "owner"
+        s["employee_id"] = str(employee_id)
+        s["selected_year"] = str(year)
+        s["selected_month"] = f"{month:02d}"
+        s["form_data"] = {}
+    return client
+
+
+def call_route(main, route, rng, data, year, months):
+    emp_id = rng.choice(data["employee_ids"])
+    month = rng.randint(1, months)
+    client = make_client(main, emp_id, year, month)
+
+    if route == "/save_hours":
+        payload = {
+            "employee_id": emp_id, "employee_name": data["names"][emp_id],
+            "month": f"{month:02d}", "year": str(year),
+            "hours_table": hours_table(rng, year, month, data["dates_of_birth"].get(emp_id, "")),
+        }
+        return client.post("/save_hours", json=payload)
+    if route == "index":
+        return client.get(f"/?employee_id={emp_id}&month={month:02d}&year={year}")
+    if route == "/get_hours_data":
+        return client.get("/get_hours_data")
+    if route == "/form_102":
+        return client.get(f"/form_102?employee_id={emp_id}&month={month}&year={year}")
+    if route == "/form_106":
+        return client.get(f"/form_106?employee_id={emp_id}")
+    if route == "/api/clockin":
+        return client.post("/api/clockin")
+    raise ValueError(route)
+
+
+def run(main, data, year, months, requests_per_route, routes=ROUTES, seed=2):
+    rng = random.Random(seed)
+    data_dirs = [main.get_base_dir(), main.BASE_DIR]
+    results = []
+
+    for route in routes:
+        timings, errors = [], 0
+        io_before, disk_before = io_write_bytes(), folder_bytes(*data_dirs)
+        rss_reset = reset_route_peak_rss()
+
+        for _ in range(requests_per_route):
+            started = time.perf_counter()
+            response = call_route(main, route, rng, data, year, months)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+        # background CSV/XLSX exports belong to the route that queued them
+        main.export_queue.wait_idle(timeout=600)
+        io_after, disk_after = io_write_bytes(), folder_bytes(*data_dirs)
+
+        results.append({
+            "route": route,
+            "requests": requests_per_route,
+            "errors": errors,
+            "p50_ms": round(percentile(timings, 50), 2),
+            "p95_ms": round(percentile(timings, 95), 2),
+            "max_ms": round(max(timings), 2) if timings else 0.0,
+            "mean_ms": round(statistics.fmean(timings), 2) if timings else 0.0,
+            "bytes_written": (io_after - io_before) if io_before is not None else None,
+            "disk_growth_bytes": disk_after - disk_before,
+            "peak_rss_mb": route_peak_rss_mb() if rss_reset else None,
+        })
+    return results
+
+
+def print_report(generated, results, process_peak=None):
+    print(f"\n📊 {generated['employees']} employees x {generated['months']} months "
+          f"(generated in {generated['seconds']}s)")
+    header = f"{'route':<16}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'written':>14}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        written = r["bytes_written"] if r["bytes_written"] is not None else r["disk_growth_bytes"]
+        peak = f"{r['peak_rss_mb']:>9.1f}" if r["peak_rss_mb"] is not None else f"{'-':>9}"
+        print(f"{r['route']:<16}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+              f"{r['max_ms']:>10.2f}{written:>14,}{peak}")
+    if process_peak is not None:
+        print(f"process peak RSS (whole run): {process_peak:.1f} MB")
+
+
+# ----------------------
+# CLI
+# ----------------------
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=100, help="10 / 100 / 1000 / 10000 ...")
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--year", type=int, default=date.today().year)
+    parser.add_argument("--requests", type=int, default=30, help="requests per route")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma separated subset of " + ",".join(ROUTES))
+    parser.add_argument("--workdir", default=None, help="kept after the run when given")
+    parser.add_argument("--generate-only", action="store_true")
+    parser.add_argument("--json", dest="json_out", default=None, help="also write the results to this file")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    json_out = os.path.abspath(args.json_out) if args.json_out else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="payroll_bench_")
+    prepare_workdir(workdir)
+    main = load_app(workdir)
+
+    generated = generate(main, args.employees, args.year, args.months, seed=args.seed)
+    print(f"✅ Dataset written to {workdir}")
+    if args.generate_only:
+        return 0
+
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    results = run(main, generated, args.year, args.months, args.requests, routes, seed=args.seed + 1)
+    process_peak = process_peak_rss_mb()
+    print_report(generated, results, process_peak)
+
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as f:
+            json.dump({
+                "employees": args.employees, "months": args.months, "year": args.year,
+                "generate_seconds": generated["seconds"], "process_peak_rss_mb": process_peak,
+                "results": results,
+            }, f, indent=2)
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,343 @@
+import os, re, mmap, struct, threading
+import numpy as np
+
+import file_store
+
+# ----------------------
+# Yearly Clock Archive (closed months, one file per year)
+# ----------------------
+#
+# clock_hours_data/{year}/clock_archive_{year}.bin replaces the
+# 12 x employees month files of closed months with one columnar file:
+#
+#   header   magic, version, year, counts and section offsets
+#   columns  one array per field, rows ordered by (employee, month, day):
+#              dom u1       day of month
+#              start i4     minutes after midnight, -1 empty, <= -2 -> string (-v - 2)
+#              end i4       same as start
+#              day / saturday / holiday / task / total  u4 -> string table
+#              shifts u4    "HH:MM-HH:MM,..." of multi-shift days, "" otherwise (version 2)
+#   index    per employee (sorted by id): id, name, id_number, file name,
+#            and (first row, row count) of each of the 12 months
+#   strings  interned UTF-8 strings: offsets u4[n + 1] + blob
+#
+# Readers mmap the file and slice the columns with numpy, so reading one
+# employee-month touches only its rows and the strings it uses.
+
+MAGIC = b"CLKA"
+VERSION = 2
+HEADER = struct.Struct("<4sHHIIIIIII")   # magic, version, year, rows, employees, strings, columns, index, strings offset, size
+HEADER_SIZE = 64
+
+COLUMNS = [
+    ("dom", np.uint8),
+    ("start", np.int32),
+    ("end", np.int32),
+    ("day", np.uint32),
+    ("saturday", np.uint32),
+    ("holiday", np.uint32),
+    ("task", np.uint32),
+    ("total", np.uint32),
+    ("shifts", np.uint32),
+]
+
+
+def _columns(version):
+    return COLUMNS if version >= 2 else COLUMNS[:-1]
+
+INDEX_DTYPE = np.dtype([
+    ("employee_id", "<u4"),
+    ("name", "<u4"),
+    ("id_number", "<u4"),
+    ("file_name", "<u4"),
+    ("month_start", "<u4", (12,)),
+    ("month_count", "<u4", (12,)),
+])
+
+_HM_RE = re.compile(r"^(\d{2}):(\d{2})$")
+_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+
+
+def archive_path(base_dir, year):
+    return os.path.join(base_dir, str(year), f"clock_archive_{year}.bin")
+
+
+def _align(n, to=8):
+    return (n + to - 1) // to * to
+
+
+# ----------------------
+# Writer
+# ----------------------
+
+class _Strings:
+    def __init__(self):
+        self.ids = {"": 0}
+        self.values = [""]
+
+    def add(self, value):
+        value = "" if value is None else str(value)
+        idx = self.ids.get(value)
+        if idx is None:
+            idx = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+
+def _encode_time(value, strings):
+    value = "" if value is None else str(value).strip()
+    if not value:
+        return -1
+    m = _HM_RE.match(value)
+    if m and int(m.group(1)) < 24 and int(m.group(2)) < 60:
+        return int(m.group(1)) * 60 + int(m.group(2))
+    return -2 - strings.add(value)     # anything that would not round-trip as HH:MM
+
+
+def _decode_time(value, string):
+    if value == -1:
+        return ""
+    if value >= 0:
+        return f"{value // 60:02d}:{value % 60:02d}"
+    return string(-value - 2)
+
+
+def _shifts_text(shifts):
+    if not isinstance(shifts, list) or len(shifts) < 2:
+        return ""
+    return ",".join(f"{p[0] or ''}-{p[1] or ''}" for p in shifts if isinstance(p, (list, tuple)) and len(p) == 2)
+
+
+def pack_year(path, year, months):
+    """
+    Write the archive of one year. months yields
+    (employee_id, employee_name, id_number, file_name, month, entries)
+    with entries in clock_hours_data work_day_entries form.
+    """
+    strings = _Strings()
+    by_employee = {}
+    for employee_id, name, id_number, file_name, month, entries in months:
+        emp = by_employee.setdefault(int(employee_id), {"meta": (name, id_number, file_name), "months": {}})
+        emp["months"][int(month)] = entries
+
+    columns = {name: [] for name, _ in COLUMNS}
+    index = np.zeros(len(by_employee), dtype=INDEX_DTYPE)
+    row = 0
+
+    for i, employee_id in enumerate(sorted(by_employee)):
+        emp = by_employee[employee_id]
+        name, id_number, file_name = emp["meta"]
+        index[i]["employee_id"] = employee_id
+        index[i]["name"] = strings.add(name)
+        index[i]["id_number"] = strings.add(id_number)
+        index[i]["file_name"] = strings.add(file_name)
+
+        for month in range(1, 13):
+            prefix = f"{int(year):04d}-{month:02d}-"
+            entries = sorted(
+                (e for e in emp["months"].get(month, [])
+                 if _DATE_RE.match(str(e.get("date", ""))) and e["date"].startswith(prefix)),
+                key=lambda e: e["date"]
+            )
+            index[i]["month_start"][month - 1] = row
+            index[i]["month_count"][month - 1] = len(entries)
+            for e in entries:
+                columns["dom"].append(int(e["date"][8:10]))
+                columns["start"].append(_encode_time(e.get("start_time"), strings))
+                columns["end"].append(_encode_time(e.get("end_time"), strings))
+                columns["day"].append(strings.add(e.get("day")))
+                columns["saturday"].append(strings.add(e.get("saturday")))
+                columns["holiday"].append(strings.add(e.get("holiday")))
+                columns["task"].append(strings.add(e.get("task")))
+                columns["total"].append(strings.add(e.get("totalHours")))
+                columns["shifts"].append(strings.add(_shifts_text(e.get("shifts"))))
+                row += 1
+
+    encoded = [s.encode("utf-8") for s in strings.values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    offsets[1:] = np.cumsum([len(b) for b in encoded]) if encoded else []
+
+    parts, pos = [], HEADER_SIZE
+    columns_offset = pos
+    for name, dtype in COLUMNS:
+        data = np.asarray(columns[name], dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+        parts.append(data + b"\0" * (_align(len(data)) - len(data)))
+        pos += _align(len(data))
+    index_offset = pos
+    parts.append(index.tobytes())
+    pos += len(parts[-1])
+    strings_offset = pos
+    parts.append(offsets.tobytes() + b"".join(encoded))
+    pos += len(parts[-1])
+
+    header = HEADER.pack(MAGIC, VERSION, int(year), row, len(index), len(encoded),
+                         columns_offset, index_offset, strings_offset, pos)
+    blob = header + b"\0" * (HEADER_SIZE - len(header)) + b"".join(parts)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = file_store.temp_path(path)
+    with open(tmp_path, "wb") as f:
+        f.write(blob)
+    file_store.commit_temp(tmp_path, path)
+    _archives.pop(os.path.abspath(path), None)
+    return {"rows": row, "employees": len(index), "strings": len(encoded), "bytes": pos}
+
+
+# ----------------------
+# Reader (mmap)
+# ----------------------
+
+class ClockArchive:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stat = _stat(path)
+
+        (magic, version, self.year, self.rows, n_employees, n_strings,
+         columns_offset, index_offset, strings_offset, size) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or not 1 <= version <= VERSION or size != len(self._mm):
+            raise ValueError(f"not a clock archive: {path}")
+
+        self.columns = {}
+        pos = columns_offset
+        for name, dtype in _columns(version):
+            dtype = np.dtype(dtype).newbyteorder("<")
+            self.columns[name] = np.frombuffer(self._mm, dtype=dtype, count=self.rows, offset=pos)
+            pos += _align(self.rows * dtype.itemsize)
+
+        self.index = np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=n_employees, offset=index_offset)
+        self._offsets = np.frombuffer(self._mm, dtype="<u4", count=n_strings + 1, offset=strings_offset)
+        self._blob_offset = strings_offset + (n_strings + 1) * 4
+        self._strings = {}
+        self._by_file_name = None
+
+    def string(self, idx):
+        idx = int(idx)
+        value = self._strings.get(idx)
+        if value is None:
+            start = self._blob_offset + int(self._offsets[idx])
+            end = self._blob_offset + int(self._offsets[idx + 1])
+            value = self._strings[idx] = self._mm[start:end].decode("utf-8")
+        return value
+
+    def _position(self, employee_id):
+        ids = self.index["employee_id"]
+        pos = int(np.searchsorted(ids, int(employee_id)))
+        return pos if pos < len(ids) and ids[pos] == int(employee_id) else None
+
+    def employee_ids(self):
+        return [int(i) for i in self.index["employee_id"]]
+
+    def employee(self, employee_id):
+        pos = self._position(employee_id)
+        if pos is None:
+            return None
+        entry = self.index[pos]
+        return {
+            "employee_id": str(int(entry["employee_id"])),
+            "employee_name": self.string(entry["name"]),
+            "id_number": self.string(entry["id_number"]),
+            "file_name": self.string(entry["file_name"]),
+        }
+
+    def find_by_file_name(self, file_name):
+        if self._by_file_name is None:
+            self._by_file_name = {self.string(e["file_name"]): int(e["employee_id"]) for e in self.index}
+        return self._by_file_name.get(file_name)
+
+    def has_month(self, employee_id, month):
+        pos = self._position(employee_id)
+        return pos is not None and int(self.index[pos]["month_count"][int(month) - 1]) > 0
+
+    def month_entries(self, employee_id, month):
+        pos = self._position(employee_id)
+        if pos is None:
+            return []
+        month = int(month)
+        start = int(self.index[pos]["month_start"][month - 1])
+        count = int(self.index[pos]["month_count"][month - 1])
+        c = {name: col[start:start + count] for name, col in self.columns.items()}
+
+        entries = []
+        for i in range(count):
+            entries.append({
+                "date": f"{self.year:04d}-{month:02d}-{int(c['dom'][i]):02d}",
+                "day": self.string(c["day"][i]),
+                "saturday": self.string(c["saturday"][i]),
+                "holiday": self.string(c["holiday"][i]),
+                "start_time": _decode_time(int(c["start"][i]), self.string),
+                "end_time": _decode_time(int(c["end"][i]), self.string),
+                "task": self.string(c["task"][i]),
+                "totalHours": self.string(c["total"][i]),
+            })
+            shifts = self.string(c["shifts"][i]) if "shifts" in c else ""
+            if shifts:
+                entries[-1]["shifts"] = [part.split("-", 1) for part in shifts.split(",")]
+        return entries
+
+    def month_document(self, employee_id, month):
+        """Same shape as a clock_hours_data month file."""
+        meta = self.employee(employee_id) or {}
+        return {
+            "employee_id": meta.get("employee_id", str(employee_id)),
+            "employee_name": meta.get("employee_name", ""),
+            "id_number": meta.get("id_number", ""),
+            "hours_table_clock": {"work_day_entries": self.month_entries(employee_id, month)},
+        }
+
+    def close(self):
+        self.columns, self.index, self._offsets = {}, None, None
+        self._mm.close()
+        self._file.close()
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(base_dir, year):
+    """Open (and keep mapped) the archive of a year; None when the year has none."""
+    path = os.path.abspath(archive_path(base_dir, year))
+    stat = _stat(path)
+    with _archives_lock:
+        archive = _archives.get(path)
+        if archive is not None and archive.stat == stat:
+            return archive
+        # replaced by a newer pack: drop our reference, the old map goes with it
+        _archives.pop(path, None)
+        if stat is None:
+            return None
+        archive = _archives[path] = ClockArchive(path)
+        return archive
+
+
+def archived_months(archive, skip=()):
+    """Everything in an archive as pack_year() input, minus (employee_id, month) pairs in skip."""
+    for employee_id in archive.employee_ids():
+        meta = archive.employee(employee_id)
+        for month in range(1, 13):
+            if (employee_id, month) in skip or not archive.has_month(employee_id, month):
+                continue
+            yield (employee_id, meta["employee_name"], meta["id_number"], meta["file_name"],
+                   month, archive.month_entries(employee_id, month))
+
+
+def drop_month(base_dir, year, employee_id, month):
+    """Remove one employee-month from the year's archive (the month was deleted)."""
+    # read under the lock: a close-clock-year repack in between must not be overwritten
+    with file_store.lock(archive_path(base_dir, year)):
+        archive = open_archive(base_dir, year)
+        if archive is None or not archive.has_month(employee_id, month):
+            return False
+        months = list(archived_months(archive, skip={(int(employee_id), int(month))}))
+        pack_year(archive_path(base_dir, year), year, months)
+    return True
@@ -0,0 +1,489 @@
+import os, json, calendar
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+import time_engine
+from database import db, Timesheet, ClockEvent
+from employee_identity import identity_cache
+
+# ----------------------
+# Clock Punch Store (Timesheet rows)
+# ----------------------
+#
+# One Timesheet row per employee per day, unique on (employee_id, date) with
+# date as YYYY-MM-DD. A clock-in/out touches only that row; the month files in
+# clock_hours_data/ are rebuilt from the rows in the background and are no
+# longer read once a month has rows. Legacy month files are imported the first
+# time their month is read or written.
+
+ENTRY_FIELDS = ["date", "day", "saturday", "holiday", "start_time", "end_time", "task", "totalHours"]
+
+# JSON entry key -> Timesheet column
+ENTRY_COLUMNS = {
+    "day": "day",
+    "saturday": "saturday",
+    "holiday": "holiday",
+    "start_time": "startTime",
+    "end_time": "endTime",
+    "task": "task",
+}
+
+
+HEBREW_DAYS = ["שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת", "ראשון"]   # weekday() order, Mon..Sun
+
+
+def day_defaults(dt):
+    """day / saturday marks of a new row."""
+    weekday = dt.weekday()
+    return {"day": HEBREW_DAYS[weekday], "saturday": "שבת" if weekday == 5 else ""}
+
+
+def month_bounds(year, month):
+    year, month = int(year), int(month)
+    last_day = calendar.monthrange(year, month)[1]
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{last_day:02d}"
+
+
+def _hours_value(text):
+    try:
+        return float(str(text).strip())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def to_entry(row):
+    """Timesheet row -> clock_hours_data work_day_entries item ("shifts" only on multi-shift days)."""
+    entry = {
+        "date": row.date,
+        "day": row.day or "",
+        "saturday": row.saturday or "",
+        "holiday": row.holiday or "",
+        "start_time": row.startTime or "",
+        "end_time": row.endTime or "",
+        "task": row.task or "",
+        "totalHours": row.totalHoursDisplay or "",
+    }
+    if row.shifts and len(row.shifts) > 1:
+        entry["shifts"] = [
+            [time_engine.stamp_hm(s) if s is not None else "", time_engine.stamp_hm(e) if e is not None else ""]
+            for s, e in row.shifts
+        ]
+    return entry
+
+
+def _month_query(employee_id, year, month):
+    first, last = month_bounds(year, month)
+    return Timesheet.query.filter(
+        Timesheet.employee_id == int(employee_id),
+        Timesheet.date >= first,
+        Timesheet.date <= last,
+    )
+
+
+def month_has_rows(employee_id, year, month):
+    return db.session.query(_month_query(employee_id, year, month).exists()).scalar()
+
+
+def month_entries(employee_id, year, month):
+    rows = _month_query(employee_id, year, month).order_by(Timesheet.date).all()
+    return [to_entry(row) for row in rows]
+
+
+def months_entries(year, month, employee_ids=None):
+    """{employee_id: entries} of one month for every employee (or the given ones), one query."""
+    first, last = month_bounds(year, month)
+    query = Timesheet.query.filter(Timesheet.date >= first, Timesheet.date <= last)
+    if employee_ids is not None:
+        query = query.filter(Timesheet.employee_id.in_([int(e) for e in employee_ids]))
+    result = {}
+    for row in query.order_by(Timesheet.employee_id, Timesheet.date):
+        result.setdefault(row.employee_id, []).append(to_entry(row))
+    return result
+
+
+def get_day(employee_id, date_str):
+    return Timesheet.query.filter_by(employee_id=int(employee_id), date=date_str).first()
+
+
+# ----------------------
+# Writes (one row each)
+# ----------------------
+
+def _apply(row, fields):
+    for key, column in ENTRY_COLUMNS.items():
+        if key in fields:
+            setattr(row, column, fields[key] if fields[key] is not None else "")
+    if "totalHours" in fields:
+        text = "" if fields["totalHours"] is None else str(fields["totalHours"])
+        row.totalHoursDisplay = text
+        row.totalHours = _hours_value(text)
+    if "isClockedIn" in fields:
+        row.isClockedIn = fields["isClockedIn"]
+    row.submission_time = datetime.utcnow()
+
+
+def _new_row(employee, date_str):
+    return Timesheet(
+        employee_id=int(employee.id),
+        employee_name=employee.employee_name,
+        id_number=employee.id_number,
+        date=date_str,
+        isClockedIn="false",
+        startTime="",
+        endTime="",
+        task="",
+        totalHours=0.0,
+        totalHoursDisplay="",
+        day="",
+        saturday="",
+        holiday="",
+    )
+
+
+def upsert_day(employee, date_str, fields, defaults=None, row=None, prepare=None):
+    """
+    Insert or update the (employee, date) row with the given entry fields.
+    defaults are only used when the row is created; pass row when it was
+    already looked up. prepare(row) runs before fields (a punch on the shifts).
+    """
+    row = row if row is not None else get_day(employee.id, date_str)
+    if row is None:
+        row = _new_row(employee, date_str)
+        _apply(row, defaults or {})
+        db.session.add(row)
+    if prepare:
+        prepare(row)
+    _apply(row, fields)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # same day inserted concurrently -> update that row instead
+        db.session.rollback()
+        row = get_day(employee.id, date_str)
+        if prepare:
+            prepare(row)
+        _apply(row, fields)
+        db.session.commit()
+    return row
+
+
+def merge_entries(employee, entries):
+    """Upsert a list of month-table entries (the whole-month save)."""
+    dates = [e.get("date") for e in entries if e.get("date")]
+    existing = {
+        row.date: row for row in
+        Timesheet.query.filter(Timesheet.employee_id == int(employee.id), Timesheet.date.in_(dates))
+    } if dates else {}
+
+    for entry in entries:
+        date_str = entry.get("date")
+        if not date_str:
+            continue
+        row = existing.get(date_str)
+        if row is None:
+            row = _new_row(employee, date_str)
+            db.session.add(row)
+            existing[date_str] = row
+
+        if isinstance(entry.get("shifts"), list):
+            row.shifts = _entry_shifts(date_str, entry["shifts"])
+        elif (entry.get("start_time", ""), entry.get("end_time", "")) != (row.startTime, row.endTime):
+            # times edited in the month table -> the day is one shift again
+            row.shifts = None
+        _apply(row, {key: entry.get(key, "") for key in ENTRY_FIELDS if key != "date"})
+    db.session.commit()
+
+
+def clear_day(employee_id, date_str):
+    row = get_day(employee_id, date_str)
+    if row is None:
+        return False
+    row.shifts = None
+    _apply(row, {"start_time": "", "end_time": "", "task": "", "totalHours": "", "isClockedIn": "false"})
+    db.session.commit()
+    return True
+
+
+def delete_month(employee_id, year, month):
+    count = _month_query(employee_id, year, month).delete(synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+# ----------------------
+# Shifts (punches of one day)
+# ----------------------
+#
+# row.shifts holds the day's punches as minute stamps (time_engine), so a day
+# can have several shifts and a shift can end after midnight. startTime /
+# endTime show the first start and the last end, totalHours is the merged
+# length of the closed shifts. Rows written before shifts existed get theirs
+# from startTime / endTime the first time they are punched.
+
+def _entry_shifts(date_str, pairs):
+    text = ",".join(f"{p[0] or ''}-{p[1] or ''}" for p in pairs if isinstance(p, (list, tuple)) and len(p) == 2)
+    return time_engine.parse_shifts_text(date_str, text) or None
+
+
+def row_shifts(row):
+    if row.shifts is not None:
+        return [list(s) for s in row.shifts]
+    start, end = time_engine.day_shift(row.date, row.startTime, row.endTime)
+    if (row.isClockedIn or "").lower() == "true":
+        end = None
+    if start is None and end is None:
+        return []
+    return [[start, end]]
+
+
+def _store_shifts(row, shifts):
+    """Write shifts and the columns derived from them."""
+    row.shifts = shifts
+    starts = [s for s, _ in shifts if s is not None]
+    ends = [e for _, e in shifts if e is not None]
+    closed = time_engine.merge_intervals(shifts)
+
+    fields = {
+        "start_time": time_engine.stamp_hm(min(starts)) if starts else "",
+        "end_time": time_engine.stamp_hm(max(ends)) if ends else "",
+        "isClockedIn": "true" if time_engine.is_open(shifts) else "false",
+        "totalHours": str(time_engine.hours(time_engine.total_minutes(closed))) if closed else "",
+    }
+    _apply(row, fields)
+
+
+def set_times(row, start_hm, end_hm):
+    """Manual edit: the day becomes a single shift start_hm..end_hm."""
+    _store_shifts(row, [time_engine.day_shift(row.date, start_hm, end_hm)])
+
+
+def punch_in(row, when):
+    shifts = row_shifts(row)
+    at = time_engine.stamp_of(when)
+    if time_engine.is_open(shifts):
+        shifts[-1][0] = at          # clocked in twice -> the later punch starts the shift
+    else:
+        shifts.append([at, None])
+    _store_shifts(row, shifts)
+    return row
+
+
+def open_row(row, previous):
+    """The row holding the open shift: the day's own, else a night shift from the previous day."""
+    for candidate in (row, previous):
+        if candidate is not None and time_engine.is_open(row_shifts(candidate)):
+            return candidate
+    return None
+
+
+def punch_out(row, when):
+    at = time_engine.stamp_of(when)
+    shifts = row_shifts(row)
+    if time_engine.is_open(shifts):
+        start = shifts[-1][0]
+        # an end before the start on the same day is the next morning
+        shifts[-1][1] = at + time_engine.MINUTES_PER_DAY if at < start else at
+    elif shifts:
+        shifts[-1][1] = at          # clocked out again -> correct the last end
+    else:
+        shifts.append([None, at])   # end without a start: no hours
+    _store_shifts(row, shifts)
+    return row
+
+
+def previous_day(date_str):
+    return time_engine.day_string(time_engine.day_number(date_str) - 1)
+
+
+# ----------------------
+# Legacy Month Files
+# ----------------------
+
+def import_month_file(employee, year, month, path):
+    """Load a clock_hours_data month file into rows, once (only while the month has no rows)."""
+    if month_has_rows(employee.id, year, month) or not os.path.exists(path):
+        return 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return 0
+
+    entries = (data.get("hours_table_clock") or {}).get("work_day_entries") or []
+    return import_month_entries(employee, year, month, entries)
+
+
+def import_month_entries(employee, year, month, entries):
+    """Load legacy work_day_entries of one month into rows (caller checked the month has none)."""
+    first, last = month_bounds(year, month)
+    entries = [e for e in entries if first <= str(e.get("date", "")) <= last]
+    if entries:
+        merge_entries(employee, entries)
+    return len(entries)
+
+
+def month_document(employee_id, employee_name, id_number, year, month):
+    """The clock_hours_data JSON document of one month, built from the rows."""
+    return {
+        "employee_id": str(employee_id),
+        "employee_name": employee_name,
+        "id_number": id_number or "",
+        "hours_table_clock": {"work_day_entries": month_entries(employee_id, year, month)},
+    }
+
+
+# ----------------------
+# Terminal Punch Batches
+# ----------------------
+#
+# Terminals flush buffered START/END punches with a client idempotency key
+# each. Events are grouped by (employee, month); a group is one month query,
+# in-memory updates in punch-time order and one commit that also stores the
+# keys, so replaying a batch (or part of it) answers from the stored results.
+
+KEY_CHUNK = 500
+
+
+def _parse_event(raw):
+    """Validated event dict, or (None, error message)."""
+    if not isinstance(raw, dict):
+        return None, "Invalid event"
+    key = str(raw.get("idempotency_key") or raw.get("key") or "").strip()
+    if not key or len(key) > 128:
+        return None, "Missing idempotency_key"
+    employee_id = str(raw.get("employee_id") or "").strip()
+    if not employee_id.isdigit():
+        return {"key": key}, "Missing employee_id"
+    action_type = str(raw.get("type") or "").upper()
+    if action_type not in ("START", "END"):
+        return {"key": key}, "Invalid type"
+    try:
+        when = datetime.fromisoformat(str(raw.get("timestamp") or "").replace("Z", ""))
+    except ValueError:
+        return {"key": key}, "Invalid timestamp"
+
+    return {
+        "key": key,
+        "employee_id": int(employee_id),
+        "type": action_type,
+        "when": when.replace(second=0, microsecond=0, tzinfo=None),
+        "task": str(raw.get("task") or "").strip(),
+    }, None
+
+
+def _stored_results(keys):
+    found = {}
+    keys = list(keys)
+    for i in range(0, len(keys), KEY_CHUNK):
+        chunk = keys[i:i + KEY_CHUNK]
+        for event in ClockEvent.query.filter(ClockEvent.idempotency_key.in_(chunk)):
+            found[event.idempotency_key] = event.result or {}
+    return found
+
+
+def _apply_group(employee, year, month, events):
+    rows = {row.date: row for row in _month_query(employee.id, year, month)}
+    results = []
+
+    for event in sorted(events, key=lambda e: e["when"]):
+        date_str = event["when"].strftime("%Y-%m-%d")
+
+        row = rows.get(date_str)
+        if event["type"] == "END":
+            # last month's last day is not in this group -> one lookup
+            previous_date = previous_day(date_str)
+            previous = rows.get(previous_date) or get_day(employee.id, previous_date)
+            row = open_row(row, previous) or row
+
+        if row is None:
+            row = _new_row(employee, date_str)
+            _apply(row, day_defaults(event["when"]))
+            db.session.add(row)
+            rows[date_str] = row
+
+        if event["type"] == "START":
+            punch_in(row, event["when"])
+            _apply(row, {"task": event["task"]})
+        else:
+            punch_out(row, event["when"])
+            if event["task"]:
+                _apply(row, {"task": event["task"]})
+
+        result = {"key": event["key"], "status": "applied", "type": event["type"],
+                  "timestamp": event["when"].isoformat(timespec="minutes"), "entry": to_entry(row)}
+        db.session.add(ClockEvent(
+            idempotency_key=event["key"], employee_id=employee.id, event_type=event["type"],
+            event_time=result["timestamp"], result=result
+        ))
+        results.append(result)
+
+    db.session.commit()
+    return results
+
+
+def apply_punch_batch(raw_events, prepare=None):
+    """
+    Apply a terminal batch; returns (per-event results in request order,
+    {(employee, year, month): dates written} of the months that changed).
+    prepare(employee, year, month) runs before a group is applied (legacy
+    month import).
+    """
+    results = [None] * len(raw_events)
+    parsed = []
+    for i, raw in enumerate(raw_events):
+        event, error = _parse_event(raw)
+        if error:
+            results[i] = {"key": (event or {}).get("key"), "status": "error", "message": error}
+        else:
+            parsed.append((i, event))
+
+    stored = _stored_results(e["key"] for _, e in parsed)
+    employees = identity_cache.get_many(e["employee_id"] for _, e in parsed) if parsed else {}
+
+    groups, seen = {}, {}
+    for i, event in parsed:
+        if event["key"] in stored:
+            results[i] = {**stored[event["key"]], "status": "duplicate"}
+        elif event["key"] in seen:
+            seen[event["key"]].append(i)       # same key twice in one batch
+        elif event["employee_id"] not in employees:
+            results[i] = {"key": event["key"], "status": "error", "message": "Employee not found"}
+        else:
+            seen[event["key"]] = [i]
+            group = (event["employee_id"], event["when"].strftime("%Y"), event["when"].strftime("%m"))
+            groups.setdefault(group, []).append(event)
+
+    changed = {}
+    for (employee_id, year, month), events in groups.items():
+        employee = employees[employee_id]
+        if prepare:
+            prepare(employee, year, month)
+            first = min(events, key=lambda e: e["when"])
+            if first["type"] == "END" and first["when"].day == 1:
+                # it may close last month's last day -> that month is imported too
+                previous = previous_day(first["when"].strftime("%Y-%m-%d"))
+                prepare(employee, previous[:4], previous[5:7])
+        try:
+            group_results = _apply_group(employee, year, month, events)
+        except IntegrityError:
+            # a concurrent replay stored some of these keys first -> answer from it
+            db.session.rollback()
+            stored = _stored_results(e["key"] for e in events)
+            fresh = [e for e in events if e["key"] not in stored]
+            group_results = [{**stored[e["key"]], "status": "duplicate"} for e in events if e["key"] in stored]
+            group_results += _apply_group(employee, year, month, fresh) if fresh else []
+
+        for result in group_results:
+            first, *repeats = seen[result["key"]]
+            results[first] = result
+            for i in repeats:
+                results[i] = {**result, "status": "duplicate"}
+        for result in group_results:
+            if result["status"] == "applied":
+                # an overnight END may have closed the previous month's row
+                date = result["entry"]["date"]
+                changed.setdefault((employee, date[:4], date[5:7]), set()).add(date)
+
+    return results, changed
@@ -423,8 +423,37 @@ class Timesheet(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     submission_time = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Month-table columns of clock_hours_data JSON (day name, שבת / חג marks, hours as typed)
+    day = db.Column(db.String(20))
+    saturday = db.Column(db.String(20))
+    holiday = db.Column(db.String(50))
+    totalHoursDisplay = db.Column(db.String(16))
+
+    # Punches of the day as minute stamps [[start, end], ...] (end null while clocked in), see time_engine
+    shifts = db.Column(db.JSON)
+
     employee = db.relationship('EmployeeData', back_populates='timesheets')
 
+    __table_args__ = (
+        db.Index('ix_timesheets_employee_date', 'employee_id', 'date', unique=True),
+    )
+
+# -----------------------------
+#  Clock Terminal Punches (batch idempotency keys)
+# -----------------------------
+
+class ClockEvent(db.Model):
+    __tablename__ = "clock_events"
+
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(128), unique=True, nullable=False)
+
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee_data.id'), nullable=False)
+    event_type = db.Column(db.String(8), nullable=False)      # START / END
+    event_time = db.Column(db.String(32), nullable=False)     # terminal time, YYYY-MM-DDTHH:MM
+    result = db.Column(db.JSON)                               # what the batch answered for this key
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 # -----------------------------
 #  Employee Hours All Hours Calculate
 # -----------------------------
@@ -523,6 +552,11 @@ class HoursData(db.Model):
     # Explicit relationship back to EmployeeData
     employee = db.relationship('EmployeeData', back_populates='hours_data')
 
+    __table_args__ = (
+        db.Index('ix_hours_data_employee_month', 'employee_id', 'month_key'),
+        db.Index('ix_hours_data_month_key', 'month_key'),
+    )
+
     def to_dict(self):
         return {column.name: getattr(self, column.name) for column in self.__table__.columns}
 
@@ -544,6 +578,7 @@ class MonthlyRecord(db.Model):
     date = db.Column(db.String(10))                 
     month_result = db.Column(db.String(20))       
     save_date = db.Column(db.String(10))
+    month_key = db.Column(db.String(7))
     
     id_number = db.Column(db.String(100))  # Social security or identification number
     address = db.Column(db.String(100))
@@ -657,6 +692,7 @@ class MonthlyRecord(db.Model):
     income_tax_yearly = db.Column(db.Float, default=0.0)
     amount_tax_credit_points_monthly_yearly = db.Column(db.Float, default=0.0)
     final_city_tax_benefit_yearly = db.Column(db.Float, default=0.0)
+    final_city_tax_benefit = db.Column(db.Float, default=0.0)
 
     # Yearly Employer Contribution Fields
     pension_fund_yearly = db.Column(db.Float, default=0.0)
@@ -775,6 +811,8 @@ class MonthlyRecord(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('employee_id', 'employeeMonth', 'employeeYear', name='unique_employee_month'),
+        db.Index('ix_monthly_records_employee_month', 'employee_id', 'month_key'),
+        db.Index('ix_monthly_records_month_key', 'month_key'),
     )
 
 # -----------------------------
@@ -0,0 +1,135 @@
+import os, time, threading
+from collections import namedtuple
+
+from database import db, EmployeeData
+
+# ----------------------
+# Employee Identity Cache (clock hot path)
+# ----------------------
+#
+# The clock routes only need id / name / id_number / user_id, not the
+# ~240 column employee_data row. Identities are cached per process for
+# EMPLOYEE_IDENTITY_TTL seconds; every route that commits an employee's
+# name, id_number, company or user_id (or creates / deletes the row) calls
+# invalidate(). Other worker processes pick the change up when their entry
+# expires, so TTL is the upper bound on staleness.
+#
+# company is the employer tax file number (or company name) on the employee
+# row; it keys the presence rooms.
+
+IDENTITY_TTL = float(os.getenv("EMPLOYEE_IDENTITY_TTL", "60"))
+DEFAULT_COMPANY = "default"
+
+EmployeeIdentity = namedtuple("EmployeeIdentity", ["id", "employee_name", "id_number", "user_id", "company"])
+
+_COLUMNS = (
+    EmployeeData.id, EmployeeData.employee_name, EmployeeData.id_number, EmployeeData.user_id,
+    EmployeeData.taxFileNumber, EmployeeData.companyName,
+)
+
+
+def _identity(row):
+    emp_id, name, id_number, user_id, tax_file, company_name = row
+    company = str(tax_file or company_name or "").strip() or DEFAULT_COMPANY
+    return EmployeeIdentity(emp_id, name, id_number, user_id, company)
+
+
+class IdentityCache:
+    def __init__(self, ttl=IDENTITY_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}      # id -> (loaded_at, EmployeeIdentity or None)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.max_served_age = 0.0
+
+    @staticmethod
+    def _key(employee_id):
+        text = str(employee_id or "").strip()
+        return int(text) if text.isdigit() else None
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        age = now - entry[0]
+        if age > self.ttl:
+            self.expired += 1
+            return False, None
+        self.hits += 1
+        self.max_served_age = max(self.max_served_age, age)
+        return True, entry[1]
+
+    def get(self, employee_id):
+        """EmployeeIdentity of employee_id, or None when there is no such employee."""
+        key = self._key(employee_id)
+        if key is None:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            found, identity = self._lookup(key, now)
+            if found:
+                return identity
+            self.misses += 1
+
+        row = db.session.query(*_COLUMNS).filter(EmployeeData.id == key).first()
+        identity = _identity(row) if row else None
+        with self._lock:
+            self._entries[key] = (now, identity)
+        return identity
+
+    def get_many(self, employee_ids):
+        """{id: EmployeeIdentity} for the ids that exist; one query for all misses."""
+        keys = {k for k in (self._key(e) for e in employee_ids) if k is not None}
+        result, missing = {}, []
+
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                found, identity = self._lookup(key, now)
+                if found:
+                    if identity is not None:
+                        result[key] = identity
+                else:
+                    self.misses += 1
+                    missing.append(key)
+
+        if missing:
+            rows = db.session.query(*_COLUMNS).filter(EmployeeData.id.in_(missing)).all()
+            loaded = {row[0]: _identity(row) for row in rows}
+            with self._lock:
+                for key in missing:
+                    self._entries[key] = (now, loaded.get(key))
+            result.update(loaded)
+        return result
+
+    def invalidate(self, employee_id=None):
+        with self._lock:
+            if employee_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(employee_id), None)
+            self.invalidations += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            lookups = self.hits + self.misses
+            ages = [now - loaded_at for loaded_at, _ in self._entries.values()]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl,
+                "oldest_entry_seconds": round(max(ages), 3) if ages else 0.0,
+                "max_served_age_seconds": round(self.max_served_age, 3),
+            }
+
+
+identity_cache = IdentityCache()
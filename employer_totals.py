@@ -0,0 +1,300 @@
+import os, re, json, calendar
+from datetime import date
+import numpy as np
+
+import hours_store
+import file_store
+
+# ----------------------
+# Employer Monthly Totals (Forms 102 / B102 / H102)
+# ----------------------
+#
+# One pass over a month's "tax" blocks: every value is parsed into a single
+# float matrix (rows = employees, columns = TAX_FIELDS) and all totals are
+# column sums / masked sums on that matrix.
+
+TAX_FIELDS = [
+    "gross_taxable",
+    "income_tax",
+    "national_insurance_deductions",
+    "health_insurance_deductions",
+    "study_fund_deductions",
+    "employee_pension_fund",
+    "self_employed_pension_fund",
+    "pension_fund",
+    "compensation",
+    "disability",
+    "study_fund",
+]
+
+COL = {name: i for i, name in enumerate(TAX_FIELDS)}
+
+# Under 18 or from 67 the employee is reported at the reduced rate
+REDUCED_MIN_AGE = 18
+REDUCED_MAX_AGE = 67
+
+_DOB_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+
+
+def clean_number(val):
+    try:
+        return float(str(val).replace("₪", "").replace(",", "").strip())
+    except:
+        return 0.0
+
+
+def _parse_values(values):
+    """Vectorized clean_number; falls back per value only when the batch has junk in it."""
+    arr = np.array(values, dtype=str)
+    arr = np.char.strip(np.char.replace(np.char.replace(arr, "₪", ""), ",", ""))
+    arr[arr == ""] = "0"
+    try:
+        return arr.astype(np.float64)
+    except ValueError:
+        return np.array([clean_number(v) for v in arr], dtype=np.float64)
+
+
+def tax_matrix(tax_rows):
+    """(n, len(TAX_FIELDS)) float matrix of the given tax dicts."""
+    n = len(tax_rows)
+    if n == 0:
+        return np.zeros((0, len(TAX_FIELDS)), dtype=np.float64)
+    flat = [str(row.get(name, 0)) for row in tax_rows for name in TAX_FIELDS]
+    return _parse_values(flat).reshape(n, len(TAX_FIELDS))
+
+
+def ages(dobs, as_of):
+    """Age in whole years at as_of for YYYY-MM-DD strings; missing/invalid -> 0."""
+    n = len(dobs)
+    result = np.zeros(n, dtype=np.int64)
+    matches = [_DOB_RE.match(str(d)) if d else None for d in dobs]
+    valid = np.array([m is not None for m in matches], dtype=bool)
+    if not valid.any():
+        return result
+
+    births = np.array(
+        ["%s-%02d-%02d" % (m.group(1), int(m.group(2)), int(m.group(3))) for m in matches if m],
+        dtype="U10"
+    )
+    try:
+        days = births.astype("datetime64[D]")
+    except ValueError:
+        # impossible calendar dates (e.g. 2020-02-31) -> check one by one
+        ok = []
+        for b in births:
+            try:
+                np.datetime64(b, "D")
+                ok.append(True)
+            except ValueError:
+                ok.append(False)
+        ok = np.array(ok, dtype=bool)
+        idx = np.flatnonzero(valid)
+        valid[idx[~ok]] = False
+        births = births[ok]
+        days = births.astype("datetime64[D]")
+
+    years = days.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = days.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    mdays = (days - days.astype("datetime64[M]")).astype(np.int64) + 1
+
+    before_birthday = (as_of.month < months) | ((as_of.month == months) & (as_of.day < mdays))
+    result[valid] = as_of.year - years - before_birthday.astype(np.int64)
+    return result
+
+
+def aggregate_102(tax_rows, as_of=None):
+    """Raw (unformatted) 102-family totals for one month of tax blocks."""
+    as_of = as_of or date.today()
+    tax_rows = list(tax_rows)
+    matrix = tax_matrix(tax_rows)
+    sums = matrix.sum(axis=0) if len(tax_rows) else np.zeros(len(TAX_FIELDS))
+
+    age = ages([row.get("date_of_birth") or "" for row in tax_rows], as_of)
+    reduced = (age < REDUCED_MIN_AGE) | (age >= REDUCED_MAX_AGE)
+    gross = matrix[:, COL["gross_taxable"]]
+
+    totals = {name: float(sums[i]) for name, i in COL.items()}
+    totals.update({
+        "employee_count": len(tax_rows),
+        "regular_salary": float(gross[~reduced].sum()),
+        "reduced_salary": float(gross[reduced].sum()),
+        "regular_count": int((~reduced).sum()),
+        "reduced_count": int(reduced.sum()),
+    })
+    return with_derived_totals(totals)
+
+
+def with_derived_totals(totals):
+    """Combined lines of the form, derived from the summed fields."""
+    emp_pension_combined = totals["employee_pension_fund"] + totals["self_employed_pension_fund"]
+    emp_deductions_total = (
+        totals["national_insurance_deductions"] +
+        totals["health_insurance_deductions"] +
+        emp_pension_combined +
+        totals["study_fund_deductions"]
+    )
+    employer_pension_combined = (
+        totals["pension_fund"] +
+        totals["compensation"] +
+        totals["disability"] +
+        totals["study_fund"]
+    )
+
+    totals = dict(totals)
+    totals.update({
+        "emp_pension_combined": emp_pension_combined,
+        "emp_deductions_total": emp_deductions_total,
+        "employer_pension_combined": employer_pension_combined,
+        "final_totals_paid": emp_deductions_total + employer_pension_combined,
+    })
+    return totals
+
+
+# ----------------------
+# Materialized Monthly Totals
+# ----------------------
+#
+# hours_data/hours_data_{year}/
+#   monthly_employer_totals.json                     -> {month_key: raw totals}   (read by the forms)
+#   employer_contributions/{yyyy-mm}/{emp_id}.json   -> {"values": [...], "reduced": bool}
+#
+# A save subtracts the employee's previous contribution from the month and
+# adds the new one, so the forms read one small dict instead of scanning every
+# employee, and a save rewrites only its own contribution file plus the small
+# totals file. Age is taken at the last day of the report month, so a stored
+# month never changes just because the calendar moved on. The files of a year
+# are only touched under the cross-process lock of the totals file. A month
+# still in the old one-file-per-month layout is rebuilt once on its next save.
+
+TOTALS_FILE = "monthly_employer_totals.json"
+CONTRIBUTIONS_DIR = "employer_contributions"
+
+_COUNT_FIELDS = ["employee_count", "regular_count", "reduced_count"]
+_SUM_FIELDS = TAX_FIELDS + ["regular_salary", "reduced_salary"]
+
+def month_end(month_key):
+    year, month = (int(p) for p in str(month_key).split("-")[:2])
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _totals_path(base_dir, year):
+    return os.path.join(hours_store.year_folder(base_dir, year), TOTALS_FILE)
+
+
+def _contributions_dir(base_dir, year, month_key):
+    return os.path.join(
+        hours_store.year_folder(base_dir, year), CONTRIBUTIONS_DIR, hours_store._safe_part(month_key)
+    )
+
+
+def _contribution_path(base_dir, year, month_key, employee_id):
+    return os.path.join(
+        _contributions_dir(base_dir, year, month_key), f"{hours_store._safe_part(employee_id)}.json"
+    )
+
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    file_store.write_json(path, data, indent=None)
+
+
+def _empty_totals():
+    totals = {name: 0.0 for name in _SUM_FIELDS}
+    totals.update({name: 0 for name in _COUNT_FIELDS})
+    return totals
+
+
+def _contributions(tax_rows, as_of):
+    """Per-employee share of the month, same classification as aggregate_102."""
+    matrix = tax_matrix(tax_rows)
+    age = ages([row.get("date_of_birth") or "" for row in tax_rows], as_of)
+    reduced = (age < REDUCED_MIN_AGE) | (age >= REDUCED_MAX_AGE)
+    return [
+        {"values": [float(v) for v in matrix[i]], "reduced": bool(reduced[i])}
+        for i in range(len(tax_rows))
+    ]
+
+
+def _apply(totals, contribution, sign):
+    values = contribution["values"]
+    for name, i in COL.items():
+        totals[name] = round(totals[name] + sign * values[i], 6)
+
+    gross = values[COL["gross_taxable"]]
+    bucket = "reduced" if contribution["reduced"] else "regular"
+    totals[f"{bucket}_salary"] = round(totals[f"{bucket}_salary"] + sign * gross, 6)
+    totals[f"{bucket}_count"] += sign
+    totals["employee_count"] += sign
+
+
+def rebuild_month(base_dir, year, month_key):
+    """Full scan of one month's shards (first read of a month, or repair)."""
+    with file_store.lock(_totals_path(base_dir, year)):
+        return _rebuild_month(base_dir, year, month_key)
+
+
+def _rebuild_month(base_dir, year, month_key):
+    emp_ids, tax_rows = [], []
+    for emp_id, _, _, month_data in hours_store.iter_year(base_dir, year, month_key=month_key):
+        emp_ids.append(str(emp_id))
+        tax_rows.append(month_data.get("hours_table", {}).get("tax", {}))
+
+    contributions = dict(zip(emp_ids, _contributions(tax_rows, month_end(month_key))))
+    totals = _empty_totals()
+    for contribution in contributions.values():
+        _apply(totals, contribution, 1)
+
+    folder = _contributions_dir(base_dir, year, month_key)
+    keep = {f"{hours_store._safe_part(e)}.json" for e in emp_ids}
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            if name.endswith(".json") and name not in keep:
+                os.remove(os.path.join(folder, name))
+    for emp_id, contribution in contributions.items():
+        _write_json(_contribution_path(base_dir, year, month_key, emp_id), contribution)
+    legacy = f"{folder}.json"
+    if os.path.exists(legacy):
+        os.remove(legacy)
+
+    all_totals = _read_json(_totals_path(base_dir, year))
+    all_totals[month_key] = totals
+    _write_json(_totals_path(base_dir, year), all_totals)
+    return totals
+
+
+def update_month(base_dir, year, employee_id, month_key, month_data):
+    """Swap one employee's contribution after their month was saved."""
+    tax = (month_data or {}).get("hours_table", {}).get("tax", {})
+
+    with file_store.lock(_totals_path(base_dir, year)):
+        all_totals = _read_json(_totals_path(base_dir, year))
+        if month_key not in all_totals or not os.path.isdir(_contributions_dir(base_dir, year, month_key)):
+            # never materialized (or old layout) -> the shard is already on disk, scan once
+            return _rebuild_month(base_dir, year, month_key)
+
+        path = _contribution_path(base_dir, year, month_key, employee_id)
+        totals = all_totals[month_key]
+
+        old = _read_json(path)
+        if old:
+            _apply(totals, old, -1)
+        new = _contributions([tax], month_end(month_key))[0]
+        _apply(totals, new, 1)
+
+        _write_json(path, new)
+        _write_json(_totals_path(base_dir, year), all_totals)
+        return totals
+
+
+def month_totals(base_dir, year, month_key):
+    """Totals of one month ready for the forms (derived lines included)."""
+    totals = _read_json(_totals_path(base_dir, year)).get(month_key)
+    if totals is None:
+        totals = rebuild_month(base_dir, year, month_key)
+    return with_derived_totals(totals)
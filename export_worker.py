@@ -0,0 +1,138 @@
+import threading, queue, time, traceback, logging
+
+# ----------------------
+# Background Export Queue
+# ----------------------
+#
+# Spreadsheet exports (CSV/XLSX) are derived from the canonical JSON files, so
+# they do not have to finish inside the HTTP request. Jobs are keyed by the
+# file they produce: submitting the same key again while it is still queued
+# only replaces its arguments (latest data wins), and a key that is currently
+# running is re-queued once after it finishes. Two jobs with the same key
+# never run at the same time.
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+
+class ExportQueue:
+    def __init__(self, workers=1, on_status=None, history=500):
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queue = queue.Queue()
+        self._pending = {}      # key -> (fn, args, kwargs) waiting to run
+        self._running = set()
+        self._status = {}       # key -> status dict
+        self._history = history
+        self._on_status = on_status
+        self._workers = []
+
+        for i in range(max(1, int(workers))):
+            t = threading.Thread(target=self._run, name=f"export-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    # ----------------------
+    # Public API
+    # ----------------------
+
+    def submit(self, key, fn, *args, **kwargs):
+        with self._lock:
+            already_waiting = key in self._pending
+            self._pending[key] = (fn, args, kwargs)
+
+            status = self._status.get(key, {"key": key, "coalesced": 0})
+            if already_waiting:
+                status["coalesced"] = status.get("coalesced", 0) + 1
+            status.update({"state": QUEUED, "submitted_at": time.time(), "error": None})
+            self._status[key] = status
+            self._trim_history()
+            snapshot = dict(status)
+
+            if not already_waiting and key not in self._running:
+                self._queue.put(key)
+
+        self._publish(snapshot)
+        return snapshot
+
+    def status(self, key=None):
+        with self._lock:
+            if key is not None:
+                s = self._status.get(key)
+                return dict(s) if s else None
+            return {k: dict(v) for k, v in self._status.items()}
+
+    def wait_idle(self, timeout=None):
+        """Block until nothing is queued or running (used by scripts and shutdown)."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    # ----------------------
+    # Worker Loop
+    # ----------------------
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            with self._lock:
+                job = self._pending.pop(key, None)
+                if job is None or key in self._running:
+                    # already handled, or will be picked up when the running job finishes
+                    if job is not None:
+                        self._pending[key] = job
+                    continue
+                self._running.add(key)
+                status = self._status.setdefault(key, {"key": key, "coalesced": 0})
+                status.update({"state": RUNNING, "started_at": time.time()})
+                snapshot = dict(status)
+            self._publish(snapshot)
+
+            fn, args, kwargs = job
+            error = None
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                error = str(e)
+                logger.error("Export job %s failed:\n%s", key, traceback.format_exc())
+
+            with self._lock:
+                self._running.discard(key)
+                status = self._status.setdefault(key, {"key": key, "coalesced": 0})
+                if key in self._pending:
+                    # newer data arrived while running -> run again
+                    status["state"] = QUEUED
+                    self._queue.put(key)
+                else:
+                    status["state"] = ERROR if error else DONE
+                status.update({"finished_at": time.time(), "error": error})
+                snapshot = dict(status)
+                self._idle.notify_all()
+            self._publish(snapshot)
+
+    def _trim_history(self):
+        if len(self._status) <= self._history:
+            return
+        finished = sorted(
+            (s.get("finished_at") or 0, k) for k, s in self._status.items()
+            if s.get("state") in (DONE, ERROR)
+        )
+        for _, k in finished[:len(self._status) - self._history]:
+            self._status.pop(k, None)
+
+    def _publish(self, status):
+        if not self._on_status:
+            return
+        try:
+            self._on_status(status)
+        except Exception:
+            logger.exception("Export status callback failed")
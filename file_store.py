@@ -0,0 +1,149 @@
+import os, json, uuid, hashlib, threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:          # Windows dev machines -> in-process locks only
+    fcntl = None
+
+# ----------------------
+# File Store (cross-process safe writes)
+# ----------------------
+#
+# Every JSON/CSV file the app rewrites goes through here so several gunicorn
+# workers can share the data folders:
+#   lock(path)          -> exclusive advisory lock (fcntl.flock) on a lock file
+#                          in FILE_LOCK_DIR, keyed by the file's absolute path.
+#                          The folder is resolved against the app folder, so
+#                          workers started from any working directory share it
+#   atomic_write(path)  -> write to a unique temp file + os.replace, so readers
+#                          see the old or the new file, never half of one
+#   update_json(path)   -> read-modify-write under the lock
+#
+# FILE_FSYNC: "none" (default) or "always" (fsync the temp file before the
+# rename and the folder after it, so a save is on disk when it returns).
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+LOCK_DIR = os.path.join(APP_ROOT, os.getenv("FILE_LOCK_DIR", ".file_locks"))
+FSYNC_MODE = os.getenv("FILE_FSYNC", "none").lower()
+if FSYNC_MODE not in ("none", "always"):
+    print(f"⚠️ FILE_FSYNC={FSYNC_MODE!r} is not none/always, saves are not fsynced")
+
+_thread_locks = {}           # lock file digest -> [threading.Lock, threads using it]
+_thread_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+def _digest(path):
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+
+
+def _lock_file(path):
+    return os.path.join(LOCK_DIR, f"{_digest(path)}.lock")
+
+
+@contextmanager
+def _thread_lock(path):
+    # one entry per path in use; the last thread out removes it
+    key = _digest(path)
+    with _thread_locks_guard:
+        entry = _thread_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _thread_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _thread_locks[key]
+
+
+@contextmanager
+def lock(path):
+    """Exclusive lock on path across threads and processes (re-entrant per thread)."""
+    key = os.path.abspath(path)
+    held = getattr(_held, "paths", None)
+    if held is None:
+        held = _held.paths = set()
+    if key in held:
+        yield
+        return
+
+    with _thread_lock(key):
+        handle = None
+        if fcntl is not None:
+            os.makedirs(LOCK_DIR, exist_ok=True)
+            handle = open(_lock_file(key), "a")
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            if handle is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+                handle.close()
+
+
+def temp_path(path):
+    """Unique temp name next to path (same folder -> os.replace is atomic)."""
+    return f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+
+
+def _fsync_dir(folder):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(folder or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def commit_temp(tmp_path, path):
+    """Rename a finished temp file over path, honouring FILE_FSYNC."""
+    if FSYNC_MODE == "always":
+        # data first: the rename must never point at blocks that are not on disk yet
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if FSYNC_MODE == "always":
+        _fsync_dir(os.path.dirname(path))
+
+
+def atomic_write(path, text, encoding="utf-8", newline=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, "w", encoding=encoding, newline=newline) as f:
+            f.write(text)
+        commit_temp(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path, data, indent=2):
+    atomic_write(path, json.dumps(data, ensure_ascii=False, indent=indent))
+
+
+def update_json(path, update, default=None, indent=2):
+    """
+    Read path, pass the data to update(data) and write what it returns
+    (or the mutated data when it returns None), all under lock(path).
+    """
+    with lock(path):
+        data = read_json(path, default if default is not None else {})
+        result = update(data)
+        data = data if result is None else result
+        write_json(path, data, indent=indent)
+        return data
+
@@ -0,0 +1,351 @@
+import os, csv, io, json, uuid, bisect, shutil
+
+import hours_store
+import file_store
+
+# ----------------------
+# Incremental Yearly Hours Export (CSV)
+# ----------------------
+#
+# hours_data/hours_data_{year}/export/
+#   index.json                   -> {"fieldnames": [...], "sections": [[emp_id, month_key], ...]}
+#   sections/{emp_id}/{mk}.csv   -> pre-rendered rows of one employee-month (no header)
+#
+#   revision                     -> changes on every fragment write (a few bytes)
+#   built.json                   -> {"csv": revision, "xlsx": revision} the year files were built from
+#
+# Saving one employee-month re-renders only its fragment (update_section), so a
+# save costs the same at 10 or 2,000 employees. The yearly CSV (spliced from the
+# fragments byte-for-byte, splice_year) and the XLSX copy the whole year, so
+# they are built when someone asks for them and only if a save came in since
+# the last build (is_current).
+
+EXPORT_DIR = "export"
+SECTIONS_DIR = "sections"
+REVISION_NAME = "revision"
+BUILT_NAME = "built.json"
+
+BASE_FIELDS = [
+    "employee_id", "employee_name", "month", "section",
+    "day", "date", "saturday", "holiday"
+]
+
+DAILY_FIELDS = [
+    'start_time', 'end_time', 'hours_calculated', 'hours_calculated_regular_day',
+    'total_extra_hours_regular_day', 'extra_hours125_regular_day',
+    'extra_hours150_regular_day', 'hours_holidays_day',
+    'extra_hours150_holidays_saturday', 'extra_hours175_holidays_saturday',
+    'extra_hours200_holidays_saturday', 'sick_day', 'day_off', 'food_break',
+    'final_totals_hours', 'calc1', 'calc2', 'calc3', 'work_day',
+    'missing_work_day', 'advance_payment'
+]
+
+MONTHLY_FIELDS = [
+    "hours_calculated_monthly",
+    "hours_calculated_regular_day_monthly",
+    "total_extra_hours_regular_day_monthly",
+    "extra_hours125_regular_day_monthly",
+    "extra_hours150_regular_day_monthly",
+    "hours_holidays_day_monthly",
+    "extra_hours150_holidays_saturday_monthly",
+    "extra_hours175_holidays_saturday_monthly",
+    "extra_hours200_holidays_saturday_monthly",
+    "sick_day_monthly",
+    "day_off_monthly",
+    "food_break_monthly",
+    "final_totals_hours_monthly",
+    "calc1_monthly",
+    "calc2_monthly",
+    "calc3_monthly",
+    "work_day_monthly",
+    "missing_work_day_monthly",
+    "advance_payment_monthly"
+]
+
+PAID_FIELDS = [
+    "hours_calculated_paid",
+    "hours_calculated_regular_day_paid",
+    "total_extra_hours_regular_day_paid",
+    "extra_hours125_regular_day_paid",
+    "extra_hours150_regular_day_paid",
+    "hours_holidays_day_paid",
+    "extra_hours150_holidays_saturday_paid",
+    "extra_hours175_holidays_saturday_paid",
+    "extra_hours200_holidays_saturday_paid",
+    "sick_day_paid",
+    "day_off_paid",
+    "food_break_unpaid",
+    "final_totals_hours_paid",
+    "calc1_paid",
+    "calc2_paid",
+    "calc3_paid",
+    "final_totals_lunch_value_paid",
+    "final_total_extra_hours_weekend_monthly",
+    "advance_payment_paid"
+]
+
+DEFAULT_FIELDNAMES = list(dict.fromkeys(BASE_FIELDS + DAILY_FIELDS + MONTHLY_FIELDS + PAID_FIELDS))
+
+
+def snake(d):
+    return {k.replace("-", "_"): v for k, v in (d or {}).items()}
+
+
+def export_folder(base_dir, year):
+    return os.path.join(hours_store.year_folder(base_dir, year), EXPORT_DIR)
+
+
+def csv_path_for(base_dir, year):
+    return os.path.join(hours_store.year_folder(base_dir, year), f"hours_data_{year}.csv")
+
+
+def _index_path(base_dir, year):
+    return os.path.join(export_folder(base_dir, year), "index.json")
+
+
+def fragment_path(base_dir, year, employee_id, month_key):
+    return os.path.join(
+        export_folder(base_dir, year), SECTIONS_DIR,
+        hours_store._safe_part(employee_id), f"{hours_store._safe_part(month_key)}.csv"
+    )
+
+
+def _section_key(employee_id, month_key):
+    # numeric ids sort numerically, everything else after them as text
+    emp = str(employee_id)
+    return [0, int(emp), "", month_key] if emp.isdigit() else [1, 0, emp, month_key]
+
+
+# ----------------------
+# Section Rows
+# ----------------------
+
+def section_rows(employee_id, employee_name, month_key, month_data):
+    """Rows of one employee-month, same layout the full rebuild always produced."""
+    tbl = (month_data or {}).get("hours_table", {})
+    wd = [snake(e) for e in tbl.get("work_day_entries", [])]
+    mt = snake(tbl.get("monthly_totals", {}))
+    pt = snake(tbl.get("paid_totals", {}))
+    tx = snake(tbl.get("tax", {}))
+
+    rows = []
+    wrote_summary = False
+
+    for entry in wd:
+        row = {
+            "employee_id": employee_id if not wrote_summary else "",
+            "employee_name": employee_name if not wrote_summary else "",
+            "month": month_key if not wrote_summary else "",
+            "section": "daily",
+            "day": entry.get("day", ""),
+            "date": entry.get("date", ""),
+            "saturday": entry.get("saturday", ""),
+            "holiday": entry.get("holiday", "")
+        }
+
+        # daily fields
+        for k, v in entry.items():
+            if k not in ("day", "date", "saturday", "holiday"):
+                row[k] = v
+
+        if not wrote_summary:
+            row.update(mt)
+            row.update(pt)
+            row.update(tx)
+            wrote_summary = True
+        else:
+            for k in mt.keys(): row[k] = ""
+            for k in pt.keys(): row[k] = ""
+            for k in tx.keys(): row[k] = ""
+
+        rows.append(row)
+
+    return rows
+
+
+def _render_fragment(rows, fieldnames):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames, extrasaction="ignore")
+    for r in rows:
+        writer.writerow(r)
+    return buf.getvalue()
+
+
+def _write_text(path, text, encoding="utf-8"):
+    file_store.atomic_write(path, text, encoding=encoding, newline="")
+
+
+# ----------------------
+# Index
+# ----------------------
+
+def load_index(base_dir, year):
+    path = _index_path(base_dir, year)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_index(base_dir, year, index):
+    _write_text(_index_path(base_dir, year), json.dumps(index, ensure_ascii=False))
+
+
+# ----------------------
+# Revision (are the year files current?)
+# ----------------------
+
+def _revision_path(base_dir, year):
+    return os.path.join(export_folder(base_dir, year), REVISION_NAME)
+
+
+def _built_path(base_dir, year):
+    return os.path.join(export_folder(base_dir, year), BUILT_NAME)
+
+
+def _bump_revision(base_dir, year):
+    _write_text(_revision_path(base_dir, year), uuid.uuid4().hex)
+
+
+def revision(base_dir, year):
+    path = _revision_path(base_dir, year)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def mark_built(base_dir, year, kind, built_revision):
+    """Record the revision the year's CSV or XLSX ("csv" / "xlsx") was built from."""
+    file_store.update_json(_built_path(base_dir, year), lambda built: built.__setitem__(kind, built_revision))
+
+
+def is_current(base_dir, year, kind, path):
+    """True when path exists and no fragment changed since it was built."""
+    current = revision(base_dir, year)
+    built = file_store.read_json(_built_path(base_dir, year), {}) or {}
+    return os.path.exists(path) and current is not None and built.get(kind) == current
+
+
+# ----------------------
+# Splice / Update / Rebuild
+# ----------------------
+
+def _splice_year_csv(base_dir, year, index):
+    csv_path = csv_path_for(base_dir, year)
+    tmp_path = file_store.temp_path(csv_path)
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+
+    with open(tmp_path, "w", encoding="utf-8-sig", newline="") as out:
+        csv.writer(out).writerow(index["fieldnames"])
+        out.flush()
+        raw = out.buffer if hasattr(out, "buffer") else out
+        for emp_id, month_key in index["sections"]:
+            frag = fragment_path(base_dir, year, emp_id, month_key)
+            if os.path.exists(frag):
+                with open(frag, "rb") as src:
+                    shutil.copyfileobj(src, raw)
+        raw.flush()
+
+    file_store.commit_temp(tmp_path, csv_path)
+    return csv_path
+
+
+def rebuild_year(base_dir, year):
+    """Full rebuild from the shards (first export of a year, or a new column showed up)."""
+    # the index is shared by every worker process -> one export of a year at a time
+    with file_store.lock(_index_path(base_dir, year)):
+        index = _rebuild_year(base_dir, year)
+        built_revision = revision(base_dir, year)
+        csv_path = _splice_year_csv(base_dir, year, index)
+        mark_built(base_dir, year, "csv", built_revision)
+        return csv_path
+
+
+def _rebuild_year(base_dir, year):
+    sections = []
+    fieldnames = list(DEFAULT_FIELDNAMES)
+
+    for emp_id, emp_name, month_key, month_data in hours_store.iter_year(base_dir, year):
+        rows = section_rows(emp_id, emp_name, month_key, month_data)
+        for r in rows:
+            for k in r.keys():
+                if k not in fieldnames:
+                    fieldnames.append(k)
+        sections.append((emp_id, emp_name, month_key, rows))
+
+    index = {"fieldnames": fieldnames, "sections": []}
+    for emp_id, emp_name, month_key, rows in sections:
+        _write_text(fragment_path(base_dir, year, emp_id, month_key), _render_fragment(rows, fieldnames))
+        index["sections"].append([emp_id, month_key])
+    index["sections"].sort(key=lambda s: _section_key(*s))
+
+    _save_index(base_dir, year, index)
+    _bump_revision(base_dir, year)
+    return index
+
+
+def update_section(base_dir, year, employee_id, employee_name, month_key, month_data):
+    """Re-render one employee-month fragment (the yearly CSV is left to splice_year)."""
+    with file_store.lock(_index_path(base_dir, year)):
+        _update_section(base_dir, year, str(employee_id), employee_name, month_key, month_data)
+
+
+def _update_section(base_dir, year, employee_id, employee_name, month_key, month_data):
+    index = load_index(base_dir, year)
+    if index is None:
+        return _rebuild_year(base_dir, year)
+
+    rows = section_rows(employee_id, employee_name, month_key, month_data)
+    new_columns = [k for r in rows for k in r.keys() if k not in index["fieldnames"]]
+    if new_columns:
+        # Column layout changed -> every fragment must be re-rendered once
+        return _rebuild_year(base_dir, year)
+
+    _write_text(
+        fragment_path(base_dir, year, employee_id, month_key),
+        _render_fragment(rows, index["fieldnames"])
+    )
+
+    section = [employee_id, month_key]
+    if section not in index["sections"]:
+        keys = [_section_key(*s) for s in index["sections"]]
+        index["sections"].insert(bisect.bisect(keys, _section_key(*section)), section)
+        _save_index(base_dir, year, index)
+    _bump_revision(base_dir, year)
+    return index
+
+
+def year_rows(base_dir, year):
+    """
+    (fieldnames, rows) of the yearly export in CSV section order, rendered from
+    the shards (section_rows), for writers that do not need the CSV text.
+    """
+    with file_store.lock(_index_path(base_dir, year)):
+        index = load_index(base_dir, year) or _rebuild_year(base_dir, year)
+    employees = hours_store.load_manifest(base_dir, year)["employees"]
+
+    def rows():
+        for emp_id, month_key in index["sections"]:
+            month_data = hours_store.load_month(base_dir, year, emp_id, month_key)
+            if month_data:
+                name = (employees.get(str(emp_id)) or {}).get("employee_name", "")
+                yield from section_rows(emp_id, name, month_key, month_data)
+
+    return index["fieldnames"], rows()
+
+
+def splice_year(base_dir, year):
+    """Splice the yearly CSV from the current fragments (skipped while it is current). Returns the CSV path."""
+    csv_path = csv_path_for(base_dir, year)
+    with file_store.lock(_index_path(base_dir, year)):
+        index = load_index(base_dir, year)
+        if index is None:
+            index = _rebuild_year(base_dir, year)
+        elif is_current(base_dir, year, "csv", csv_path):
+            return csv_path
+        # fragments are written under this lock -> the revision read here is what gets spliced
+        built_revision = revision(base_dir, year)
+        _splice_year_csv(base_dir, year, index)
+        mark_built(base_dir, year, "csv", built_revision)
+        return csv_path
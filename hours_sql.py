@@ -0,0 +1,465 @@
+import os, re, time
+from datetime import date
+
+from sqlalchemy import func, case, or_, literal
+
+from database import db, EmployeeData, HoursData, MonthlyRecord
+import hours_store
+import file_store
+import employer_totals
+import yearly_totals
+
+# ----------------------
+# Hours Archive In SQL (HoursData / MonthlyRecord)
+# ----------------------
+#
+# The JSON shards stay the canonical copy; this module mirrors them into SQL:
+#   HoursData      -> one row per work day ("daily"), monthly/paid totals on the
+#                     first row of the month (same layout as the CSV export),
+#                     the original entry in row_data
+#   MonthlyRecord  -> one row per employee-month, tax fields as numbers,
+#                     {"monthly_totals", "paid_totals", "tax"} in row_data
+#
+# import_year() bulk-loads a year with executemany batches, sync_month()
+# keeps it current on every save (sync_months() for a whole payroll run), and
+# the read helpers below answer get_hours_data / forms 102 / 106 and the
+# *_yearly running totals with indexed queries; the 102 totals, including the
+# reduced/regular age split, are one aggregate query.
+#
+# A month whose mirror write failed is listed in hours_data/sql_mirror_stale.json
+# (mark_stale) until a later sync or `flask import-hours` succeeds; SQL readers
+# check is_stale() and read that month from the shards instead.
+
+BATCH_SIZE = 1000
+
+_DOB_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+
+_SKIP_COLUMNS = {"id", "created_at", "timestamp", "submission_time"}
+
+HOURS_COLUMNS = [c.name for c in HoursData.__table__.columns if c.name not in _SKIP_COLUMNS]
+MONTHLY_COLUMNS = [c for c in MonthlyRecord.__table__.columns if c.name not in _SKIP_COLUMNS]
+
+_IDENTITY = {
+    "employee_id", "employee_name", "employeeMonth", "employeeYear",
+    "month_key", "date", "month_result", "row_data"
+}
+
+
+def clean_number(value):
+    try:
+        return float(str(value).replace("₪", "").replace(",", "").strip())
+    except:
+        return 0.0
+
+
+def _snake(d):
+    return {k.replace("-", "_"): v for k, v in (d or {}).items()}
+
+
+def _normalize_dob(value):
+    m = _DOB_RE.match(str(value or "").strip())
+    if not m:
+        return None
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
+    except ValueError:
+        return None
+
+
+def _column_value(column, value):
+    """Cast a JSON value to what the column stores; missing -> column default."""
+    if value is None or value == "":
+        default = column.default.arg if column.default is not None and column.default.is_scalar else None
+        return default
+    if isinstance(column.type, db.Float):
+        return clean_number(value)
+    if isinstance(column.type, db.Integer):
+        return int(clean_number(value))
+    if isinstance(column.type, (db.String, db.Text)):
+        return str(value)
+    return value
+
+
+def _split_month_key(month_key):
+    year, month = str(month_key).split("-")[:2]
+    return year, month.zfill(2)
+
+
+# ----------------------
+# JSON -> Rows
+# ----------------------
+
+def month_rows(employee_id, employee_name, month_key, month_data):
+    """(HoursData rows, MonthlyRecord row) of one employee-month, as plain dicts."""
+    year, month = _split_month_key(month_key)
+    table = (month_data or {}).get("hours_table", {})
+    monthly_totals = table.get("monthly_totals", {}) or {}
+    paid_totals = table.get("paid_totals", {}) or {}
+    tax = table.get("tax", {}) or {}
+
+    base = {
+        "employee_id": employee_id,
+        "employee_name": employee_name or "",
+        "employeeMonth": month,
+        "employeeYear": year,
+        "month_key": month_key,
+    }
+
+    summary = {}
+    summary.update(_snake(monthly_totals))
+    summary.update(_snake(paid_totals))
+
+    hours_rows = []
+    for i, entry in enumerate(table.get("work_day_entries", []) or []):
+        values = _snake(entry)
+        if i == 0:
+            values = {**values, **summary}
+        row = {name: None for name in HOURS_COLUMNS}
+        row.update({k: (str(v) if v is not None else None) for k, v in values.items() if k in row})
+        row.update(base)
+        row.update({"section": "daily", "hours": None, "row_data": entry})
+        hours_rows.append(row)
+
+    # tax keys are read as-is, like the JSON totals engines do
+    tax_values = dict(tax)
+    tax_values["date_of_birth"] = _normalize_dob(tax_values.get("date_of_birth"))
+
+    record = {}
+    for column in MONTHLY_COLUMNS:
+        if column.name in _IDENTITY:
+            continue
+        record[column.name] = _column_value(column, tax_values.get(column.name))
+    record.update(base)
+    record.update({
+        "date": f"{month}/{year}",
+        "month_result": f"{month}/{year}",
+        "row_data": {"monthly_totals": monthly_totals, "paid_totals": paid_totals, "tax": tax},
+    })
+    return hours_rows, record
+
+
+def _insert_many(model, rows):
+    if rows:
+        # list of parameter dicts -> one executemany round trip
+        db.session.execute(model.__table__.insert(), rows)
+
+
+# ----------------------
+# Bulk Import / Sync On Save
+# ----------------------
+
+def import_year(base_dir, year, batch_size=BATCH_SIZE):
+    """Replace the year's SQL rows with the contents of the JSON archive."""
+    year = str(year)
+    known_ids = {row[0] for row in db.session.query(EmployeeData.id).all()}
+
+    db.session.query(HoursData).filter(HoursData.employeeYear == year).delete(synchronize_session=False)
+    db.session.query(MonthlyRecord).filter(MonthlyRecord.employeeYear == year).delete(synchronize_session=False)
+
+    hours_batch, monthly_batch = [], []
+    counts = {"hours_rows": 0, "monthly_records": 0, "skipped": []}
+
+    for emp_id, emp_name, month_key, month_data in hours_store.iter_year(base_dir, year):
+        if not str(emp_id).isdigit() or int(emp_id) not in known_ids:
+            counts["skipped"].append([emp_id, month_key])
+            continue
+
+        rows, record = month_rows(int(emp_id), emp_name, month_key, month_data)
+        hours_batch.extend(rows)
+        monthly_batch.append(record)
+
+        if len(hours_batch) >= batch_size or len(monthly_batch) >= batch_size:
+            _insert_many(HoursData, hours_batch)
+            _insert_many(MonthlyRecord, monthly_batch)
+            counts["hours_rows"] += len(hours_batch)
+            counts["monthly_records"] += len(monthly_batch)
+            hours_batch, monthly_batch = [], []
+
+    _insert_many(HoursData, hours_batch)
+    _insert_many(MonthlyRecord, monthly_batch)
+    counts["hours_rows"] += len(hours_batch)
+    counts["monthly_records"] += len(monthly_batch)
+
+    db.session.commit()
+    return counts
+
+
+def import_all(base_dir, batch_size=BATCH_SIZE):
+    results = {}
+    for name in sorted(os.listdir(base_dir)):
+        m = re.match(r"^hours_data_(\d{4})$", name)
+        if m and os.path.isdir(os.path.join(base_dir, name)):
+            results[m.group(1)] = import_year(base_dir, m.group(1), batch_size)
+    return results
+
+
+def sync_month(employee_id, employee_name, month_key, month_data):
+    """Mirror one saved employee-month; returns False when the employee is not in the DB."""
+    if not str(employee_id).isdigit() or db.session.get(EmployeeData, int(employee_id)) is None:
+        return False
+    employee_id = int(employee_id)
+
+    db.session.query(HoursData).filter_by(employee_id=employee_id, month_key=month_key).delete(synchronize_session=False)
+    db.session.query(MonthlyRecord).filter_by(employee_id=employee_id, month_key=month_key).delete(synchronize_session=False)
+
+    rows, record = month_rows(employee_id, employee_name, month_key, month_data)
+    _insert_many(HoursData, rows)
+    _insert_many(MonthlyRecord, [record])
+    db.session.commit()
+    return True
+
+
+def update_month_fields(employee_id, employee_name, month_key, month_data, fields):
+    """Write only the given tax fields of an employee-month's MonthlyRecord (day rows untouched)."""
+    if not str(employee_id).isdigit():
+        return False
+    record = MonthlyRecord.query.filter_by(employee_id=int(employee_id), month_key=month_key).first()
+    if record is None:
+        return sync_month(employee_id, employee_name, month_key, month_data)
+
+    table = (month_data or {}).get("hours_table", {})
+    tax = table.get("tax", {}) or {}
+    columns = {c.name: c for c in MONTHLY_COLUMNS}
+    for name in fields:
+        if name in columns and name not in _IDENTITY:
+            value = _normalize_dob(tax.get(name)) if name == "date_of_birth" else tax.get(name)
+            setattr(record, name, _column_value(columns[name], value))
+    record.row_data = {"monthly_totals": table.get("monthly_totals", {}) or {},
+                       "paid_totals": table.get("paid_totals", {}) or {}, "tax": tax}
+    db.session.commit()
+    return True
+
+
+def sync_months(items):
+    """
+    sync_month() for many (employee_id, employee_name, month_key, month_data)
+    in one transaction (pending changes of the session are committed with it).
+    Returns the number of employee-months mirrored.
+    """
+    wanted = {int(e) for e, _, _, _ in items if str(e).isdigit()}
+    known = {i for (i,) in db.session.query(EmployeeData.id).filter(EmployeeData.id.in_(wanted))} if wanted else set()
+    items = [(int(e), n, k, d) for e, n, k, d in items if str(e).isdigit() and int(e) in known]
+
+    by_month = {}
+    for employee_id, _, month_key, _ in items:
+        by_month.setdefault(month_key, []).append(employee_id)
+    for month_key, employee_ids in by_month.items():
+        for model in (HoursData, MonthlyRecord):
+            db.session.query(model).filter(model.month_key == month_key, model.employee_id.in_(employee_ids)) \
+                .delete(synchronize_session=False)
+
+    hours_rows, records = [], []
+    for employee_id, employee_name, month_key, month_data in items:
+        rows, record = month_rows(employee_id, employee_name, month_key, month_data)
+        hours_rows.extend(rows)
+        records.append(record)
+    for i in range(0, len(hours_rows), BATCH_SIZE):
+        _insert_many(HoursData, hours_rows[i:i + BATCH_SIZE])
+    for i in range(0, len(records), BATCH_SIZE):
+        _insert_many(MonthlyRecord, records[i:i + BATCH_SIZE])
+    db.session.commit()
+    return len(items)
+
+
+# ----------------------
+# Stale Months (mirror write failed)
+# ----------------------
+
+STALE_FILE = "sql_mirror_stale.json"
+
+
+def _stale_path(base_dir):
+    return os.path.join(base_dir, STALE_FILE)
+
+
+def _stale_key(employee_id, month_key):
+    return f"{employee_id}/{month_key}"
+
+
+def mark_stale(base_dir, employee_id, month_key, error):
+    file_store.update_json(_stale_path(base_dir), lambda stale: stale.update(
+        {_stale_key(employee_id, month_key): {"error": str(error), "at": time.strftime("%Y-%m-%d %H:%M:%S")}}
+    ))
+
+
+def clear_stale(base_dir, employee_id=None, month_key=None, year=None):
+    """Forget stale months: one employee-month, or every month of a year (after import_year)."""
+    if not os.path.exists(_stale_path(base_dir)):
+        return
+
+    def update(stale):
+        for key in list(stale):
+            emp, mk = key.split("/", 1)
+            if (year is not None and mk.startswith(f"{year}-")) or (emp == str(employee_id) and mk == month_key):
+                del stale[key]
+    file_store.update_json(_stale_path(base_dir), update)
+
+
+def stale_months(base_dir):
+    return file_store.read_json(_stale_path(base_dir), {}) or {}
+
+
+def is_stale(base_dir, employee_id=None, month_key=None, year=None):
+    """True when the given employee-month (or any month of employee/year, or any employee of month_key) is stale."""
+    if not os.path.exists(_stale_path(base_dir)):
+        return False
+    for key in stale_months(base_dir):
+        emp, mk = key.split("/", 1)
+        if employee_id is not None and emp != str(employee_id):
+            continue
+        if month_key is not None and mk != month_key:
+            continue
+        if year is not None and not mk.startswith(f"{year}-"):
+            continue
+        return True
+    return False
+
+
+# ----------------------
+# Read Path
+# ----------------------
+
+def load_month(employee_id, month_key):
+    """Same shape as hours_store.load_month()."""
+    if not str(employee_id).isdigit():
+        return {}
+    employee_id = int(employee_id)
+
+    record = MonthlyRecord.query.filter_by(employee_id=employee_id, month_key=month_key).first()
+    rows = (
+        HoursData.query.filter_by(employee_id=employee_id, month_key=month_key)
+        .order_by(HoursData.id).all()
+    )
+    if record is None and not rows:
+        return {}
+
+    summary = (record.row_data if record else None) or {}
+    return {"hours_table": {
+        "work_day_entries": [row.row_data or {} for row in rows],
+        "monthly_totals": summary.get("monthly_totals", {}),
+        "paid_totals": summary.get("paid_totals", {}),
+        "tax": summary.get("tax", {}),
+    }}
+
+
+def load_employee(employee_id, year):
+    """Same shape as hours_store.load_employee(): {month_key: month_data}, two queries."""
+    if not str(employee_id).isdigit():
+        return {}
+    employee_id = int(employee_id)
+
+    records = (
+        MonthlyRecord.query
+        .filter(MonthlyRecord.employee_id == employee_id, MonthlyRecord.employeeYear == str(year))
+        .order_by(MonthlyRecord.month_key).all()
+    )
+    rows = (
+        HoursData.query
+        .filter(HoursData.employee_id == employee_id, HoursData.employeeYear == str(year))
+        .order_by(HoursData.id).all()
+    )
+
+    months = {}
+    for record in records:
+        summary = record.row_data or {}
+        months[record.month_key] = {"hours_table": {
+            "work_day_entries": [],
+            "monthly_totals": summary.get("monthly_totals", {}),
+            "paid_totals": summary.get("paid_totals", {}),
+            "tax": summary.get("tax", {}),
+        }}
+    for row in rows:
+        if row.month_key in months:
+            months[row.month_key]["hours_table"]["work_day_entries"].append(row.row_data or {})
+    return months
+
+
+def _years_before(as_of, years):
+    try:
+        return as_of.replace(year=as_of.year - years)
+    except ValueError:
+        return as_of.replace(year=as_of.year - years, day=28)   # 29/02
+
+
+def _reduced_clause(young_cutoff, old_cutoff):
+    # date_of_birth is stored as zero-padded YYYY-MM-DD (or NULL) -> string compare is date compare
+    dob = MonthlyRecord.date_of_birth
+    return or_(dob.is_(None), dob > young_cutoff, dob <= old_cutoff)
+
+
+def _cutoffs(month_key):
+    as_of = employer_totals.month_end(month_key)
+    return (
+        _years_before(as_of, employer_totals.REDUCED_MIN_AGE).isoformat(),
+        _years_before(as_of, employer_totals.REDUCED_MAX_AGE).isoformat(),
+    )
+
+
+def _totals_columns(reduced):
+    gross = MonthlyRecord.gross_taxable
+    return [
+        *[func.coalesce(func.sum(getattr(MonthlyRecord, name)), 0.0) for name in employer_totals.TAX_FIELDS],
+        func.count(MonthlyRecord.id),
+        func.coalesce(func.sum(case((reduced, gross), else_=0.0)), 0.0),
+        func.coalesce(func.sum(case((reduced, 1), else_=0)), 0),
+    ]
+
+
+def _totals_from_row(values):
+    fields = employer_totals.TAX_FIELDS
+    totals = {name: float(values[i]) for i, name in enumerate(fields)}
+    count, reduced_salary, reduced_count = values[len(fields):]
+    totals.update({
+        "employee_count": int(count),
+        "reduced_salary": float(reduced_salary),
+        "reduced_count": int(reduced_count),
+        "regular_salary": totals["gross_taxable"] - float(reduced_salary),
+        "regular_count": int(count) - int(reduced_count),
+    })
+    return totals
+
+
+def month_totals(month_key):
+    """Raw 102 totals of one month, reduced/regular split done in SQL."""
+    row = (
+        db.session.query(*_totals_columns(_reduced_clause(*_cutoffs(month_key))))
+        .filter(MonthlyRecord.month_key == month_key)
+        .one()
+    )
+    return employer_totals.with_derived_totals(_totals_from_row(row))
+
+
+def yearly_months(employee_id, year, month_key, tax):
+    """
+    yearly_totals.record_month() answered from MonthlyRecord: one GROUP BY
+    query gives the year's saved months, this month's values come from tax
+    (it is mirrored after the totals are computed). Returns (totals of
+    month_key, {later month_key: totals} when this month's values changed).
+    """
+    columns = [
+        func.coalesce(func.sum(getattr(MonthlyRecord, name)), 0.0) if hasattr(MonthlyRecord, name) else literal(0.0)
+        for name in yearly_totals.YEARLY_FIELDS
+    ]
+    rows = (
+        db.session.query(MonthlyRecord.month_key, *columns)
+        .filter(MonthlyRecord.employee_id == int(employee_id), MonthlyRecord.employeeYear == str(year))
+        .group_by(MonthlyRecord.month_key)
+        .order_by(MonthlyRecord.month_key)
+        .all()
+    )
+    monthly = {row[0]: [float(v) for v in row[1:]] for row in rows}
+    new_values = yearly_totals.tax_vector(tax)
+    stored = [hasattr(MonthlyRecord, name) for name in yearly_totals.YEARLY_FIELDS]
+    old_values = monthly.get(month_key)
+    changed = old_values is None or any(s and a != b for s, a, b in zip(stored, old_values, new_values))
+    monthly[month_key] = new_values
+
+    prefix, running = {}, [0.0] * len(new_values)
+    for key in sorted(monthly):
+        running = [round(a + b, 6) for a, b in zip(running, monthly[key])]
+        prefix[key] = running
+    later = [key for key in sorted(monthly) if key > month_key] if changed else []
+    return (
+        yearly_totals.format_totals(prefix[month_key]),
+        {key: yearly_totals.format_totals(prefix[key]) for key in later},
+    )
@@ -0,0 +1,348 @@
+import os, json, re, threading, uuid
+from collections import OrderedDict
+
+import file_store
+
+# ----------------------
+# Sharded Hours Store
+# ----------------------
+#
+# hours_data/hours_data_{year}/
+#   manifest.json                       -> {"employees": {emp_id: {"employee_name": ..., "months": [...]}}}
+#   revision                            -> changes on every save (a few bytes)
+#   shards/{emp_id}/{yyyy-mm}.json      -> {"hours_table": {...}}
+#
+# A save rewrites only the employee-month shard (plus the small manifest when
+# a new month or a renamed employee shows up). Year-wide readers go through
+# iter_year() / load_year(); whole-year reads are served from an in-process
+# LRU cache that every write in this module invalidates.
+#
+# Writes are atomic (temp file + rename). The manifest is rewritten, under a
+# cross-process lock, only when a save adds a month or an employee (or renames
+# one); a save that only changes a shard rewrites the tiny revision file
+# instead, so saves of a year do not queue on one lock. The year caches of
+# other worker processes check the manifest and revision stats and reload.
+
+MANIFEST_NAME = "manifest.json"
+REVISION_NAME = "revision"
+SHARDS_DIR = "shards"
+
+
+def year_folder(base_dir, year):
+    return os.path.join(base_dir, f"hours_data_{year}")
+
+
+def _safe_part(value):
+    return re.sub(r"[^\w\-]", "_", str(value))
+
+
+def shard_path(base_dir, year, employee_id, month_key):
+    return os.path.join(
+        year_folder(base_dir, year), SHARDS_DIR,
+        _safe_part(employee_id), f"{_safe_part(month_key)}.json"
+    )
+
+
+def manifest_path(base_dir, year):
+    return os.path.join(year_folder(base_dir, year), MANIFEST_NAME)
+
+
+def revision_path(base_dir, year):
+    return os.path.join(year_folder(base_dir, year), REVISION_NAME)
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    file_store.write_json(path, data)
+
+
+# ----------------------
+# Manifest
+# ----------------------
+
+def _ensure_sharded(base_dir, year):
+    if not os.path.exists(manifest_path(base_dir, year)):
+        with file_store.lock(manifest_path(base_dir, year)):
+            # another worker may have migrated while we waited
+            if not os.path.exists(manifest_path(base_dir, year)):
+                migrate_legacy_year(base_dir, year)
+
+
+def load_manifest(base_dir, year):
+    _ensure_sharded(base_dir, year)
+    manifest = _read_json(manifest_path(base_dir, year), {})
+    manifest.setdefault("employees", {})
+    return manifest
+
+
+def _save_manifest(base_dir, year, manifest):
+    _write_json(manifest_path(base_dir, year), manifest)
+
+
+def _bump_revision(base_dir, year):
+    # unique content -> a new stat for every save, no lock needed (atomic replace)
+    file_store.atomic_write(revision_path(base_dir, year), uuid.uuid4().hex)
+
+
+_listed_cache = {}      # manifest path -> (stat, {emp_id: (employee_name, set of months)})
+_listed_lock = threading.Lock()
+
+
+def _is_listed(base_dir, year, employee_id, employee_name, month_key):
+    """True when the manifest already has this employee-month (and name): no manifest write needed."""
+    path = manifest_path(base_dir, year)
+    stat = _file_stat(path)
+    with _listed_lock:
+        cached = _listed_cache.get(path)
+    if cached is None or cached[0] != stat:
+        employees = load_manifest(base_dir, year)["employees"]
+        listed = {emp: (e.get("employee_name", ""), set(e.get("months", []))) for emp, e in employees.items()}
+        with _listed_lock:
+            _listed_cache[path] = cached = (stat, listed)
+    name, months = cached[1].get(employee_id, ("", set()))
+    return month_key in months and (not employee_name or name == employee_name)
+
+
+def _file_stat(path):
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def migrate_legacy_year(base_dir, year):
+    """Split a legacy hours_data_{year}.json blob into shards (runs once per year)."""
+    folder = year_folder(base_dir, year)
+    legacy_path = os.path.join(folder, f"hours_data_{year}.json")
+    if not os.path.exists(legacy_path):
+        return False
+
+    with file_store.lock(manifest_path(base_dir, year)):
+        if not os.path.exists(legacy_path):
+            return False    # migrated by another worker while we waited
+        _migrate(base_dir, year, folder, legacy_path)
+    return True
+
+
+def _migrate(base_dir, year, folder, legacy_path):
+    legacy = _read_json(legacy_path, {})
+    manifest = {"employees": {}}
+
+    for emp_id, emp_data in legacy.items():
+        if not isinstance(emp_data, dict):
+            continue
+        entry = {"employee_name": emp_data.get("employee_name", ""), "months": []}
+        for month_key, month_data in emp_data.items():
+            if month_key == "employee_name":
+                continue
+            _write_json(shard_path(base_dir, year, emp_id, month_key), month_data)
+            entry["months"].append(month_key)
+        entry["months"].sort()
+        manifest["employees"][str(emp_id)] = entry
+
+    _save_manifest(base_dir, year, manifest)
+    year_cache.invalidate(base_dir, year)
+
+    # Keep the original blob around, but make it clear it is no longer read
+    os.replace(legacy_path, os.path.join(folder, f"hours_data_{year}.legacy.json"))
+
+
+# ----------------------
+# Read / Write One Employee-Month
+# ----------------------
+
+def load_month(base_dir, year, employee_id, month_key):
+    if not employee_id:
+        return {}
+    _ensure_sharded(base_dir, year)
+    return _read_json(shard_path(base_dir, year, employee_id, month_key), {})
+
+
+def save_month(base_dir, year, employee_id, employee_name, month_key, month_data):
+    employee_id = str(employee_id)
+    _ensure_sharded(base_dir, year)
+
+    _write_json(shard_path(base_dir, year, employee_id, month_key), month_data)
+
+    if _is_listed(base_dir, year, employee_id, employee_name, month_key):
+        _bump_revision(base_dir, year)
+    else:
+        _update_manifest(base_dir, year, [(employee_id, employee_name, month_key)])
+    year_cache.invalidate(base_dir, year)
+
+
+def _update_manifest(base_dir, year, items):
+    with file_store.lock(manifest_path(base_dir, year)):
+        manifest = load_manifest(base_dir, year)
+        for employee_id, employee_name, month_key in items:
+            entry = manifest["employees"].setdefault(str(employee_id), {"employee_name": "", "months": []})
+            if employee_name and entry.get("employee_name") != employee_name:
+                entry["employee_name"] = employee_name
+            if month_key not in entry["months"]:
+                entry["months"] = sorted(entry["months"] + [month_key])
+        manifest.pop("revision", None)      # older layout kept a counter here
+        _save_manifest(base_dir, year, manifest)
+    _bump_revision(base_dir, year)
+
+
+def save_months(base_dir, year, items):
+    """save_month() for many (employee_id, employee_name, month_key, month_data), one manifest write."""
+    _ensure_sharded(base_dir, year)
+    for employee_id, _, month_key, month_data in items:
+        _write_json(shard_path(base_dir, year, str(employee_id), month_key), month_data)
+
+    missing = [(str(e), n, k) for e, n, k, _ in items if not _is_listed(base_dir, year, str(e), n, k)]
+    if missing:
+        _update_manifest(base_dir, year, missing)
+    else:
+        _bump_revision(base_dir, year)
+    year_cache.invalidate(base_dir, year)
+
+
+def load_employee(base_dir, year, employee_id):
+    """Return {month_key: month_data} for one employee in one year."""
+    manifest = load_manifest(base_dir, year)
+    entry = manifest["employees"].get(str(employee_id))
+    if not entry:
+        return {}
+
+    months = {}
+    for month_key in entry.get("months", []):
+        months[month_key] = _read_json(shard_path(base_dir, year, employee_id, month_key), {})
+    return months
+
+
+# ----------------------
+# Year-Wide Access
+# ----------------------
+
+def iter_year(base_dir, year, month_key=None):
+    """Yield (employee_id, employee_name, month_key, month_data) for every shard of the year."""
+    manifest = load_manifest(base_dir, year)
+    for emp_id, entry in manifest["employees"].items():
+        for mk in entry.get("months", []):
+            if month_key and mk != month_key:
+                continue
+            path = shard_path(base_dir, year, emp_id, mk)
+            yield emp_id, entry.get("employee_name", ""), mk, _read_json(path, {})
+
+
+def _read_year(base_dir, year):
+    all_hours = {}
+    for emp_id, employee_name, month_key, month_data in iter_year(base_dir, year):
+        emp = all_hours.setdefault(emp_id, {"employee_name": employee_name})
+        emp[month_key] = month_data
+    return all_hours
+
+
+def load_year(base_dir, year):
+    """Rebuild the legacy {emp_id: {"employee_name": ..., month_key: {...}}} shape (private copy)."""
+    return json.loads(load_year_json(base_dir, year))
+
+
+def load_year_json(base_dir, year):
+    """The whole year serialized once, e.g. for embedding into a page."""
+    return year_cache.get(base_dir, year)
+
+
+def save_year(base_dir, year, data):
+    for emp_id, emp_data in (data or {}).items():
+        if not isinstance(emp_data, dict):
+            continue
+        employee_name = emp_data.get("employee_name", "")
+        for month_key, month_data in emp_data.items():
+            if month_key == "employee_name":
+                continue
+            save_month(base_dir, year, emp_id, employee_name, month_key, month_data)
+
+
+# ----------------------
+# Year Cache
+# ----------------------
+
+YEAR_CACHE_SIZE = int(os.getenv("HOURS_CACHE_YEARS", "4"))
+
+
+class YearCache:
+    """
+    LRU of serialized years keyed by (base_dir, year). Each key has a write
+    generation bumped by save_month/migration; the manifest and revision file
+    stats are checked too, so a year saved by another process is not served stale.
+    Callers get the JSON text (or a fresh copy via load_year), never a shared
+    dict they could mutate.
+    """
+
+    def __init__(self, max_years=YEAR_CACHE_SIZE):
+        self.max_years = max(1, int(max_years))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (generation, manifest_stat, text)
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(base_dir, year):
+        return (os.path.abspath(base_dir), str(year))
+
+    @staticmethod
+    def _manifest_stat(base_dir, year):
+        return (_file_stat(manifest_path(base_dir, year)), _file_stat(revision_path(base_dir, year)))
+
+    def invalidate(self, base_dir, year):
+        key = self._key(base_dir, year)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def get(self, base_dir, year):
+        key = self._key(base_dir, year)
+        _ensure_sharded(base_dir, year)
+        stat = self._manifest_stat(base_dir, year)
+
+        with self._lock:
+            generation = self._generations.get(key, 0)
+            entry = self._entries.get(key)
+            if entry and entry[0] == generation and entry[1] == stat:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        text = json.dumps(_read_year(base_dir, year), ensure_ascii=False)
+
+        with self._lock:
+            # a write that landed while we were reading wins -> do not cache
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = (generation, stat, text)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_years:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return text
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "cached_years": [k[1] for k in self._entries],
+                "cached_bytes": sum(len(e[2]) for e in self._entries.values()),
+                "max_years": self.max_years,
+            }
+
+
+year_cache = YearCache()
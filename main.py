@@ -1,15 +1,15 @@
 # -----------------------------
 from uuid import uuid4
-import os, csv, json, logging, calendar, re, secrets
+import os, io, csv, json, logging, calendar, re, secrets
 from dotenv import load_dotenv
 from functools import wraps
 from flask_login import LoginManager, login_user, logout_user, login_required as flask_login_required, current_user
-from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, session, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, send_file, session, flash, has_request_context
 from flask_session import Session
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import disconnect
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_mail import Mail, Message
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -18,6 +18,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from sqlalchemy import Text
 import time
+import click
 from datetime import datetime, timedelta, timezone
 import pandas as pd
 import numpy as np
@@ -28,6 +29,23 @@ import openpyxl, xlsxwriter
 # -----------------------------
 from database import db, EmployeeData, MonthlyRecord, HoursData, PasswordResetToken, CustomerForm, TaxCredit, BankAccount , Invoice , Product, Timesheet, User
 from data import get_employees, add_employee
+import hours_store
+import file_store
+import hours_export
+from export_worker import ExportQueue
+import xlsx_export
+import employer_totals
+import yearly_totals
+import hours_sql
+import clock_store
+import clock_archive
+import time_engine
+import work_calendar
+import anomaly_scanner
+import payroll_engine
+import payroll_jobs
+from employee_identity import identity_cache, DEFAULT_COMPANY
+import presence
 
 # -----------------------------
 # Init .env + Flask 
@@ -36,7 +54,9 @@ load_dotenv()
 app = Flask(__name__, static_folder="static")
 
 # Correct SocketIO init
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# SOCKETIO_MESSAGE_QUEUE (e.g. redis://) is needed once more than one worker serves sockets
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading',
+                    message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE"))
 
 @socketio.on('connect')
 def handle_connect():
@@ -535,12 +555,17 @@ def delete_selected_users():
         flash("לא נבחרו משתמשים למחיקה", "warning")
         return redirect(url_for('clients'))
 
+    unlinked = []
     for user_id in ids:
         user = User.query.get(user_id)
         if user:
+            # their employee rows lose user_id
+            unlinked += [employee.id for employee in user.employee_profile]
             db.session.delete(user)
 
     db.session.commit()
+    for employee_id in unlinked:
+        identity_cache.invalidate(employee_id)
 
     flash(f"נמחקו {len(ids)} משתמשים", "success")
     return redirect(url_for('clients'))
@@ -675,23 +700,9 @@ def format_date_for_input(date_str):
 # Getting Days in a Month Holidays Weekend: Form 
 # ----------------------
 
-#  Generate full day list with Hebrew weekday names
+#  Full day list with Hebrew weekday names, served from the precomputed work calendar
 def get_days_in_month(year, month):
-    num_days = calendar.monthrange(int(year), int(month))[1]
-    hebrew_days = ['ראשון', 'שני', 'שלישי', 'רביעי', 'חמישי', 'שישי', 'שבת']
-    days_data = []
-
-    for day in range(1, num_days + 1):
-        date = datetime(int(year), int(month), day)
-        hebrew_day = hebrew_days[date.weekday()]
-        formatted_date = date.strftime('%d-%m-%Y')
-
-        days_data.append({
-            "day": hebrew_day,
-            "date": formatted_date
-        })
-
-    return days_data
+    return list(work_calendar.month_days(int(year), int(month)))
 
 @app.template_filter('format_date')
 @login_required
@@ -735,22 +746,9 @@ def calculate_hours(start_time_str, end_time_str):
     """
     Calculate total hours between start and end times.
     Handles overnight shifts (e.g., 22:00 → 02:00).
-    Returns float hours.
+    Returns float hours (0.0 when a time is missing).
     """
-    fmt = "%H:%M"
-    try:
-        start = datetime.strptime(start_time_str, fmt)
-        end = datetime.strptime(end_time_str, fmt)
-
-        # If end time is earlier than start → assume next day
-        if end < start:
-            end += timedelta(days=1)
-
-        diff = end - start
-        return round(diff.total_seconds() / 3600, 2)
-
-    except Exception:
-        return 0.0
+    return time_engine.calculate_hours(start_time_str, end_time_str)
 
 
 # ----------------------
@@ -770,10 +768,17 @@ def get_clock_file(employee_name, year, month):
     return os.path.join(month_folder, filename)
 
 
-def load_clock_hours(employee_name, year, month):
+def load_clock_hours(employee_name, year, month, employee_id=None):
     file_path = get_clock_file(employee_name, year, month)
 
     if not os.path.exists(file_path):
+        # closed months live in the yearly archive (see close_clock_year)
+        archive = clock_archive.open_archive(BASE_DIR, year)
+        if archive is not None:
+            archived_id = employee_id or archive.find_by_file_name(employee_name.replace(" ", "_"))
+            if archived_id is not None and archive.has_month(archived_id, month):
+                return archive.month_document(archived_id, month)
+
         return {
             "employee_id": "",
             "employee_name": employee_name,
@@ -809,9 +814,74 @@ def save_clock_hours_file(employee_name, year, month, data):
     data.setdefault("id_number", "")
     data.setdefault("hours_table_clock", {"work_day_entries": []})
 
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    file_store.write_json(file_path, data)
+
+
+# ----------------------
+# Clock Punches In SQL (Timesheet), month JSON as export
+# ----------------------
+
+def ensure_clock_month(employee, year, month):
+    # A legacy month file (or archived month) is imported into Timesheet rows before the month is touched
+    if clock_store.month_has_rows(employee.id, year, month):
+        return
+    data = load_clock_hours(employee.employee_name.replace(" ", "_"), year, month, employee_id=employee.id)
+    entries = data.get("hours_table_clock", {}).get("work_day_entries", [])
+    if entries:
+        clock_store.import_month_entries(employee, year, month, entries)
+
+
+def load_clock_month(employee, year, month):
+    ensure_clock_month(employee, year, month)
+    return clock_store.month_document(employee.id, employee.employee_name, employee.id_number, year, month)
+
+
+def write_clock_month_file(employee_id, employee_name, id_number, year, month):
+    with app.app_context():
+        data = clock_store.month_document(employee_id, employee_name, id_number, year, month)
+
+    safe_name = employee_name.replace(" ", "_")
+    if data["hours_table_clock"]["work_day_entries"]:
+        save_clock_hours_file(safe_name, year, month, data)
+    else:
+        # month was deleted -> no empty file left behind
+        file_path = get_clock_file(safe_name, year, month)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def submit_clock_export(employee, year, month):
+    month = str(month).zfill(2)
+    file_path = get_clock_file(employee.employee_name.replace(" ", "_"), year, month)
+    return export_queue.submit(
+        export_key(file_path), write_clock_month_file,
+        employee.id, employee.employee_name, employee.id_number, str(year), month
+    )
+
+
+# ----------------------
+# Presence Board (live who-is-in for managers)
+# ----------------------
+
+def publish_presence(employee, row):
+    # The board decides which rows change who is in (today's, yesterday's night shift)
+    if employee is None or row is None:
+        return None
+    delta = presence.board.update(employee, row)
+    if delta:
+        socketio.emit('presence_delta', delta, to=presence.room(delta["company"]))
+        socketio.emit('presence_delta', delta, to=presence.room(presence.ALL_COMPANIES))
+    return delta
+
 
+def presence_company_for_session(requested=None):
+    """Company whose board this session may watch, or None."""
+    if session.get("owner_access"):
+        return requested or presence.ALL_COMPANIES
+    if session.get("role") == "manager":
+        manager = identity_cache.get(session.get("employee_id"))
+        return manager.company if manager else DEFAULT_COMPANY
+    return None
 
 
 def normalize_keys(data_dict):
@@ -855,7 +925,7 @@ def timesheet():
         return redirect(url_for("clock_in_out"))
 
     # טוענים את העובד
-    employee = EmployeeData.query.get(employee_id)
+    employee = identity_cache.get(employee_id)
     if not employee:
         flash("שגיאה: העובד לא נמצא.", "danger")
         return redirect(url_for("clock_in_out"))
@@ -885,9 +955,8 @@ def timesheet():
     session["timesheet_month"] = selected_month
     session["timesheet_year"] = selected_year
 
-    # === LOAD JSON FILE ===
-    employee_name = employee.employee_name.replace(" ", "_")
-    month_data = load_clock_hours(employee_name, selected_year, selected_month)
+    # === LOAD MONTH (Timesheet rows) ===
+    month_data = load_clock_month(employee, selected_year, selected_month)
 
     # מבטיחים שהקובץ מכיל נתוני עובד
     month_data["employee_id"] = employee_id
@@ -897,20 +966,9 @@ def timesheet():
     hours_table_clock = month_data.get("hours_table_clock", {"work_day_entries": []})
     timesheet_data = hours_table_clock.get("work_day_entries", [])
 
-    # === CALCULATE HOURS ===
-    for row in timesheet_data:
-        st = row.get("start_time")
-        et = row.get("end_time")
-
-        if st and et:
-            st_dt = datetime.strptime(st, "%H:%M")
-            et_dt = datetime.strptime(et, "%H:%M")
-            if et_dt < st_dt:
-                et_dt += timedelta(days=1)
-            diff = et_dt - st_dt
-            row["totalHours"] = round(diff.total_seconds() / 3600, 2)
-        else:
-            row["totalHours"] = ""
+    # === CALCULATE HOURS (whole month in one pass, multi-shift days merged) ===
+    for row, total in zip(timesheet_data, time_engine.entries_hours(timesheet_data)):
+        row["totalHours"] = total
 
     return render_template(
         "timesheet.html",
@@ -935,9 +993,7 @@ def api_save_timesheet():
     data = request.get_json()
 
     employee_id = str(data.get("employee_id"))
-    employee = EmployeeData.query.get(employee_id)
-    employee_name = employee.employee_name.replace(" ", "_")
-    id_number = employee.id_number
+    employee = identity_cache.get(employee_id)
 
     date_str = data.get("date")
     start_iso = data.get("startTime")
@@ -947,45 +1003,18 @@ def api_save_timesheet():
     start_hm = start_iso[11:16]
     end_hm = end_iso[11:16]
 
-    st = datetime.strptime(start_hm, "%H:%M")
-    et = datetime.strptime(end_hm, "%H:%M")
-    if et < st:
-        et += timedelta(days=1)
-    total_hours = round((et - st).total_seconds() / 3600, 2)
-
     year, month, _ = date_str.split("-")
 
-    db = load_clock_hours(employee_name, year, month)
-
-    db["employee_id"] = employee_id
-    db["employee_name"] = employee.employee_name
-    db["id_number"] = id_number
-
-    entries = db["hours_table_clock"]["work_day_entries"]
-
-    entry = next((e for e in entries if e["date"] == date_str), None)
-
-    if not entry:
-        entry = {
-            "date": date_str,
-            "day": "",
-            "saturday": "",
-            "holiday": "",
-            "start_time": "",
-            "end_time": "",
-            "task": "",
-            "totalHours": ""
-        }
-        entries.append(entry)
-
-    entry["start_time"] = start_hm
-    entry["end_time"] = end_hm
-    entry["task"] = task
-    entry["totalHours"] = str(total_hours)
-
-    save_clock_hours_file(employee_name, year, month, db)
+    # Single row upsert (the day becomes one shift), month file follows in the background
+    ensure_clock_month(employee, year, month)
+    row = clock_store.upsert_day(
+        employee, date_str, {"task": task},
+        prepare=lambda r: clock_store.set_times(r, start_hm, end_hm)
+    )
+    submit_clock_export(employee, year, month)
+    publish_presence(employee, row)
 
-    return jsonify({"success": True, "entry": entry})
+    return jsonify({"success": True, "entry": clock_store.to_entry(row)})
 
 
 # ----------------------
@@ -1003,60 +1032,27 @@ def api_clockin():
     emp_id = str(emp_id)
 
     # Load employee info
-    employee = EmployeeData.query.get(emp_id)
+    employee = identity_cache.get(emp_id)
     if not employee:
         return {"status": "error", "message": "Employee not found"}, 400
 
-    employee_name = employee.employee_name.replace(" ", "_")
-    id_number = employee.id_number
-
     now = datetime.now()
     date_str = now.strftime("%Y-%m-%d")
     time_str = now.strftime("%H:%M")
 
     year, month, _ = date_str.split('-')
 
-    #  Load the correct file for this employee + month
-    db = load_clock_hours(employee_name, year, month)
-
-    #  Ensure employee info exists in JSON
-    db["employee_id"] = emp_id
-    db["employee_name"] = employee.employee_name
-    db["id_number"] = id_number
-
-    hours_table = db.setdefault("hours_table_clock", {
-        "work_day_entries": []
-    })
-
-    # Find existing entry for today
-    day = next(
-        (d for d in hours_table["work_day_entries"] if d.get("date") == date_str),
-        None
+    # Open a new shift (today's row is created if missing)
+    ensure_clock_month(employee, year, month)
+    row = clock_store.upsert_day(
+        employee, date_str, {},
+        defaults=clock_store.day_defaults(now),
+        prepare=lambda r: clock_store.punch_in(r, now)
     )
 
-    # If no entry exists → create one
-    if not day:
-        weekday = now.weekday()  # 0=Mon, 6=Sun
-        hebrew_days = ["שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת", "ראשון"]
-
-        day = {
-            "date": date_str,
-            "day": hebrew_days[weekday],
-            "saturday": "שבת" if weekday == 5 else "",
-            "holiday": "",
-            "start_time": "",
-            "end_time": "",
-            "task": "",
-            "totalHours": ""
-        }
-
-        hours_table["work_day_entries"].append(day)
-
-    # Update start time ONLY
-    day["start_time"] = time_str
-
-    #  Save file for this employee + month
-    save_clock_hours_file(employee_name, year, month, db)
+    #  Month file for this employee + month is rebuilt in the background
+    submit_clock_export(employee, year, month)
+    publish_presence(employee, row)
 
     return {"status": "ok", "start": time_str}
 
@@ -1075,13 +1071,10 @@ def api_clockout():
     emp_id = str(emp_id)
 
     # Load employee info
-    employee = EmployeeData.query.get(emp_id)
+    employee = identity_cache.get(emp_id)
     if not employee:
         return {"status": "error", "message": "Employee not found"}, 400
 
-    employee_name = employee.employee_name.replace(" ", "_")
-    id_number = employee.id_number
-
     data = request.get_json()
     task = (data.get("task") or "").strip()
     end_iso = data.get("endTime")
@@ -1097,59 +1090,24 @@ def api_clockout():
 
     year, month, _ = date_str.split('-')
 
-    #  Load file for this employee + month
-    db = load_clock_hours(employee_name, year, month)
-
-    #  Ensure employee info exists in JSON
-    db["employee_id"] = emp_id
-    db["employee_name"] = employee.employee_name
-    db["id_number"] = id_number
-
-    hours_table = db.setdefault("hours_table_clock", {
-        "work_day_entries": []
-    })
-
-    # Find today's entry
-    day = next(
-        (d for d in hours_table["work_day_entries"] if d.get("date") == date_str),
-        None
+    # Today's row, or yesterday's when a night shift is still open there
+    ensure_clock_month(employee, year, month)
+    day = clock_store.get_day(employee.id, date_str)
+    previous = clock_store.get_day(employee.id, clock_store.previous_day(date_str))
+    day = clock_store.open_row(day, previous) or day
+    if day is not None and day.date != date_str:
+        year, month, _ = day.date.split('-')
+
+    # Close the shift (total = merged shifts of the day) + task
+    day = clock_store.upsert_day(
+        employee, day.date if day is not None else date_str, {"task": task},
+        defaults=clock_store.day_defaults(end_dt), row=day,
+        prepare=lambda r: clock_store.punch_out(r, end_dt)
     )
 
-    # If no entry exists → create one
-    if not day:
-        weekday = end_dt.weekday()
-        hebrew_days = ["שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת", "ראשון"]
-
-        day = {
-            "date": date_str,
-            "day": hebrew_days[weekday],
-            "saturday": "שבת" if weekday == 5 else "",
-            "holiday": "",
-            "start_time": "",
-            "end_time": "",
-            "task": "",
-            "totalHours": ""
-        }
-        hours_table["work_day_entries"].append(day)
-
-    # Update end time + task
-    day["end_time"] = time_str
-    day["task"] = task
-
-    # Calculate total hours only if start exists
-    if day["start_time"]:
-        start_dt = datetime.strptime(f"{date_str} {day['start_time']}", "%Y-%m-%d %H:%M")
-        end_dt2 = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-
-        # Night shift fix
-        if end_dt2 < start_dt:
-            end_dt2 += timedelta(days=1)
-
-        diff_hours = round((end_dt2 - start_dt).total_seconds() / 3600, 2)
-        day["totalHours"] = str(diff_hours)
-
-    #  Save file for this employee + month
-    save_clock_hours_file(employee_name, year, month, db)
+    #  Month file for this employee + month is rebuilt in the background
+    submit_clock_export(employee, year, month)
+    publish_presence(employee, day)
 
     return {"status": "ok", "end": time_str, "task": task}
 
@@ -1197,14 +1155,12 @@ def clock_in_out():
         session["selected_year"] = selected_year
 
     # === Load employee info ===
-    emp = EmployeeData.query.get(employee_id)
+    emp = identity_cache.get(employee_id)
     if not emp:
         return redirect(url_for("clock_in_out"))
 
-    employee_name = emp.employee_name.replace(" ", "_")
-
-    # === LOAD NEW CLOCK FILE ===
-    month_data = load_clock_hours(employee_name, selected_year, selected_month)
+    # === LOAD MONTH (Timesheet rows) ===
+    month_data = load_clock_month(emp, selected_year, selected_month)
 
     #  Inject employee info if missing
     month_data["employee_id"] = employee_id
@@ -1253,67 +1209,23 @@ def save_clock_hours():
         return jsonify({"status": "error", "message": "Missing employee/month/year"}), 400
 
     # Load employee info
-    employee = EmployeeData.query.get(emp_id)
+    employee = identity_cache.get(emp_id)
     if not employee:
         return jsonify({"status": "error", "message": "Employee not found"}), 400
 
-    employee_name = employee.employee_name.replace(" ", "_")
-    id_number = employee.id_number
-
-    # 2. Load existing JSON for this employee + month
-    db = load_clock_hours(employee_name, year, month)
-
-    # ⭐ Ensure employee info is stored in JSON
-    db["employee_id"] = emp_id
-    db["employee_name"] = employee.employee_name
-    db["id_number"] = id_number
-
-    hours_table = db.setdefault("hours_table_clock", {
-        "work_day_entries": []
-    })
+    # 2. Make sure a legacy month file is already in Timesheet rows
+    ensure_clock_month(employee, year, month)
 
     # 3. Incoming entries
     new_entries = data.get("hours_table_clock", {}).get("work_day_entries", [])
     if not isinstance(new_entries, list):
         new_entries = []
 
-    # 4. Build map of existing entries
-    existing_map = {}
-    for d in hours_table.get("work_day_entries", []):
-        date = d.get("date")
-        if date:
-            existing_map[date] = d
-
-    # 5. Merge new entries
-    for entry in new_entries:
-        date = entry.get("date")
-        if not date:
-            continue
-
-        merged = {
-            "date": date,
-            "day": entry.get("day", ""),
-            "saturday": entry.get("saturday", ""),
-            "holiday": entry.get("holiday", ""),
-            "start_time": entry.get("start_time", ""),
-            "end_time": entry.get("end_time", ""),
-            "task": entry.get("task", ""),
-            "totalHours": entry.get("totalHours", "")
-        }
-
-        existing_map[date] = merged
-
-    # 6. Save merged list back (sorted by date)
-    def sort_key(item):
-        try:
-            return datetime.strptime(item["date"], "%Y-%m-%d")
-        except:
-            return datetime.min
+    # 4. Upsert one row per day (rows are read back sorted by date)
+    clock_store.merge_entries(employee, new_entries)
 
-    hours_table["work_day_entries"] = sorted(existing_map.values(), key=sort_key)
-
-    # 7. Save JSON file for this employee + month
-    save_clock_hours_file(employee_name, year, month, db)
+    # 5. Month JSON file is rebuilt in the background
+    submit_clock_export(employee, year, month)
 
     return jsonify({"status": "ok", "message": "Clock hours saved"}), 200
 
@@ -1337,13 +1249,10 @@ def api_record_time():
         return jsonify({"success": False, "message": "Invalid type"}), 400
 
     # Load employee info
-    emp = EmployeeData.query.get(employee_id)
+    emp = identity_cache.get(employee_id)
     if not emp:
         return jsonify({"success": False, "message": "Employee not found"}), 400
 
-    employee_name = emp.employee_name.replace(" ", "_")
-    id_number = emp.id_number
-
     now = datetime.now()
     iso_now = now.isoformat(timespec='minutes')
 
@@ -1354,60 +1263,261 @@ def api_record_time():
     year = now.strftime("%Y")
     month = now.strftime("%m")
 
-    # Load JSON file for this employee + month
-    db = load_clock_hours(employee_name, year, month)
-
-    # Ensure employee info exists in JSON
-    db["employee_id"] = employee_id
-    db["employee_name"] = emp.employee_name
-    db["id_number"] = id_number
-
-    entries = db["hours_table_clock"]["work_day_entries"]
-
-    # Find or create entry for today
-    entry = next((e for e in entries if e["date"] == date_str), None)
-    if not entry:
-        entry = {
-            "date": date_str,
-            "day": now.strftime("%A"),
-            "saturday": "",
-            "holiday": "",
-            "start_time": "",
-            "end_time": "",
-            "task": "",
-            "totalHours": ""
-        }
-        entries.append(entry)
+    # Today's row for this employee (indexed lookup)
+    ensure_clock_month(emp, year, month)
+    row = clock_store.get_day(emp.id, date_str)
 
-    # START → save start_time + task
+    # START → open a shift + task
     if action_type == "START":
-        entry["start_time"] = hm
-        entry["task"] = task
+        fields = {"task": task}
+        punch = clock_store.punch_in
         session["clock_start"] = iso_now
         session["clock_task"] = task
 
-    # END → save end_time + totalHours
-    elif action_type == "END":
-        entry["end_time"] = hm
+    # END → close the open shift (yesterday's when a night shift is still open)
+    else:
+        fields = {}
+        punch = clock_store.punch_out
         session["clock_end"] = iso_now
 
-        # Calculate total hours if start exists
-        if entry["start_time"]:
-            st = datetime.strptime(entry["start_time"], "%H:%M")
-            et = datetime.strptime(hm, "%H:%M")
-            if et < st:
-                et += timedelta(days=1)
-            total_hours = round((et - st).total_seconds() / 3600, 2)
-            entry["totalHours"] = str(total_hours)
+        previous = clock_store.get_day(emp.id, clock_store.previous_day(date_str))
+        row = clock_store.open_row(row, previous) or row
+        if row is not None and row.date != date_str:
+            date_str = row.date
+            year, month, _ = date_str.split('-')
 
-    # Save JSON file
-    save_clock_hours_file(employee_name, year, month, db)
+    row = clock_store.upsert_day(
+        emp, date_str, fields, defaults={"day": now.strftime("%A")}, row=row,
+        prepare=lambda r: punch(r, now)
+    )
+
+    # Month JSON file is rebuilt in the background
+    submit_clock_export(emp, year, month)
+    publish_presence(emp, row)
 
     return jsonify({
         "success": True,
         "timestamp": iso_now,
         "type": action_type,
-        "entry": entry
+        "entry": clock_store.to_entry(row)
+    })
+
+# ----------------------
+# Api Clock Terminal Batch
+# ----------------------
+# Body: {"events": [{"idempotency_key", "employee_id", "type": START/END,
+#                    "timestamp": ISO punch time, "task"}]}
+# Replaying a batch returns the stored result of every known key ("duplicate").
+
+CLOCK_BATCH_MAX = int(os.getenv("CLOCK_BATCH_MAX", 5000))
+
+@app.route('/api/clock/batch', methods=['POST'])
+@login_required
+def api_clock_batch():
+    data = request.get_json(silent=True) or {}
+    events = data.get("events")
+
+    if not isinstance(events, list) or not events:
+        return jsonify({"success": False, "message": "Missing events"}), 400
+    if len(events) > CLOCK_BATCH_MAX:
+        return jsonify({"success": False, "message": f"Too many events (max {CLOCK_BATCH_MAX})"}), 413
+
+    results, changed = clock_store.apply_punch_batch(events, prepare=ensure_clock_month)
+
+    # One background file rebuild per touched employee-month; the rows punches
+    # wrote go to the board (an END after midnight closes yesterday's row,
+    # older days never change it)
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    for (employee, year, month), dates in changed.items():
+        submit_clock_export(employee, year, month)
+        for date in sorted(d for d in dates if d >= yesterday):
+            publish_presence(employee, clock_store.get_day(employee.id, date))
+
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("applied", "duplicate", "error")}
+    return jsonify({"success": counts["error"] == 0, **counts, "results": results})
+
+# ----------------------
+# Presence Board Page (managers / owner)
+# ----------------------
+
+@app.route('/presence_board')
+@manager_required
+def presence_board():
+    company = presence_company_for_session(request.args.get("company"))
+    return render_template("presence_board.html", company=company, role=session.get("role"))
+
+
+@app.route('/api/presence')
+@manager_required
+def api_presence():
+    # plain JSON snapshot (first paint / clients without sockets)
+    return jsonify(presence.board.snapshot(presence_company_for_session(request.args.get("company"))))
+
+# ----------------------
+# Api Clock Anomalies (all employees)
+# ----------------------
+# ?year=2025[&month=05][&kind=...] -> clock anomalies of every employee (cached per month file)
+
+@app.route('/api/clock_anomalies')
+@manager_required
+def api_clock_anomalies():
+    year = str(request.args.get("year", "")).strip()
+    month = str(request.args.get("month", "")).strip()
+
+    if not year.isdigit() or (month and (not month.isdigit() or not 1 <= int(month) <= 12)):
+        return jsonify({"status": "error", "message": "Missing year/month"}), 400
+
+    result = anomaly_scanner.scan(BASE_DIR, year, [int(month)] if month else None)
+    kind = request.args.get("kind")
+    if kind:
+        result["anomalies"] = [a for a in result["anomalies"] if a["kind"] == kind]
+    return jsonify({"status": "ok", **result})
+
+# ----------------------
+# Payroll Run (month close, background job)
+# ----------------------
+# POST ?year=2025&month=05 -> queue the month close of every active employee
+# GET  ?year=2025&month=05 -> job state + progress (also pushed to managers over Socket.IO)
+
+@app.route('/payroll/run', methods=['GET', 'POST'])
+@manager_required
+def payroll_run():
+    year = str(request.args.get("year", "")).strip()
+    month = str(request.args.get("month", "")).strip().zfill(2)
+
+    if not year.isdigit() or not month.isdigit() or not 1 <= int(month) <= 12:
+        return jsonify({"status": "error", "message": "Missing year/month"}), 400
+
+    key = payroll_jobs.run_key(year, month)
+    if request.method == 'POST':
+        queued = jobs.queued(key)
+        status = jobs.queue.submit(key, jobs.run_payroll_month, year, month)
+        return jsonify({"status": "ok", **status, **queued}), 202
+
+    status = jobs.queue.status(key) or {"key": key, "state": "unknown"}
+    return jsonify({"status": "ok", **status, **jobs.progress.get(key, {})})
+
+# ----------------------
+# Payroll Retro Rate Change (background job)
+# ----------------------
+# POST {"employee_id", "effective_date": "2025-03-01", "values": {"hourly_rate": "62"}} -> queue a retro change
+# GET  ?employee_id=7 -> job state, progress and the old / new report per month
+
+@app.route('/payroll/retro', methods=['GET', 'POST'])
+@manager_required
+def payroll_retro():
+    if request.method == 'GET':
+        employee_id = str(request.args.get("employee_id", "")).strip()
+        key = payroll_jobs.retro_key(employee_id)
+        status = jobs.queue.status(key) or {"key": key, "state": "unknown"}
+        return jsonify({"status": "ok", **status, **jobs.progress.get(key, {}), "report": jobs.reports.get(key)})
+
+    data = request.get_json(silent=True) or {}
+    employee_id = str(data.get("employee_id", "")).strip()
+    effective_date = str(data.get("effective_date", "")).strip()
+    values = data.get("values") or {}
+
+    if not employee_id.isdigit() or not identity_cache.get(employee_id):
+        return jsonify({"status": "error", "message": "Employee not found"}), 400
+    try:
+        datetime.strptime(effective_date, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"status": "error", "message": "effective_date must be YYYY-MM-DD"}), 400
+    unknown = [name for name in values if name not in payroll_jobs.RETRO_FIELDS] if isinstance(values, dict) else ["values"]
+    if unknown or not values:
+        return jsonify({"status": "error", "message": f"Not a rate field: {', '.join(unknown) or 'values'}"}), 400
+
+    key = payroll_jobs.retro_key(employee_id)
+    queued = jobs.queued(key)
+    status = jobs.queue.submit(key, jobs.run_retro_change, employee_id, effective_date, values)
+    return jsonify({"status": "ok", **status, **queued}), 202
+
+# ----------------------
+# Api Payroll Recompute (one edit)
+# ----------------------
+# POST {"employee_id", "year", "month", "entries": [day rows], "fields": {tax input: value}}
+# -> recompute only the dependent fields of that month, return what changed
+
+@app.route('/api/payroll/recompute', methods=['POST'])
+@manager_required
+def api_payroll_recompute():
+    data = request.get_json(silent=True) or {}
+    year = str(data.get("year", "")).strip()
+    month = str(data.get("month", "")).strip().zfill(2)
+    employee_id = str(data.get("employee_id", "")).strip()
+    entries = data.get("entries") or []
+    fields = data.get("fields") or {}
+
+    if not year.isdigit() or not month.isdigit() or not 1 <= int(month) <= 12:
+        return jsonify({"status": "error", "message": "Missing year/month"}), 400
+    if not employee_id.isdigit():
+        return jsonify({"status": "error", "message": "Invalid employee_id"}), 400
+    unknown = [name for name in fields if name not in payroll_engine.INPUT_FIELDS]
+    if not isinstance(entries, list) or unknown:
+        return jsonify({"status": "error", "message": f"Not an input field: {', '.join(unknown)}"}), 400
+
+    try:
+        changes = jobs.recompute_payroll_month(year, employee_id, month, entries, fields)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "ok", "changes": changes})
+
+# ----------------------
+# Api Payroll Month (tax form of every employee)
+# ----------------------
+# ?year=2025&month=05[&employee_id=7] -> tax form (paid row + salary, deductions, net) per employee
+
+@app.route('/api/payroll_month')
+@manager_required
+def api_payroll_month():
+    year = str(request.args.get("year", "")).strip()
+    month = str(request.args.get("month", "")).strip().zfill(2)
+    employee_id = str(request.args.get("employee_id", "")).strip()
+
+    if not year.isdigit() or not month.isdigit() or not 1 <= int(month) <= 12:
+        return jsonify({"status": "error", "message": "Missing year/month"}), 400
+    if employee_id and not employee_id.isdigit():
+        return jsonify({"status": "error", "message": "Invalid employee_id"}), 400
+
+    results = jobs.payroll_month(year, month, [employee_id] if employee_id else None)
+    return jsonify({
+        "status": "ok",
+        "year": year,
+        "month": month,
+        "employees": {str(k): v for k, v in results.items()},
+    })
+
+# ----------------------
+# Api Overtime Month (clock hours classified on the server)
+# ----------------------
+# ?year=2025&month=05[&employee_id=7][&holidays=calendar] -> index hours-table rows per employee
+# (holidays=calendar: rest days from work_calendar instead of the formulas.js list)
+
+@app.route('/api/overtime_month')
+@manager_required
+def api_overtime_month():
+    year = str(request.args.get("year", "")).strip()
+    month = str(request.args.get("month", "")).strip().zfill(2)
+    employee_id = str(request.args.get("employee_id", "")).strip()
+
+    if not year.isdigit() or not month.isdigit() or not 1 <= int(month) <= 12:
+        return jsonify({"status": "error", "message": "Missing year/month"}), 400
+    if employee_id and not employee_id.isdigit():
+        return jsonify({"status": "error", "message": "Invalid employee_id"}), 400
+
+    if employee_id:
+        employee = identity_cache.get(employee_id)
+        if not employee:
+            return jsonify({"status": "error", "message": "Employee not found"}), 400
+        ensure_clock_month(employee, year, month)
+
+    legal_holidays = request.args.get("holidays") == "calendar"
+    results = payroll_jobs.classify_clock_month(BASE_DIR, year, month, [employee_id] if employee_id else None, legal_holidays)
+    return jsonify({
+        "status": "ok",
+        "year": year,
+        "month": month,
+        "employees": {str(k): v for k, v in results.items()},
     })
 
 # ----------------------
@@ -1437,34 +1547,19 @@ def clear_day():
         return jsonify({"message": "חודש או שנה חסרים"}), 400
 
     # Load employee info
-    emp = EmployeeData.query.get(employee_id)
+    emp = identity_cache.get(employee_id)
     if not emp:
         return jsonify({"message": "העובד לא נמצא"}), 400
 
-    employee_name = emp.employee_name.replace(" ", "_")
-
-    #  Load the correct file for this employee + month
-    db = load_clock_hours(employee_name, selected_year, selected_month)
+    # Clear the selected day (its Timesheet row keeps day/שבת/חג marks)
+    ensure_clock_month(emp, selected_year, selected_month)
+    first_day, last_day = clock_store.month_bounds(selected_year, selected_month)
+    cleared = bool(date) and first_day <= date <= last_day and clock_store.clear_day(emp.id, date)
 
-    hours_table = db.setdefault("hours_table_clock", {
-        "work_day_entries": []
-    })
-
-    entries = hours_table["work_day_entries"]
-
-    # Clear the selected day
-    cleared = False
-    for entry in entries:
-        if entry.get("date") == date:
-            entry["start_time"] = ""
-            entry["end_time"] = ""
-            entry["task"] = ""
-            entry["totalHours"] = ""
-            cleared = True
-            break
-
-    # Save file back
-    save_clock_hours_file(employee_name, selected_year, selected_month, db)
+    # Month file follows in the background
+    submit_clock_export(emp, selected_year, selected_month)
+    if cleared:
+        publish_presence(emp, clock_store.get_day(emp.id, date))
 
     if cleared:
         return jsonify({"message": "היום אופס בהצלחה"})
@@ -1512,7 +1607,7 @@ def delete_clock_file():
         flash("לא ניתן למחוק — חסר עובד/שנה/חודש.", "danger")
         return redirect(url_for('clock_in_out'))
 
-    emp = EmployeeData.query.get(emp_id)
+    emp = identity_cache.get(emp_id)
     employee_name = emp.employee_name.replace(" ", "_")
 
     #  הנתיב הנכון לפי המבנה שלך
@@ -1520,8 +1615,15 @@ def delete_clock_file():
     filename = f"clock_hours_{employee_name}_{year}-{month}.json"
     file_path = os.path.join(folder_path, filename)
 
-    if os.path.exists(file_path):
+    # The month's Timesheet rows (and archived copy) go together with the file
+    deleted_rows = clock_store.delete_month(emp.id, year, month)
+    deleted_rows += int(clock_archive.drop_month(BASE_DIR, year, emp.id, month))
+
+    removed_file = os.path.exists(file_path)
+    if removed_file:
         os.remove(file_path)
+
+    if removed_file or deleted_rows:
         flash(f"קובץ {filename} נמחק בהצלחה.", "info")
     else:
         flash("לא נמצא קובץ למחיקה.", "warning")
@@ -1547,13 +1649,11 @@ def get_clock_hours():
 
     month = str(month).zfill(2)
 
-    emp = EmployeeData.query.get(employee_id)
+    emp = identity_cache.get(employee_id)
     if not emp:
         return jsonify({})
 
-    employee_name = emp.employee_name.replace(" ", "_")
-
-    data = load_clock_hours(employee_name, year, month)
+    data = load_clock_month(emp, year, month)
 
     # Inject missing info
     data["employee_id"] = employee_id
@@ -1645,25 +1745,345 @@ def get_base_dir():
     return base_dir
 
 def load_hours(year):
-    base_dir = get_base_dir()
-    year_folder = os.path.join(base_dir, f"hours_data_{year}")
-    json_path = os.path.join(year_folder, f"hours_data_{year}.json")
+    # Whole year in the legacy {emp_id: {month_key: ...}} shape (cached, private copy)
+    return hours_store.load_year(get_base_dir(), year)
 
-    if not os.path.exists(json_path):
-        return {}
 
-    with open(json_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+def load_hours_json(year):
+    # Same as json.dumps(load_hours(year)), served straight from the year cache
+    return hours_store.load_year_json(get_base_dir(), year)
 
 
 def save_hours(data, year):
-    base_dir = get_base_dir()
-    year_folder = os.path.join(base_dir, f"hours_data_{year}")
-    os.makedirs(year_folder, exist_ok=True)
+    hours_store.save_year(get_base_dir(), year, data)
+    month_keys = {mk for emp in (data or {}).values() if isinstance(emp, dict) for mk in emp if mk != "employee_name"}
+    for month_key in sorted(month_keys):
+        employer_totals.rebuild_month(get_base_dir(), year, month_key)
+    yearly_totals.forget(get_base_dir(), year)
+
+
+def load_hours_month(year, employee_id, month_key):
+    if HOURS_READ_BACKEND == "sql" and not hours_sql.is_stale(get_base_dir(), employee_id, month_key):
+        return hours_sql.load_month(employee_id, month_key)
+    return hours_store.load_month(get_base_dir(), year, employee_id, month_key)
+
+
+def save_hours_month(year, employee_id, employee_name, month_key, month_data):
+    # Touches only this employee-month shard (+ the month's employer totals and SQL rows)
+    hours_store.save_month(get_base_dir(), year, employee_id, employee_name, month_key, month_data)
+    employer_totals.update_month(get_base_dir(), year, employee_id, month_key, month_data)
+    return mirror_hours_sql(employee_id, employee_name, month_key, month_data)
+
+
+def load_employee_hours(year, employee_id):
+    # Same shape as load_hours(), limited to one employee
+    if HOURS_READ_BACKEND == "sql" and not hours_sql.is_stale(get_base_dir(), employee_id, year=year):
+        months = hours_sql.load_employee(employee_id, year)
+    else:
+        months = hours_store.load_employee(get_base_dir(), year, employee_id)
+    return {str(employee_id): months} if months else {}
+
+
+@app.route('/hours_cache_stats')
+@login_required
+def hours_cache_stats():
+    return jsonify(hours_store.year_cache.stats())
+
+
+@app.route('/employee_identity_stats')
+@login_required
+def employee_identity_stats():
+    return jsonify(identity_cache.stats())
+
+
+# ----------------------
+# Hours In SQL (HoursData / MonthlyRecord mirror)
+# ----------------------
+
+# "json" reads the shards, "sql" reads the mirrored tables (run `flask import-hours` first)
+HOURS_READ_BACKEND = os.getenv("HOURS_READ_BACKEND", "json").lower()
+
+
+def mirror_hours_sql(employee_id, employee_name, month_key, month_data, fields=None):
+    """
+    Mirror a saved employee-month into SQL (only the given tax fields when fields
+    is set). The JSON shard is already saved, so a failing mirror does not fail
+    the save: it is logged and the month is marked stale, and SQL reads use the
+    shard until a later save or `flask import-hours` repairs it. Returns False
+    when the mirror failed, so the caller can tell the user.
+    """
+    try:
+        if fields is None:
+            hours_sql.sync_month(employee_id, employee_name, month_key, month_data)
+        else:
+            hours_sql.update_month_fields(employee_id, employee_name, month_key, month_data, fields)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception("SQL hours mirror failed for %s %s", employee_id, month_key)
+        hours_sql.mark_stale(get_base_dir(), employee_id, month_key, e)
+        return False
+    hours_sql.clear_stale(get_base_dir(), employee_id, month_key)
+    return True
+
+
+def mirror_hours_sql_many(items):
+    """hours_sql.sync_months() with the same failure handling; re-raises so the job shows the error."""
+    try:
+        hours_sql.sync_months(items)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception("SQL hours mirror failed for %d employee-months", len(items))
+        for employee_id, _, month_key, _ in items:
+            hours_sql.mark_stale(get_base_dir(), employee_id, month_key, e)
+        raise
+    for employee_id, _, month_key, _ in items:
+        hours_sql.clear_stale(get_base_dir(), employee_id, month_key)
+
+
+@app.cli.command("import-hours")
+@click.option("--year", default=None, help="Only this year (default: every hours_data_{year} folder)")
+def import_hours_command(year):
+    """Bulk-load the JSON hours archive into HoursData / MonthlyRecord."""
+    if year:
+        results = {year: hours_sql.import_year(get_base_dir(), year)}
+    else:
+        results = hours_sql.import_all(get_base_dir())
+    for y, counts in results.items():
+        hours_sql.clear_stale(get_base_dir(), year=y)
+        print(f"✅ {y}: {counts['hours_rows']} hours rows, {counts['monthly_records']} monthly records, "
+              f"{len(counts['skipped'])} skipped (employee not in DB)")
+
+
+# ----------------------
+# Yearly Totals (*_yearly fields)
+# ----------------------
+
+def apply_yearly_totals(year, employee_id, employee_name, month_key, tax):
+    """
+    Running yearly totals for this month (merged into tax). Later months of the
+    year that already exist get their *_yearly fields rewritten, so a retro edit
+    of an earlier month shows up everywhere.
+    """
+    if HOURS_READ_BACKEND == "sql" and str(employee_id).isdigit() \
+            and not hours_sql.is_stale(get_base_dir(), employee_id, year=year):
+        # one GROUP BY over MonthlyRecord; the JSON accumulator is rebuilt from the shards when next used
+        yearly, later_months = hours_sql.yearly_months(employee_id, year, month_key, tax)
+        yearly_totals.forget(get_base_dir(), year, employee_id)
+    else:
+        yearly, later_months = yearly_totals.record_month(get_base_dir(), year, employee_id, month_key, tax)
+    tax.update(yearly)
+
+    for later_key, later_yearly in later_months.items():
+        later_data = hours_store.load_month(get_base_dir(), year, employee_id, later_key)
+        if not later_data:
+            continue
+        later_data.setdefault("hours_table", {}).setdefault("tax", {}).update(later_yearly)
+        # only *_yearly changed -> employer totals of that month stay as they are
+        hours_store.save_month(get_base_dir(), year, employee_id, employee_name, later_key, later_data)
+        mirror_hours_sql(employee_id, employee_name, later_key, later_data)
+        submit_hours_export(year, employee_id, employee_name, later_key, later_data)
+
+    return yearly
+
+# ----------------------
+# Background Export Queue (CSV / XLSX)
+# ----------------------
+
+export_watchers = {}     # job key -> socket room of the session that queued it
+
+
+def publish_export_status(status):
+    # submit() publishes from the request that queued the job -> remember who asked
+    if status.get("state") == "queued" and has_request_context() and session_room():
+        export_watchers[status["key"]] = session_room()
+    watcher = export_watchers.get(status["key"])
+    if status.get("state") in ("done", "error"):
+        export_watchers.pop(status["key"], None)
+    socketio.emit('export_status', status, to=[MANAGERS_ROOM] + ([watcher] if watcher else []))
+
+export_queue = ExportQueue(workers=int(os.getenv("EXPORT_WORKERS", 1)), on_status=publish_export_status)
+
+def export_key(path):
+    return os.path.relpath(path, app.root_path).replace(os.sep, "/")
+
+
+def export_hours_section(year, employee_id, employee_name, month_key, month_data):
+    # Only this employee-month's fragment; the year files are built on download
+    hours_export.update_section(get_base_dir(), year, employee_id, employee_name, month_key, month_data)
+
+
+def hours_year_path(year, fmt):
+    if fmt == "csv":
+        return hours_export.csv_path_for(get_base_dir(), year)
+    return os.path.join(hours_store.year_folder(get_base_dir(), year), f"hours_data_{year}.xlsx")
+
+
+def export_hours_year(year, fmt):
+    if fmt == "csv":
+        hours_export.splice_year(get_base_dir(), year)
+    else:
+        save_to_csv_and_xlsx(year, hours_year_path(year, "xlsx"))
+
+
+def submit_hours_export(year, employee_id, employee_name, month_key, month_data):
+    section_csv = hours_export.fragment_path(get_base_dir(), year, employee_id, month_key)
+    return export_queue.submit(
+        export_key(section_csv), export_hours_section,
+        year, employee_id, employee_name, month_key, month_data
+    )
+
+
+def write_form_export(data, csv_path, xlsx_path, sheet_name):
+    fieldnames = list(data.keys())
+
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames)
+    writer.writeheader()
+    writer.writerow(data)
+    file_store.atomic_write(csv_path, buf.getvalue(), encoding="utf-8-sig", newline="")
+
+    # XLSX straight from the in-memory record, no CSV read-back
+    xlsx_export.write_xlsx(xlsx_path, fieldnames, [data], sheet_name=sheet_name)
+
+
+@app.route('/export_status')
+@login_required
+def export_status():
+    key = request.args.get('key')
+    if key:
+        return jsonify(export_queue.status(key) or {"key": key, "state": "unknown"})
+    return jsonify(list(export_queue.status().values()))
+
+# ----------------------
+# Download Hours Year (CSV / XLSX of every employee, built on demand)
+# ----------------------
+# Served as is while no save came in since it was built; otherwise a build job
+# is queued and the answer is 202 with its export_key (poll /export_status).
+
+@app.route('/download_hours_year')
+@manager_required
+def download_hours_year():
+    year = str(request.args.get('year', '')).strip()
+    fmt = request.args.get('format', 'csv').lower()
+    if not year.isdigit() or fmt not in ("csv", "xlsx"):
+        return jsonify(success=False, message="שנה או פורמט לא תקינים"), 400
+    if not os.path.isdir(hours_store.year_folder(get_base_dir(), year)):
+        return jsonify(success=False, message="אין נתוני שעות לשנה זו"), 404
+
+    path = hours_year_path(year, fmt)
+    if hours_export.is_current(get_base_dir(), year, fmt, path):
+        return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+    job = export_queue.submit(export_key(path), export_hours_year, year, fmt)
+    return jsonify(success=True, state=job["state"], export_key=job["key"]), 202
+
+
+@app.cli.command("export-hours-year")
+@click.option("--year", required=True, help="Year whose hours_data_{year}.csv / .xlsx are built")
+def export_hours_year_command(year):
+    """Build the yearly hours CSV and XLSX (skipped while they are current)."""
+    for fmt in ("csv", "xlsx"):
+        path = hours_year_path(year, fmt)
+        if not hours_export.is_current(get_base_dir(), year, fmt, path):
+            export_hours_year(year, fmt)
+        print(f"✅ {path}")
+
+# ----------------------
+# Payroll Jobs (close year, overtime, payroll run / recompute / retro: payroll_jobs.py)
+# ----------------------
 
-    json_path = os.path.join(year_folder, f"hours_data_{year}.json")
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+jobs = payroll_jobs.PayrollJobs(
+    app, BASE_DIR, get_base_dir,
+    load_month=load_hours_month,
+    apply_yearly=apply_yearly_totals,
+    mirror_month=mirror_hours_sql,
+    mirror_months=mirror_hours_sql_many,
+    submit_export=submit_hours_export,
+    emit=lambda event, payload: socketio.emit(event, payload, to=MANAGERS_ROOM),
+)
+
+
+@app.cli.command("close-clock-year")
+@click.option("--year", required=True, help="Year whose closed months are packed")
+@click.option("--keep-files", is_flag=True, help="Leave the month JSON files in place")
+def close_clock_year_command(year, keep_files):
+    """Pack closed clock months of a year into clock_archive_{year}.bin."""
+    result = payroll_jobs.close_clock_year(BASE_DIR, year, keep_files=keep_files)
+    print(f"✅ {year}: {result.get('rows', 0)} days of {result.get('employees', 0)} employees, "
+          f"{result['files_removed']} month files removed ({result.get('bytes', 0)} bytes)")
+
+
+@app.cli.command("overtime-month")
+@click.option("--year", required=True)
+@click.option("--month", required=True)
+def overtime_month_command(year, month):
+    """Classify the clock hours of every employee for one month (no browser needed)."""
+    results = payroll_jobs.classify_clock_month(BASE_DIR, year, str(month).zfill(2))
+    for employee_id, result in sorted(results.items()):
+        totals = result["monthly_totals"]
+        warning = f" ⚠️ {len(result['weekly_warnings'])} weeks over 42h" if result["weekly_warnings"] else ""
+        print(f"✅ {employee_id} {result['employee_name']}: {totals['hours_calculated_monthly'] or 0} hours, "
+              f"125%={totals['extra_hours125_regular_day_monthly'] or 0} 150%={totals['extra_hours150_regular_day_monthly'] or 0} "
+              f"final={totals['final_totals_hours_monthly'] or 0}{warning}")
+
+
+@app.cli.command("scan-clock-anomalies")
+@click.option("--year", required=True)
+@click.option("--month", default=None, help="One month (default: the whole year)")
+@click.option("--workers", default=None, type=int, help="Scanner processes (default ANOMALY_WORKERS)")
+def scan_clock_anomalies_command(year, month, workers):
+    """Flag open shifts, overlaps, long days and unmarked Saturdays in the clock files."""
+    result = anomaly_scanner.scan(BASE_DIR, year, [int(month)] if month else None, workers=workers)
+    for item in result["anomalies"]:
+        print(f"⚠️ {item['date']} {item['employee_id']} {item['employee_name']}: {item['kind']} {item['detail']}")
+    print(f"✅ {year}: {result['units']} employee-months ({result['scanned']} scanned, {result['cached']} cached), "
+          f"{len(result['anomalies'])} anomalies {result['counts']}")
+
+
+@app.cli.command("payroll-month")
+@click.option("--year", required=True)
+@click.option("--month", required=True)
+def payroll_month_command(year, month):
+    """Compute the tax form of every employee for one month (no browser needed)."""
+    results = jobs.payroll_month(year, month)
+    for employee_id, result in sorted(results.items()):
+        tax = result["tax"]
+        print(f"✅ {employee_id} {result['employee_name']} ({result['source']}): "
+              f"gross={tax['gross_salary']} net={tax['net_payment']} cost={tax['total_salary_cost']}")
+    print(f"✅ {year}-{str(month).zfill(2)}: {len(results)} employees")
+
+
+@app.cli.command("payroll-run")
+@click.option("--year", required=True)
+@click.option("--month", required=True)
+@click.option("--workers", default=None, type=int, help="Payroll processes (default PAYROLL_WORKERS)")
+def payroll_run_command(year, month, workers):
+    """Close a month: compute and save the payroll of every active employee."""
+    started = time.time()
+    result = jobs.run_payroll_month(year, month, workers)
+    print(f"✅ {year}-{str(month).zfill(2)}: {result['employees']} employees, "
+          f"{result['saved_months']} months saved in {time.time() - started:.1f}s")
+    export_queue.wait_idle()     # CSV / XLSX sections, before the process exits
+    print("✅ exports done")
+
+
+@app.cli.command("payroll-retro")
+@click.option("--employee-id", required=True, type=int)
+@click.option("--effective", required=True, help="YYYY-MM-DD")
+@click.option("--set", "assignments", multiple=True, required=True, help="field=value (repeatable)")
+@click.option("--workers", default=None, type=int, help="Processes (default PAYROLL_WORKERS)")
+def payroll_retro_command(employee_id, effective, assignments, workers):
+    """Apply a rate change from an effective date to every saved month after it."""
+    values = dict(a.split("=", 1) for a in assignments)
+    unknown = [k for k in values if k not in payroll_jobs.RETRO_FIELDS]
+    if unknown:
+        raise click.BadParameter(f"not a rate field: {', '.join(unknown)}")
+    result = jobs.run_retro_change(employee_id, effective, values, workers)
+    for row in result["months"]:
+        print(f"✅ {row['month_key']}: net {row['net_payment_old']} -> {row['net_payment_new']} ({row['net_payment_diff']:+}), "
+              f"tax {row['income_tax_old']} -> {row['income_tax_new']} ({row['income_tax_diff']:+})")
+    print(f"✅ {result['employee_name']}: {result['saved_months']} months saved, "
+          f"net {result['net_payment_diff']:+}, tax {result['income_tax_diff']:+}")
+    export_queue.wait_idle()
 
 # ----------------------
 # Check If Employee ID Months Years Exists On Data   
@@ -1838,28 +2258,22 @@ def index():
                         flash("שגיאה בקריאת נתוני שעות העבודה", "danger")
                         session['table_data'] = {}
 
-                # Compute yearly totals
+                # Compute yearly totals (prefix sums, later months follow)
+                table_data.setdefault('tax', {})
                 try:
-                    all_hours_snapshot = load_hours(selected_year) or {}
-                    yearly_totals = compute_yearly_totals(
-                        all_hours=all_hours_snapshot,
-                        employee_id=selected_employee_id,
-                        year=selected_year,
-                        current_month=selected_month,
-                        current_tax=table_data.get('tax', {})
-                    ) or {}
+                    month_yearly_totals = apply_yearly_totals(
+                        selected_year, selected_employee_id, employee_name,
+                        month_key, table_data['tax']
+                    )
                 except Exception:
-                    yearly_totals = {}
+                    month_yearly_totals = {}
 
-                table_data.setdefault('tax', {})
-                table_data['tax'].update(yearly_totals)
-
-                # Save to hours.json
-                all_hours = load_hours(selected_year) or {}
-                all_hours.setdefault(str(selected_employee_id), {})
-                all_hours[str(selected_employee_id)]["employee_name"] = employee_name
-                all_hours[str(selected_employee_id)][month_key] = {"hours_table": table_data}
-                save_hours(all_hours, selected_year)
+                # Save to the employee-month shard
+                if not save_hours_month(selected_year, selected_employee_id, employee_name,
+                                        month_key, {"hours_table": table_data}):
+                    flash("⚠️ הנתונים נשמרו, אך העדכון למסד הנתונים נכשל (SQL)", "warning")
+                submit_hours_export(selected_year, selected_employee_id, employee_name,
+                                    month_key, {"hours_table": table_data})
 
                 # Build form_data
                 form_data = request.form.to_dict(flat=True)
@@ -1868,7 +2282,7 @@ def index():
                 form_data['employeeMonth'] = selected_month
                 form_data['employeeYear'] = selected_year
                 form_data['date'] = date_key
-                form_data.update(yearly_totals)
+                form_data.update(month_yearly_totals)
                 form_data.update(table_data.get('monthly_totals', {}))
                 form_data.update(table_data.get('paid_totals', {}))
                 form_data.update(table_data.get('tax', {}))
@@ -1881,6 +2295,7 @@ def index():
                 new_tax_entry = EmployeeData(**form_data)
                 db.session.add(new_tax_entry)
                 db.session.commit()
+                identity_cache.invalidate(new_tax_entry.id)
 
                 # Save to CSV
                 row = {
@@ -1921,9 +2336,7 @@ def index():
     month_key = f"{selected_year_str}-{selected_month_str}"
 
     # Load hours JSON
-    all_hours = load_hours(selected_year) or {}
-    employee_json = all_hours.get(str(selected_employee_id), {}) if selected_employee_id else {}
-    month_json = employee_json.get(month_key, {})
+    month_json = load_hours_month(selected_year, selected_employee_id, month_key)
 
     hours_table = month_json.get("hours_table", {})
     default_hours = {
@@ -2101,7 +2514,7 @@ def index():
         employees=employees,
         days_data=get_days_in_month(int(selected_year), int(selected_month)),
         employee_details=get_employee_details(selected_employee_id, selected_month, selected_year) if selected_employee_id else {},
-        all_hours=json.dumps(load_hours(selected_year), ensure_ascii=False)
+        all_hours=load_hours_json(selected_year)
     )
 
 # ----------------------
@@ -2143,104 +2556,13 @@ def save_hours_route():
         paid_totals = snake(paid_totals_raw)
         tax_data = snake(tax_data_raw)
 
-        # === YEARLY TOTALS ===
-        def clean_number(value):
-            try:
-                return float(str(value).replace("₪", "").replace(",", "").strip())
-            except:
-                return 0.0
-
-        def compute_yearly_totals(all_hours, employee_id, year, current_month, current_tax):
-
-            yearly_fields = [
-                "sick_days_salary",
-                "vacation_days_salary",
-                "sick_days_balance",
-                "vacation_balance",
-                "gross_taxable",
-                "employee_pension_fund",
-                "self_employed_pension_fund",
-                "study_fund_deductions",
-                "miscellaneous_deductions",
-                "national_insurance_deductions",
-                "health_insurance_deductions",
-                "income_tax",
-                "amount_tax_credit_points_monthly",
-                "final_city_tax_benefit",
-                "pension_fund",
-                "compensation",
-                "study_fund",
-                "disability",
-                "miscellaneous",
-                "national_insurance",
-                "salary_tax",
-                "total_employer_contributions",
-                "total_salary_cost"
-            ]
-
-            sick_days_entitlement = 18
-            vacation_days_entitlement = 12
-
-            totals = {f"{field}_yearly": 0.0 for field in yearly_fields}
-
-            employee_id = str(employee_id)
-            employee_data = all_hours.get(employee_id, {})
-
-            for month_key, month_data in employee_data.items():
-                if month_key == "employee_name":
-                    continue
-                if not month_key.startswith(str(year)):
-                    continue
-
-                try:
-                    mk_month = int(month_key.split("-")[1])
-                except:
-                    continue
-
-                if mk_month >= int(current_month):
-                    continue
-
-                tax = month_data.get("hours_table", {}).get("tax", {})
-
-                for field in yearly_fields:
-                    val = clean_number(tax.get(field, 0))
-                    totals[f"{field}_yearly"] += val
-
-            for field in yearly_fields:
-                val = clean_number(current_tax.get(field, 0))
-                totals[f"{field}_yearly"] += val
-
-            sick_days_used = totals.get("sick_days_salary_yearly", 0.0)
-            vacation_days_used = totals.get("vacation_days_salary_yearly", 0.0)
-
-            totals["sick_days_balance_yearly"] = sick_days_entitlement - sick_days_used
-            totals["vacation_balance_yearly"] = vacation_days_entitlement - vacation_days_used
-
-            def format_number(val):
-                return f"{val:.2f}"
-
-            def format_currency(val):
-                return f"{val:,.2f}"
-
-            formatted_totals = {}
-            for k, v in totals.items():
-                if "balance" in k or "days" in k:
-                    formatted_totals[k] = format_number(v)
-                else:
-                    formatted_totals[k] = format_currency(v)
-
-            return formatted_totals
-
-        # === JSON SAVE ===
-        all_hours = load_hours(year) or {}
-        all_hours.setdefault(employee_id, {})
-        all_hours[employee_id]["employee_name"] = employee_name
-
-        yearly = compute_yearly_totals(all_hours, employee_id, year, month, tax_data_raw)
+        # === YEARLY TOTALS (prefix sums, later months follow) ===
+        yearly = apply_yearly_totals(year, employee_id, employee_name, month_key, tax_data_raw)
         tax_data.update(snake(yearly))
-        tax_data_raw.update(yearly)
 
-        all_hours[employee_id][month_key] = {
+        # === JSON SAVE (employee-month shard only) ===
+
+        month_data = {
             "hours_table": {
                 "work_day_entries": work_day_entries_raw,
                 "monthly_totals": monthly_totals_raw,
@@ -2249,164 +2571,23 @@ def save_hours_route():
             }
         }
 
-        save_hours(all_hours, year)
+        mirrored = save_hours_month(year, employee_id, employee_name, month_key, month_data)
 
         # === UPDATE SESSION ===
-        session['hours_table'] = all_hours[employee_id][month_key]["hours_table"]
+        session['hours_table'] = month_data["hours_table"]
         session['employee_data'] = {
             **monthly_totals_raw,
             **paid_totals_raw,
             **tax_data_raw
         }
 
-        # === BUILD CSV COLUMN ORDER ===
-
-        # 1. base columns
-        fieldnames = [
-            "employee_id", "employee_name", "month", "section",
-            "day", "date", "saturday", "holiday"
-        ]
-
-        # 2. daily fields
-        for f in [
-            'start_time','end_time','hours_calculated','hours_calculated_regular_day',
-            'total_extra_hours_regular_day','extra_hours125_regular_day',
-            'extra_hours150_regular_day','hours_holidays_day',
-            'extra_hours150_holidays_saturday','extra_hours175_holidays_saturday',
-            'extra_hours200_holidays_saturday','sick_day','day_off','food_break',
-            'final_totals_hours','calc1','calc2','calc3','work_day',
-            'missing_work_day','advance_payment'
-        ]:
-            fieldnames.append(f)
-
-        # 3. monthly fields (snake_case)
-        for f in [
-                "hours_calculated_monthly",
-                "hours_calculated_regular_day_monthly",
-                "total_extra_hours_regular_day_monthly",
-                "extra_hours125_regular_day_monthly",
-                "extra_hours150_regular_day_monthly",
-                "hours_holidays_day_monthly",
-                "extra_hours150_holidays_saturday_monthly",
-                "extra_hours175_holidays_saturday_monthly",
-                "extra_hours200_holidays_saturday_monthly",
-                "sick_day_monthly",
-                "day_off_monthly",
-                "food_break_monthly",
-                "final_totals_hours_monthly",
-                "calc1_monthly",
-                "calc2_monthly",
-                "calc3_monthly",
-                "work_day_monthly",
-                "missing_work_day_monthly",
-                "advance_payment_monthly"
-        ]:
-                fieldnames.append(f)
-
-        # 4. paid fields (snake_case)
-        for f in [
-                "hours_calculated_paid",
-                "hours_calculated_regular_day_paid",
-                "total_extra_hours_regular_day_paid",
-                "extra_hours125_regular_day_paid",
-                "extra_hours150_regular_day_paid",
-                "hours_holidays_day_paid",
-                "extra_hours150_holidays_saturday_paid",
-                "extra_hours175_holidays_saturday_paid",
-                "extra_hours200_holidays_saturday_paid",
-                "sick_day_paid",
-                "day_off_paid",
-                "food_break_unpaid",
-                "final_totals_hours_paid",
-                "calc1_paid",
-                "calc2_paid",
-                "calc3_paid",
-                "final_totals_lunch_value_paid",
-                "final_total_extra_hours_weekend_monthly",
-                "advance_payment_paid"
-        ]:
-                fieldnames.append(f)
-
-        # 5. tax fields
-        for f in tax_data.keys():
-            fieldnames.append(f)
-
-        # remove duplicates but keep order
-        fieldnames = list(dict.fromkeys(fieldnames))
-
-        # === REBUILD CSV ===
-        rows = []
-
-        for emp_id, emp_data in all_hours.items():
-            if emp_id == "employee_name": continue
-            emp_name = emp_data.get("employee_name", "")
-
-            for mk, mdata in emp_data.items():
-                if mk == "employee_name": continue
-
-                tbl = mdata["hours_table"]
-                wd = [snake(e) for e in tbl["work_day_entries"]]
-                mt = snake(tbl["monthly_totals"])
-                pt = snake(tbl["paid_totals"])
-                tx = snake(tbl["tax"])
-
-                wrote_summary = False
-
-                for entry in wd:
-                    row = {
-                        "employee_id": emp_id if not wrote_summary else "",
-                        "employee_name": emp_name if not wrote_summary else "",
-                        "month": mk if not wrote_summary else "",
-                        "section": "daily",
-                        "day": entry.get("day", ""),
-                        "date": entry.get("date", ""),
-                        "saturday": entry.get("saturday", ""),
-                        "holiday": entry.get("holiday", "")
-                    }
-
-                    # daily fields
-                    for k, v in entry.items():
-                        if k not in ("day","date","saturday","holiday"):
-                            row[k] = v
-
-                    if not wrote_summary:
-                        row.update(mt)
-                        row.update(pt)
-                        row.update(tx)
-                        wrote_summary = True
-                    else:
-                        for k in mt.keys(): row[k] = ""
-                        for k in pt.keys(): row[k] = ""
-                        for k in tx.keys(): row[k] = ""
-
-                    rows.append(row)
-
-        # === CREATE MAIN FOLDER  ===
-        base_dir = os.path.join(app.root_path, "hours_data")           
-        os.makedirs(base_dir, exist_ok=True)
-
-        # === CREATE YEAR FOLDER ===
-        year_folder = os.path.join(base_dir, f"hours_data_{year}")
-        os.makedirs(year_folder, exist_ok=True)
-
-        # === SAVE CSV  ===
-        csv_path = os.path.join(year_folder, f"hours_data_{year}.csv")
-        with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for r in rows:
-                writer.writerow(r)
-
-        # === SAVE XLSX  ===
-        xlsx_path = os.path.join(year_folder, f"hours_data_{year}.xlsx")
-        save_to_csv_and_xlsx(csv_path, xlsx_path)
+        # === CSV / XLSX EXPORT (background, JSON shard is already saved) ===
+        job = submit_hours_export(year, employee_id, employee_name, month_key, month_data)
 
-        # === SAVE JSON  ===
-        json_path = os.path.join(year_folder, f"hours_data_{year}.json")
-        with open(json_path, "w", encoding="utf-8") as jf:
-            json.dump(all_hours, jf, ensure_ascii=False, indent=2)
-
-        return jsonify(success=True, message="הנתונים נשמרו בהצלחה")
+        if not mirrored:
+            return jsonify(success=True, message="הנתונים נשמרו, אך העדכון למסד הנתונים נכשל (SQL)",
+                           export_key=job["key"], sql_mirror=False)
+        return jsonify(success=True, message="הנתונים נשמרו בהצלחה", export_key=job["key"])
 
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
@@ -2415,62 +2596,12 @@ def save_hours_route():
 #  Save To Csv And Xlsx All Data On Folder
 # ----------------------
 
-def save_to_csv_and_xlsx(csv_path, xlsx_path):
-    if not os.path.exists(csv_path):
-        return  # nothing to export yet
-
-    # Load the CSV into pandas
-    df = pd.read_csv(csv_path, encoding='utf-8-sig')
-    
-    # Save as Excel (XLSX)
-    with pd.ExcelWriter(xlsx_path, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Hours')
-        
-        # Access the workbook and worksheet
-        workbook  = writer.book
-        worksheet = writer.sheets['Hours']
-
-        # Freeze the first row
-        worksheet.freeze_panes(1, 0)
-
-        # Set RTL Hebrew View
-        worksheet.right_to_left()
-
-        # Auto-adjust column widths
-        for i, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-            worksheet.set_column(i, i, max_len)
-
-        # === Define formats ===
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#000000',   # black background
-            'font_color': '#FFFFFF', # white text
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1
-        })
-
-        body_format = workbook.add_format({
-            'border': 1,
-            'border_color': '#FFFFFF',  # white grid lines
-            'bg_color': '#D9EAF7'       # light blue background
-        })
-
-        alt_body_format = workbook.add_format({
-            'border': 1,
-            'border_color': '#FFFFFF',
-            'bg_color': '#F2F2F2'       # light gray alternate rows
-        })
-
-        # === Apply header format ===
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-
-        # === Apply body formats (striped rows) ===
-        for row_num in range(1, len(df) + 1):
-            fmt = body_format if row_num % 2 else alt_body_format
-            worksheet.set_row(row_num, None, fmt)
+def save_to_csv_and_xlsx(year, xlsx_path):
+    # Streams the year's records (same rows and order as the CSV) straight into the workbook, no CSV read-back
+    built_revision = hours_export.revision(get_base_dir(), year)
+    fieldnames, rows = hours_export.year_rows(get_base_dir(), year)
+    xlsx_export.write_xlsx(xlsx_path, fieldnames, rows, sheet_name='Hours')
+    hours_export.mark_built(get_base_dir(), year, "xlsx", built_revision)
 
 # ----------------------
 # Get Hours Data: Form Page
@@ -2499,10 +2630,7 @@ def get_hours_data():
 
     month_key = f"{selected_year_str}-{selected_month_str}"
 
-    all_hours = load_hours(selected_year) or {}
-
-    employee_data = all_hours.get(str(employee_id), {})
-    month_data = employee_data.get(month_key, {})
+    month_data = load_hours_month(selected_year, employee_id, month_key)
 
     hours_table = month_data.get("hours_table", {})
 
@@ -2756,6 +2884,7 @@ def form_102():
                         if hasattr(employee, attr):
                             setattr(employee, attr, value)
             db.session.commit()
+            identity_cache.invalidate(employee.id)
 
         #  שמירת נתוני הטופס ב-session
         session['form_data'] = request.form.to_dict()
@@ -2829,128 +2958,11 @@ def form_102():
 
     #  חישוב totals
     form_data = session.get('form_data', {})
-    all_hours = load_hours(selected_year) or {}
-
-    employee_count = 0
-    total_gross = 0.0
-    total_income_tax = 0.0
-    total_ni_employee = 0.0
-    total_health = 0.0
-    total_study_fund_deductions = 0.0
-
-    emp_pension = 0.0
-    self_pension = 0.0
-
-    pension_val = 0.0
-    comp_val = 0.0
-    disability_val = 0.0
-    study_fund_val = 0.0
-
-    regular_salary = 0.0
-    reduced_salary = 0.0
-    regular_count = 0
-    reduced_count = 0
-
     month_key = f"{selected_year}-{str(selected_month).zfill(2)}"
-
-    # Clean Number helper
-    def cn(val):
-        try:
-            return float(str(val).replace("₪", "").replace(",", "").strip())
-        except:
-            return 0.0
-
-    for emp_id, emp_months in all_hours.items():
-        if month_key in emp_months:
-            employee_count += 1
-
-            tax_data = emp_months[month_key].get("hours_table", {}).get("tax", {})
-
-            gross_taxable = cn(tax_data.get("gross_taxable", 0))
-            dob = tax_data.get("date_of_birth") or None
-
-            #  חישוב שכר רגיל / מופחת לפי גיל
-            if dob:
-                try:
-                    birth = datetime.strptime(dob, "%Y-%m-%d")
-                    today = datetime.today()
-                    age = today.year - birth.year - ((today.month, today.day) < (birth.month, birth.day))
-                except:
-                    age = 0
-            else:
-                age = 0
-
-            if age < 18 or age >= 67:
-                reduced_salary += gross_taxable
-                reduced_count += 1
-            else:
-                regular_salary += gross_taxable
-                regular_count += 1
-
-            total_gross += gross_taxable
-            total_income_tax += cn(tax_data.get("income_tax", 0))
-            total_ni_employee += cn(tax_data.get("national_insurance_deductions", 0))
-            total_health += cn(tax_data.get("health_insurance_deductions", 0))
-            total_study_fund_deductions += cn(tax_data.get("study_fund_deductions", 0))
-
-            emp_pension += cn(tax_data.get("employee_pension_fund", 0))
-            self_pension += cn(tax_data.get("self_employed_pension_fund", 0))
-
-            pension_val += cn(tax_data.get("pension_fund", 0))
-            comp_val += cn(tax_data.get("compensation", 0))
-            disability_val += cn(tax_data.get("disability", 0))
-            study_fund_val += cn(tax_data.get("study_fund", 0))
-
-    final_emp_pension_combined = emp_pension + self_pension
-
-    final_emp_deductions_total = (
-        total_ni_employee +
-        total_health +
-        final_emp_pension_combined +
-        total_study_fund_deductions
-    )
-
-    total_employer_pension_combined = (
-        pension_val +
-        comp_val +
-        disability_val +
-        study_fund_val
-    )
-
-    final_totals_paid = (
-        final_emp_deductions_total +
-        total_employer_pension_combined
-    )
-
-    final_totals_income_tax = total_income_tax
+    totals = month_employer_totals(selected_year, month_key)
 
     form_data.update({
-        'NumEmployees': employee_count,
-        'regular_salary_hidden': round_form_number(regular_salary),
-        'reduced_salary_hidden': round_form_number(reduced_salary),
-        'regular_count_hidden': regular_count,
-        'reduced_count_hidden': reduced_count,
-        'total_salary_hidden': round_form_number(regular_salary + reduced_salary),
-         
-        'totalGrossSalary': round_form_number(total_gross),
-        'totalIncomeTax': round_form_number(total_income_tax),
-        'totalNationalInsurance': round_form_number(total_ni_employee),
-        'totalHealthInsurance': round_form_number(total_health),
-        'totalProvidentDeduction': round_form_number(total_study_fund_deductions),
-
-        'totalEmpPension': round_form_number(emp_pension),
-        'totalSelfPension': round_form_number(self_pension),
-        'totalPensionDeduction':round_form_number(final_emp_pension_combined),
-
-        'totalPensionVal': round_form_number(pension_val),
-        'totalCompVal': round_form_number(comp_val),
-        'totalDisabilityVal': round_form_number(disability_val),
-        'totalStudyFundVal': round_form_number(study_fund_val),
-        'employerPension': round_form_number(total_employer_pension_combined),
-
-        'totalEmpDeductions': round_form_number(final_emp_deductions_total),
-        'finalTotalsPaid': round_form_number(final_totals_paid),
-        'finalTotalIncomeTax': round_form_number(final_totals_income_tax),
+        **build_102_form_fields(totals),
 
         'reportMonth': selected_month,
         'reportYear': selected_year
@@ -3014,106 +3026,29 @@ def save_form_102():
         # === 4) שמירה ל־JSON לפי חודש ===
         json_path = os.path.join(year_folder, f"102_{month}_{year}.json")
 
-        # טוען קובץ קיים אם יש
-        if os.path.exists(json_path):
-            with open(json_path, "r", encoding="utf-8") as f:
-                month_data = json.load(f)
-        else:
-            month_data = {}
-
-        # עדכון נתוני העובד
-        month_data[employee_id] = {
-            "employee_name": employee_name,
-            "form_data": data
-        }
+        # עדכון נתוני העובד בקובץ החודש (קריאה-עדכון-כתיבה תחת נעילה, כתיבה אטומית)
+        def update_employee(month_data):
+            month_data[employee_id] = {
+                "employee_name": employee_name,
+                "form_data": data
+            }
 
-        # כתיבה לקובץ JSON
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(month_data, f, ensure_ascii=False, indent=4)
+        file_store.update_json(json_path, update_employee, indent=4)
 
-        # === 5) בניית CSV ===
+        # === 5-6) CSV + XLSX ברקע (JSON כבר נשמר) ===
         csv_path = os.path.join(year_folder, f"102_{month}_{year}.csv")
-
-        fieldnames = list(data.keys())
-
-        with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerow(data)
-
-        # === 6) יצירת XLSX ===
         xlsx_path = os.path.join(year_folder, f"102_{month}_{year}.xlsx")
 
-        df = pd.DataFrame([data])
-        save_102_excel(csv_path, xlsx_path)
+        job = export_queue.submit(export_key(xlsx_path), write_form_export, dict(data), csv_path, xlsx_path, 'Form102')
 
         # === 7) עדכון session ===
         session["form_102"] = data
 
-        return jsonify(success=True, message="טופס 102 נשמר בהצלחה!")
+        return jsonify(success=True, message="טופס 102 נשמר בהצלחה!", export_key=job["key"])
 
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
 
-# ----------------------
-#  Save To Csv And Xlsx All Data On Folder Form 102
-# ----------------------
-
-def save_102_excel(csv_path, xlsx_path):
-    if not os.path.exists(csv_path):
-        return
-
-    df = pd.read_csv(csv_path, encoding='utf-8-sig')
-
-    with pd.ExcelWriter(xlsx_path, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Form102')
-
-        workbook  = writer.book
-        worksheet = writer.sheets['Form102']
-
-        # Freeze header
-        worksheet.freeze_panes(1, 0)
-
-        # RTL
-        worksheet.right_to_left()
-
-        # Auto column width
-        for i, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-            worksheet.set_column(i, i, max_len)
-
-        # Header format
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#000000',
-            'font_color': '#FFFFFF',
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1
-        })
-
-        # Body formats
-        body_format = workbook.add_format({
-            'border': 1,
-            'border_color': '#FFFFFF',
-            'bg_color': '#D9EAF7'
-        })
-
-        alt_body_format = workbook.add_format({
-            'border': 1,
-            'border_color': '#FFFFFF',
-            'bg_color': '#F2F2F2'
-        })
-
-        # Apply header
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-
-        # Apply striped rows
-        for row_num in range(1, len(df) + 1):
-            fmt = body_format if row_num % 2 else alt_body_format
-            worksheet.set_row(row_num, None, fmt)
-
 # --------------------
 #  Save Form 102 Report Data To Folder
 # ---------------------- 
@@ -3143,13 +3078,11 @@ def save_form102_report():
     xml_path = os.path.join(year_folder, filename_xml)
 
     # === שמירת JSON ===
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    file_store.write_json(json_path, data)
 
     # === שמירת XML ===
     xml_content = data["xml"]
-    with open(xml_path, "w", encoding="utf-8") as f:
-        f.write(xml_content)
+    file_store.atomic_write(xml_path, xml_content)
 
     return jsonify({
         "success": True,
@@ -3279,6 +3212,46 @@ def round_form_number(val):
     except:
         return ""
 
+# ----------------------
+#  Shared Monthly Totals Forms 102 / B102 / H102
+# ----------------------
+
+def month_employer_totals(year, month_key):
+    if HOURS_READ_BACKEND == "sql" and not hours_sql.is_stale(get_base_dir(), month_key=month_key):
+        return hours_sql.month_totals(month_key)
+    return employer_totals.month_totals(get_base_dir(), year, month_key)
+
+
+def build_102_form_fields(totals):
+    return {
+        'NumEmployees': totals["employee_count"],
+        'regular_salary_hidden': round_form_number(totals["regular_salary"]),
+        'reduced_salary_hidden': round_form_number(totals["reduced_salary"]),
+        'regular_count_hidden': totals["regular_count"],
+        'reduced_count_hidden': totals["reduced_count"],
+        'total_salary_hidden': round_form_number(totals["regular_salary"] + totals["reduced_salary"]),
+
+        'totalGrossSalary': round_form_number(totals["gross_taxable"]),
+        'totalIncomeTax': round_form_number(totals["income_tax"]),
+        'totalNationalInsurance': round_form_number(totals["national_insurance_deductions"]),
+        'totalHealthInsurance': round_form_number(totals["health_insurance_deductions"]),
+        'totalProvidentDeduction': round_form_number(totals["study_fund_deductions"]),
+
+        'totalEmpPension': round_form_number(totals["employee_pension_fund"]),
+        'totalSelfPension': round_form_number(totals["self_employed_pension_fund"]),
+        'totalPensionDeduction': round_form_number(totals["emp_pension_combined"]),
+
+        'totalPensionVal': round_form_number(totals["pension_fund"]),
+        'totalCompVal': round_form_number(totals["compensation"]),
+        'totalDisabilityVal': round_form_number(totals["disability"]),
+        'totalStudyFundVal': round_form_number(totals["study_fund"]),
+        'employerPension': round_form_number(totals["employer_pension_combined"]),
+
+        'totalEmpDeductions': round_form_number(totals["emp_deductions_total"]),
+        'finalTotalsPaid': round_form_number(totals["final_totals_paid"]),
+        'finalTotalIncomeTax': round_form_number(totals["income_tax"]),
+    }
+
 # --------------------
 #  Form B102 Form Data
 # ----------------------
@@ -3322,6 +3295,7 @@ def form_B102():
                         if hasattr(employee, attr):
                             setattr(employee, attr, value)
             db.session.commit()
+            identity_cache.invalidate(employee.id)
 
         #  שמירת נתוני הטופס ב-session
         session['form_data'] = request.form.to_dict()
@@ -3396,128 +3370,11 @@ def form_B102():
 
     #  חישוב totals
     form_data = session.get('form_data', {})
-    all_hours = load_hours(selected_year) or {}
-
-    employee_count = 0
-    total_gross = 0.0
-    total_income_tax = 0.0
-    total_ni_employee = 0.0
-    total_health = 0.0
-    total_study_fund_deductions = 0.0
-
-    emp_pension = 0.0
-    self_pension = 0.0
-
-    pension_val = 0.0
-    comp_val = 0.0
-    disability_val = 0.0
-    study_fund_val = 0.0
-
-    regular_salary = 0.0
-    reduced_salary = 0.0
-    regular_count = 0
-    reduced_count = 0
-
     month_key = f"{selected_year}-{str(selected_month).zfill(2)}"
-
-    # Clean Number helper
-    def cn(val):
-        try:
-            return float(str(val).replace("₪", "").replace(",", "").strip())
-        except:
-            return 0.0
-
-    for emp_id, emp_months in all_hours.items():
-        if month_key in emp_months:
-            employee_count += 1
-
-            tax_data = emp_months[month_key].get("hours_table", {}).get("tax", {})
-
-            gross_taxable = cn(tax_data.get("gross_taxable", 0))
-            dob = tax_data.get("date_of_birth") or None
-
-            #  חישוב שכר רגיל / מופחת לפי גיל
-            if dob:
-                try:
-                    birth = datetime.strptime(dob, "%Y-%m-%d")
-                    today = datetime.today()
-                    age = today.year - birth.year - ((today.month, today.day) < (birth.month, birth.day))
-                except:
-                    age = 0
-            else:
-                age = 0
-
-            if age < 18 or age >= 67:
-                reduced_salary += gross_taxable
-                reduced_count += 1
-            else:
-                regular_salary += gross_taxable
-                regular_count += 1
-
-            total_gross += gross_taxable
-            total_income_tax += cn(tax_data.get("income_tax", 0))
-            total_ni_employee += cn(tax_data.get("national_insurance_deductions", 0))
-            total_health += cn(tax_data.get("health_insurance_deductions", 0))
-            total_study_fund_deductions += cn(tax_data.get("study_fund_deductions", 0))
-
-            emp_pension += cn(tax_data.get("employee_pension_fund", 0))
-            self_pension += cn(tax_data.get("self_employed_pension_fund", 0))
-
-            pension_val += cn(tax_data.get("pension_fund", 0))
-            comp_val += cn(tax_data.get("compensation", 0))
-            disability_val += cn(tax_data.get("disability", 0))
-            study_fund_val += cn(tax_data.get("study_fund", 0))
-
-    final_emp_pension_combined = emp_pension + self_pension
-
-    final_emp_deductions_total = (
-        total_ni_employee +
-        total_health +
-        final_emp_pension_combined +
-        total_study_fund_deductions
-    )
-
-    total_employer_pension_combined = (
-        pension_val +
-        comp_val +
-        disability_val +
-        study_fund_val
-    )
-
-    final_totals_paid = (
-        final_emp_deductions_total +
-        total_employer_pension_combined
-    )
-
-    final_totals_income_tax = total_income_tax
+    totals = month_employer_totals(selected_year, month_key)
 
     form_data.update({
-        'NumEmployees': employee_count,
-        'regular_salary_hidden': round_form_number(regular_salary),
-        'reduced_salary_hidden': round_form_number(reduced_salary),
-        'regular_count_hidden': regular_count,
-        'reduced_count_hidden': reduced_count,
-        'total_salary_hidden': round_form_number(regular_salary + reduced_salary),
-         
-        'totalGrossSalary': round_form_number(total_gross),
-        'totalIncomeTax': round_form_number(total_income_tax),
-        'totalNationalInsurance': round_form_number(total_ni_employee),
-        'totalHealthInsurance': round_form_number(total_health),
-        'totalProvidentDeduction': round_form_number(total_study_fund_deductions),
-
-        'totalEmpPension': round_form_number(emp_pension),
-        'totalSelfPension': round_form_number(self_pension),
-        'totalPensionDeduction':round_form_number(final_emp_pension_combined),
-
-        'totalPensionVal': round_form_number(pension_val),
-        'totalCompVal': round_form_number(comp_val),
-        'totalDisabilityVal': round_form_number(disability_val),
-        'totalStudyFundVal': round_form_number(study_fund_val),
-        'employerPension': round_form_number(total_employer_pension_combined),
-
-        'totalEmpDeductions': round_form_number(final_emp_deductions_total),
-        'finalTotalsPaid': round_form_number(final_totals_paid),
-        'finalTotalIncomeTax': round_form_number(final_totals_income_tax),
+        **build_102_form_fields(totals),
 
         'reportMonth': selected_month,
         'reportYear': selected_year
@@ -3581,106 +3438,29 @@ def save_form_B102():
         # === 4) שמירה ל־JSON לפי חודש ===
         json_path = os.path.join(year_folder, f"B102_{month}_{year}.json")
 
-        # טוען קובץ קיים אם יש
-        if os.path.exists(json_path):
-            with open(json_path, "r", encoding="utf-8") as f:
-                month_data = json.load(f)
-        else:
-            month_data = {}
-
-        # עדכון נתוני העובד
-        month_data[employee_id] = {
-            "employee_name": employee_name,
-            "form_data": data
-        }
+        # עדכון נתוני העובד בקובץ החודש (קריאה-עדכון-כתיבה תחת נעילה, כתיבה אטומית)
+        def update_employee(month_data):
+            month_data[employee_id] = {
+                "employee_name": employee_name,
+                "form_data": data
+            }
 
-        # כתיבה לקובץ JSON
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(month_data, f, ensure_ascii=False, indent=4)
+        file_store.update_json(json_path, update_employee, indent=4)
 
-        # === 5) בניית CSV ===
+        # === 5-6) CSV + XLSX ברקע (JSON כבר נשמר) ===
         csv_path = os.path.join(year_folder, f"B102_{month}_{year}.csv")
-
-        fieldnames = list(data.keys())
-
-        with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerow(data)
-
-        # === 6) יצירת XLSX ===
         xlsx_path = os.path.join(year_folder, f"B102_{month}_{year}.xlsx")
 
-        df = pd.DataFrame([data])
-        save_B102_excel(csv_path, xlsx_path)
+        job = export_queue.submit(export_key(xlsx_path), write_form_export, dict(data), csv_path, xlsx_path, 'FormB102')
 
         # === 7) עדכון session ===
         session["form_B102"] = data
 
-        return jsonify(success=True, message="טופס B102 נשמר בהצלחה!")
+        return jsonify(success=True, message="טופס B102 נשמר בהצלחה!", export_key=job["key"])
 
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
 
-# ----------------------
-#  Save To Csv And Xlsx All Data On Folder Form B102
-# ----------------------
-
-def save_B102_excel(csv_path, xlsx_path):
-    if not os.path.exists(csv_path):
-        return
-
-    df = pd.read_csv(csv_path, encoding='utf-8-sig')
-
-    with pd.ExcelWriter(xlsx_path, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='FormB102')
-
-        workbook  = writer.book
-        worksheet = writer.sheets['FormB102']
-
-        # Freeze header
-        worksheet.freeze_panes(1, 0)
-
-        # RTL
-        worksheet.right_to_left()
-
-        # Auto column width
-        for i, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-            worksheet.set_column(i, i, max_len)
-
-        # Header format
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#000000',
-            'font_color': '#FFFFFF',
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1
-        })
-
-        # Body formats
-        body_format = workbook.add_format({
-            'border': 1,
-            'border_color': '#FFFFFF',
-            'bg_color': '#D9EAF7'
-        })
-
-        alt_body_format = workbook.add_format({
-            'border': 1,
-            'border_color': '#FFFFFF',
-            'bg_color': '#F2F2F2'
-        })
-
-        # Apply header
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-
-        # Apply striped rows
-        for row_num in range(1, len(df) + 1):
-            fmt = body_format if row_num % 2 else alt_body_format
-            worksheet.set_row(row_num, None, fmt)
-
 # --------------------
 #  Save Form B102 Report Data To Folder
 # ---------------------- 
@@ -3710,13 +3490,11 @@ def save_formB102_report():
     xml_path = os.path.join(year_folder, filename_xml)
 
     # === שמירת JSON ===
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    file_store.write_json(json_path, data)
 
     # === שמירת XML ===
     xml_content = data["xml"]
-    with open(xml_path, "w", encoding="utf-8") as f:
-        f.write(xml_content)
+    file_store.atomic_write(xml_path, xml_content)
 
     return jsonify({
         "success": True,
@@ -3895,6 +3673,7 @@ def form_H102():
                         if hasattr(employee, attr):
                             setattr(employee, attr, value)
             db.session.commit()
+            identity_cache.invalidate(employee.id)
 
         #  שמירת נתוני הטופס ב-session
         session['form_data'] = request.form.to_dict()
@@ -3968,106 +3747,14 @@ def form_H102():
 
     #  חישוב totals
     form_data = session.get('form_data', {})
-    all_hours = load_hours(selected_year) or {}
-
-    employee_count = 0
-    total_gross = 0.0
-    total_income_tax = 0.0
-    total_ni_employee = 0.0
-    total_health = 0.0
-    total_study_fund_deductions = 0.0
-
-    emp_pension = 0.0
-    self_pension = 0.0
-
-    pension_val = 0.0
-    comp_val = 0.0
-    disability_val = 0.0
-    study_fund_val = 0.0
-
-    regular_salary = 0.0
-    reduced_salary = 0.0
-    regular_count = 0
-    reduced_count = 0
-
     month_key = f"{selected_year}-{str(selected_month).zfill(2)}"
-
-    # Clean Number helper
-    def cn(val):
-        try:
-            return float(str(val).replace("₪", "").replace(",", "").strip())
-        except:
-            return 0.0
-
-    for emp_id, emp_months in all_hours.items():
-        if month_key in emp_months:
-            employee_count += 1
-
-            tax_data = emp_months[month_key].get("hours_table", {}).get("tax", {})
-
-            gross_taxable = cn(tax_data.get("gross_taxable", 0))
-            dob = tax_data.get("date_of_birth") or None
-
-            #  חישוב שכר רגיל / מופחת לפי גיל
-            if dob:
-                try:
-                    birth = datetime.strptime(dob, "%Y-%m-%d")
-                    today = datetime.today()
-                    age = today.year - birth.year - ((today.month, today.day) < (birth.month, birth.day))
-                except:
-                    age = 0
-            else:
-                age = 0
-
-            if age < 18 or age >= 67:
-                reduced_salary += gross_taxable
-                reduced_count += 1
-            else:
-                regular_salary += gross_taxable
-                regular_count += 1
-
-            total_gross += gross_taxable
-            total_income_tax += cn(tax_data.get("income_tax", 0))
-            total_ni_employee += cn(tax_data.get("national_insurance_deductions", 0))
-            total_health += cn(tax_data.get("health_insurance_deductions", 0))
-            total_study_fund_deductions += cn(tax_data.get("study_fund_deductions", 0))
-
-            emp_pension += cn(tax_data.get("employee_pension_fund", 0))
-            self_pension += cn(tax_data.get("self_employed_pension_fund", 0))
-
-            pension_val += cn(tax_data.get("pension_fund", 0))
-            comp_val += cn(tax_data.get("compensation", 0))
-            disability_val += cn(tax_data.get("disability", 0))
-            study_fund_val += cn(tax_data.get("study_fund", 0))
-
-    final_emp_pension_combined = emp_pension + self_pension
-
-    final_emp_deductions_total = (
-        total_ni_employee +
-        total_health +
-        final_emp_pension_combined +
-        total_study_fund_deductions
-    )
-
-    total_employer_pension_combined = (
-        pension_val +
-        comp_val +
-        disability_val +
-        study_fund_val
-    )
-
-    final_totals_paid = (
-        final_emp_deductions_total +
-        total_employer_pension_combined
-    )
-
-    final_totals_income_tax = total_income_tax
+    totals = month_employer_totals(selected_year, month_key)
 
     # ====== התאמה לטופס H102 ======
     # נניח שכל המס שנוכה הוא "מס ממשכורת בתחום אילת" (א),
     # בלי פירוק לבעלי שליטה / מחוץ לאילת (אפשר לעדכן לוגיקה בהמשך אם תרצה).
 
-    eilat_regular_tax = total_income_tax
+    eilat_regular_tax = totals["income_tax"]
     eilat_benefit_20 = eilat_regular_tax * 0.20
     eilat_total_tax_after_benefit = eilat_regular_tax - eilat_benefit_20
 
@@ -4083,32 +3770,7 @@ def form_H102():
     )
 
     form_data.update({
-        'NumEmployees': employee_count,
-        'regular_salary_hidden': round_form_number(regular_salary),
-        'reduced_salary_hidden': round_form_number(reduced_salary),
-        'regular_count_hidden': regular_count,
-        'reduced_count_hidden': reduced_count,
-        'total_salary_hidden': round_form_number(regular_salary + reduced_salary),
-         
-        'totalGrossSalary': round_form_number(total_gross),
-        'totalIncomeTax': round_form_number(total_income_tax),
-        'totalNationalInsurance': round_form_number(total_ni_employee),
-        'totalHealthInsurance': round_form_number(total_health),
-        'totalProvidentDeduction': round_form_number(total_study_fund_deductions),
-
-        'totalEmpPension': round_form_number(emp_pension),
-        'totalSelfPension': round_form_number(self_pension),
-        'totalPensionDeduction':round_form_number(final_emp_pension_combined),
-
-        'totalPensionVal': round_form_number(pension_val),
-        'totalCompVal': round_form_number(comp_val),
-        'totalDisabilityVal': round_form_number(disability_val),
-        'totalStudyFundVal': round_form_number(study_fund_val),
-        'employerPension': round_form_number(total_employer_pension_combined),
-
-        'totalEmpDeductions': round_form_number(final_emp_deductions_total),
-        'finalTotalsPaid': round_form_number(final_totals_paid),
-        'finalTotalIncomeTax': round_form_number(final_totals_income_tax),
+        **build_102_form_fields(totals),
 
         # ----- שדות H102 עצמם -----
         'eilat_regular_tax': round_form_number(eilat_regular_tax),
@@ -4191,106 +3853,29 @@ def save_form_H102():
         # === 4) שמירה ל־JSON לפי חודש ===
         json_path = os.path.join(year_folder, f"H102_{month}_{year}.json")
 
-        # טוען קובץ קיים אם יש
-        if os.path.exists(json_path):
-            with open(json_path, "r", encoding="utf-8") as f:
-                month_data = json.load(f)
-        else:
-            month_data = {}
-
-        # עדכון נתוני העובד
-        month_data[employee_id] = {
-            "employee_name": employee_name,
-            "form_data": data
-        }
+        # עדכון נתוני העובד בקובץ החודש (קריאה-עדכון-כתיבה תחת נעילה, כתיבה אטומית)
+        def update_employee(month_data):
+            month_data[employee_id] = {
+                "employee_name": employee_name,
+                "form_data": data
+            }
 
-        # כתיבה לקובץ JSON
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(month_data, f, ensure_ascii=False, indent=4)
+        file_store.update_json(json_path, update_employee, indent=4)
 
-        # === 5) בניית CSV ===
+        # === 5-6) CSV + XLSX ברקע (JSON כבר נשמר) ===
         csv_path = os.path.join(year_folder, f"H102_{month}_{year}.csv")
-
-        fieldnames = list(data.keys())
-
-        with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerow(data)
-
-        # === 6) יצירת XLSX ===
         xlsx_path = os.path.join(year_folder, f"H102_{month}_{year}.xlsx")
 
-        df = pd.DataFrame([data])
-        save_H102_excel(csv_path, xlsx_path)
+        job = export_queue.submit(export_key(xlsx_path), write_form_export, dict(data), csv_path, xlsx_path, 'FormH102')
 
         # === 7) עדכון session ===
         session["form_H102"] = data
 
-        return jsonify(success=True, message="טופס H102 נשמר בהצלחה!")
+        return jsonify(success=True, message="טופס H102 נשמר בהצלחה!", export_key=job["key"])
 
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
 
-# ----------------------
-#  Save To Csv And Xlsx All Data On Folder Form H102
-# ----------------------
-
-def save_H102_excel(csv_path, xlsx_path):
-    if not os.path.exists(csv_path):
-        return
-
-    df = pd.read_csv(csv_path, encoding='utf-8-sig')
-
-    with pd.ExcelWriter(xlsx_path, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='FormH102')
-
-        workbook  = writer.book
-        worksheet = writer.sheets['FormH102']
-
-        # Freeze header
-        worksheet.freeze_panes(1, 0)
-
-        # RTL
-        worksheet.right_to_left()
-
-        # Auto column width
-        for i, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-            worksheet.set_column(i, i, max_len)
-
-        # Header format
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#000000',
-            'font_color': '#FFFFFF',
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1
-        })
-
-        # Body formats
-        body_format = workbook.add_format({
-            'border': 1,
-            'border_color': '#FFFFFF',
-            'bg_color': '#D9EAF7'
-        })
-
-        alt_body_format = workbook.add_format({
-            'border': 1,
-            'border_color': '#FFFFFF',
-            'bg_color': '#F2F2F2'
-        })
-
-        # Apply header
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-
-        # Apply striped rows
-        for row_num in range(1, len(df) + 1):
-            fmt = body_format if row_num % 2 else alt_body_format
-            worksheet.set_row(row_num, None, fmt)
-
 # --------------------
 #  Save Form H102 Report Data To Folder
 # ---------------------- 
@@ -4320,13 +3905,11 @@ def save_formH102_report():
     xml_path = os.path.join(year_folder, filename_xml)
 
     # === שמירת JSON ===
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    file_store.write_json(json_path, data)
 
     # === שמירת XML ===
     xml_content = data["xml"]
-    with open(xml_path, "w", encoding="utf-8") as f:
-        f.write(xml_content)
+    file_store.atomic_write(xml_path, xml_content)
 
     return jsonify({
         "success": True,
@@ -4541,6 +4124,7 @@ def form_106():
                         setattr(employee, attr, value)
 
         db.session.commit()
+        identity_cache.invalidate(employee.id)
 
         # Save form data for re-render
         session['form_data'] = request.form.to_dict()
@@ -4552,7 +4136,7 @@ def form_106():
     employee_id = request.args.get('employee_id') or session.get('employee_id')
 
     form_data = session.get('form_data', {})
-    all_hours = load_hours(selected_year) or {}
+    all_hours = load_employee_hours(selected_year, employee_id) if employee_id else {}
 
     # Initialize summary variables
     final_yearly_gross = 0.0
@@ -4717,6 +4301,7 @@ def form_161():
                             setattr(employee, attr, value)
 
             db.session.commit()
+            identity_cache.invalidate(employee.id)
 
         # Save form data to session
         session['form_161_data'] = request.form.to_dict()
@@ -4956,6 +4541,7 @@ def contact_form():
                 db.session.add(employee)
 
             db.session.commit()
+            identity_cache.invalidate(employee.id)
             session['employee_data'] = form_data
 
             # שליחת מייל
@@ -5877,19 +5463,79 @@ def tax_credit_simulator():
 @app.route('/get_days/<int:year>/<int:month>')
 @login_required
 def get_days(year, month):
-    days_data = get_days_in_month(year, month)
-    return jsonify(days_data)
+    try:
+        days_data = get_days_in_month(year, month)
+        etag = work_calendar.month_etag(year, month)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return calendar_response(days_data, etag)
+
+
+def calendar_response(payload, etag):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, max-age=86400"
+    return response.make_conditional(request)
+
+
+@app.route('/api/calendar/<int:year>/<int:month>')
+@login_required
+def calendar_month(year, month):
+    try:
+        days = work_calendar.month_days(year, month)
+        etag = work_calendar.month_etag(year, month)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return calendar_response({"year": year, "month": month, "days": days}, etag)
+
+
+@app.route('/api/calendar/range')
+@login_required
+def calendar_range():
+    try:
+        start = datetime.strptime(request.args.get("from", ""), "%Y-%m-%d").date()
+        end = datetime.strptime(request.args.get("to", ""), "%Y-%m-%d").date()
+        if (end - start).days > 366 * 2:
+            raise ValueError("range longer than two years")
+        days = work_calendar.range_days(start, end)
+        etag = work_calendar.range_etag(start, end)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if request.args.get("only") == "holidays":
+        days = [d for d in days if d["holiday"] or d["holiday_eve"]]
+        etag += "-h"
+    return calendar_response({"from": start.isoformat(), "to": end.isoformat(), "days": days}, etag)
 
 # ----------------------
 # Protected Socket Events
 # ----------------------
+# Every socket joins its session's own room; managers (and the owner) also join
+# MANAGERS_ROOM. Job status (exports, payroll runs) is emitted to those rooms
+# only, never broadcast to every connected client.
+
+MANAGERS_ROOM = "managers"
+
+
+def session_room():
+    """Private socket room of the logged-in session (owner or SQL user), or None."""
+    if session.get('owner_access'):
+        return "user:owner"
+    if session.get('user_id'):
+        return f"user:{session['user_id']}"
+    return None
+
+
 @socketio.on('connect')
 def handle_connect():
-    if not current_user.is_authenticated:
+    # same rule as login_required: owner session or logged-in SQL user
+    if not session.get('owner_access') and not session.get('user_id'):
         print('Unauthorized connection attempt')
         disconnect()
         return
-    print(f'Client connected: {current_user.username}')
+    join_room(session_room())
+    if session.get('owner_access') or session.get('role') == 'manager':
+        join_room(MANAGERS_ROOM)
+    print(f"Client connected: {session.get('user_name')}")
     # emit('response', {'message': 'Connected to server'})
 
 @socketio.on('disconnect')
@@ -5898,13 +5544,41 @@ def handle_disconnect():
 
 @socketio.on('message')
 def handle_message(data):
-    if not current_user.is_authenticated:
+    if not session.get('owner_access') and not session.get('user_id'):
         print('Unauthorized message attempt')
         disconnect()
         return
-    print(f'Received message from {current_user.username}: {data}')
+    print(f"Received message from {session.get('user_name')}: {data}")
     emit('response', {'message': 'Message received'})
 
+# ----------------------
+# Presence Board Socket Events (snapshot + deltas)
+# ----------------------
+# presence_subscribe {"company"?} -> join the room, answer with presence_snapshot;
+# afterwards presence_delta events arrive. A client that sees a seq gap
+# simply subscribes again.
+
+@socketio.on('presence_subscribe')
+def handle_presence_subscribe(data=None):
+    company = presence_company_for_session((data or {}).get("company"))
+    if company is None:
+        emit('presence_error', {'message': 'מנהל בלבד'})
+        return
+
+    previous = session.get('presence_company')
+    if previous and previous != company:
+        leave_room(presence.room(previous))
+    session['presence_company'] = company
+
+    join_room(presence.room(company))
+    emit('presence_snapshot', presence.board.snapshot(company))
+
+@socketio.on('presence_unsubscribe')
+def handle_presence_unsubscribe():
+    company = session.pop('presence_company', None)
+    if company:
+        leave_room(presence.room(company))
+
 # ----------------------
 # Run it
 # ----------------------
@@ -0,0 +1,365 @@
+import re, calendar
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+import work_calendar
+
+# ----------------------
+# Overtime Classification (server copy of static/formulas.js)
+# ----------------------
+#
+# Same rules as the index hours table (updateHours + updateColumn8..24,
+# food break, checkWeeklyHours, calculate*ForMonth), for whole months and many
+# employees at once: every value is an integer number of hundredths of an
+# hour in an (employees x days) array, so min / subtract / compare give
+# exactly what the browser shows after toFixed(2).
+#
+#   col 7   hours_calculated                  end - start (overnight wraps)
+#   col 8   hours_calculated_regular_day      min(hours, 8 / night 7), Friday up to 42 a week
+#   col 9   total_extra_hours_regular_day     hours - col 8
+#   col 10  extra_hours125_regular_day        first 2 extra hours
+#   col 11  extra_hours150_regular_day        the rest
+#   col 12  hours_holidays_day                Saturday / holiday hours above the cap
+#   col 13  extra_hours150_holidays_saturday  Saturday / holiday hours up to the cap
+#   col 14  extra_hours175_holidays_saturday  first 2 above the cap
+#   col 15  extra_hours200_holidays_saturday  the rest
+#   col 18  food_break                        0.5 above 8.5 hours, 1.0 above 11.5
+#   col 19  final_totals_hours                paid hours of the day
+#
+# One deliberate difference: updateColumn8 throws on sick days (it assigns a
+# const), which leaves the browser's row stale; here the sick ladder it was
+# written for (day 1: 0, days 2-3: 4, then 8 hours) is applied.
+
+# isHoliday() in formulas.js (classify_months(..., legal_holidays=True) uses the
+# computed rest days of work_calendar instead)
+HOLIDAYS = {
+    '27/03/2021', '28/03/2021', '15/04/2021', '17/05/2021', '06/09/2021', '07/09/2021', '16/09/2021', '20/09/2021', '21/09/2021',
+    '18/03/2022', '15/04/2022', '05/05/2022', '05/06/2022', '25/09/2022', '26/09/2022', '05/10/2022', '09/10/2022', '10/10/2022',
+    '05/04/2023', '06/04/2023', '26/04/2023', '15/09/2023', '16/09/2023', '25/09/2023', '29/09/2023', '30/09/2023',
+    '22/04/2024', '23/04/2024', '14/05/2024', '12/06/2024', '02/10/2024', '03/10/2024', '12/10/2024', '16/10/2024', '17/10/2024',
+    '12/04/2025', '13/04/2025', '01/05/2025', '02/06/2025', '22/09/2025', '23/09/2025', '02/10/2025', '06/10/2025', '07/10/2025',
+    '05/03/2026', '01/04/2026', '22/04/2026', '22/05/2026', '11/09/2026', '12/09/2026', '21/09/2026', '25/09/2026', '26/09/2026',
+    '21/04/2027', '22/04/2027', '12/05/2027', '11/06/2027', '01/10/2027', '02/10/2027', '11/10/2027', '15/10/2027', '16/10/2027',
+    '10/04/2028', '11/04/2028', '02/05/2028', '31/05/2028', '20/09/2028', '21/09/2028', '30/09/2028', '04/10/2028', '05/10/2028',
+}
+
+# he-IL long weekday names, JS getDay() order (Sunday = 0)
+DAY_NAMES = ["יום ראשון", "יום שני", "יום שלישי", "יום רביעי", "יום חמישי", "יום שישי", "יום שבת"]
+
+DAY_CAP = 800           # regular day cap (hundredths)
+NIGHT_CAP = 700         # shift starting 22:00-05:59
+EXTRA_125 = 200         # first 2 extra hours
+WEEK_LIMIT = 4200       # 42 hours
+
+# column -> output key
+COLUMNS = {
+    "c7": "hours_calculated",
+    "c8": "hours_calculated_regular_day",
+    "c9": "total_extra_hours_regular_day",
+    "c10": "extra_hours125_regular_day",
+    "c11": "extra_hours150_regular_day",
+    "c12": "hours_holidays_day",
+    "c13": "extra_hours150_holidays_saturday",
+    "c14": "extra_hours175_holidays_saturday",
+    "c15": "extra_hours200_holidays_saturday",
+    "c16": "sick_day",
+    "c17": "day_off",
+    "c18": "food_break",
+    "c19": "final_totals_hours",
+    "c23": "work_day",
+    "c24": "missing_work_day",
+}
+
+# calculate*ForMonth(): daily column -> monthly_totals key
+MONTHLY_COLUMNS = {
+    "c7": "hours_calculated_monthly",
+    "c8": "hours_calculated_regular_day_monthly",
+    "c9": "total_extra_hours_regular_day_monthly",
+    "c10": "extra_hours125_regular_day_monthly",
+    "c11": "extra_hours150_regular_day_monthly",
+    "c13": "extra_hours150_holidays_saturday_monthly",
+    "c14": "extra_hours175_holidays_saturday_monthly",
+    "c15": "extra_hours200_holidays_saturday_monthly",
+    "c16": "sick_day_monthly",
+    "c17": "day_off_monthly",
+    "c18": "food_break_monthly",
+    "c19": "final_totals_hours_monthly",
+    "c23": "work_day_monthly",
+    "c24": "missing_work_day_monthly",
+}
+
+# entry fields the engine does not compute, copied through
+PASS_THROUGH = ["calc1", "calc2", "calc3", "advance_payment"]
+
+_FLOAT_RE = re.compile(r"^\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)")
+_ISO_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+_IL_RE = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})$")
+
+
+# ----------------------
+# JS number helpers
+# ----------------------
+
+def js_parse_float(value):
+    """parseFloat(): leading number of the text, None for NaN."""
+    m = _FLOAT_RE.match(str(value if value is not None else ""))
+    return float(m.group(1)) if m else None
+
+
+def _js_number(text):
+    """Number() of one HH / MM part: '' -> 0, junk -> None."""
+    text = text.strip()
+    if not text:
+        return 0.0
+    m = _FLOAT_RE.match(text)
+    return float(m.group(1)) if m and m.end() == len(text) else None
+
+
+def to_hundredths(value):
+    """Hundredths of value the way toFixed(2) rounds it (halves away from zero)."""
+    return int(Decimal(value).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+
+def fmt(hundredths):
+    sign = "-" if hundredths < 0 else ""
+    hundredths = abs(int(hundredths))
+    return f"{sign}{hundredths // 100}.{hundredths % 100:02d}"
+
+
+def hours_calculated(start, end):
+    """calculateTimeDifference() as updateHours() stores it: hundredths, None when a time is empty."""
+    start, end = str(start or "").strip(), str(end or "").strip()
+    if not start or not end:
+        return None
+    (sh, sm), (eh, em) = [(p.split(":") + [""])[:2] if ":" in p else [p, None] for p in (start, end)]
+    parts = [_js_number(sh), _js_number(sm) if sm is not None else None,
+             _js_number(eh), _js_number(em) if em is not None else None]
+    if any(p is None for p in parts):
+        return 0
+    diff = (parts[2] * 60 + parts[3]) - (parts[0] * 60 + parts[1])
+    if diff < 0:
+        diff += 1440
+    return to_hundredths(diff / 60)
+
+
+def _start_hour(start):
+    """parseInt(start.split(':')[0]), None for NaN."""
+    m = re.match(r"^\s*([+-]?\d+)", str(start or "").split(":")[0])
+    return int(m.group(1)) if m else None
+
+
+def parse_date(value):
+    text = str(value or "").strip()
+    m = _ISO_RE.match(text)
+    if m:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = _IL_RE.match(text)
+    if m:
+        return date(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+    return None
+
+
+def il_date(d):
+    return d.strftime("%d/%m/%Y")
+
+
+def js_weekday(d):
+    return (d.weekday() + 1) % 7
+
+
+# ----------------------
+# Month Classification
+# ----------------------
+
+def _month_inputs(year, month, entries):
+    """Entries of one month -> per day (start, end, sick, day_off, entry)."""
+    n_days = calendar.monthrange(int(year), int(month))[1]
+    days = [None] * n_days
+    for entry in entries or []:
+        d = parse_date(entry.get("date"))
+        if d is not None and d.year == int(year) and d.month == int(month):
+            days[d.day - 1] = entry
+    return days
+
+
+def classify_months(year, month, months, legal_holidays=False):
+    """
+    months: {key: entries} of one calendar month (clock entries or index
+    hours-table entries, date as YYYY-MM-DD or DD/MM/YYYY).
+    legal_holidays: holidays from work_calendar instead of the formulas.js list.
+    Returns {key: {"work_day_entries", "monthly_totals", "paid_totals", "weekly_warnings"}}.
+    """
+    year, month = int(year), int(month)
+    keys = list(months)
+    n_days = calendar.monthrange(year, month)[1]
+    E = len(keys)
+    if not E:
+        return {}
+
+    dates = [date(year, month, d) for d in range(1, n_days + 1)]
+    days = work_calendar.month_arrays(year, month)
+    dow = days["weekday"].astype(np.int64)
+    saturday = days["saturday"]
+    if legal_holidays:
+        holiday = days["holiday"]
+    else:
+        holiday = np.array([il_date(d) in HOLIDAYS for d in dates])
+    sat_hol = np.broadcast_to(saturday | holiday, (E, n_days))
+    # Sunday-start week of each day (0..5), same grouping as getWeekStart()
+    week = (np.arange(n_days) - dow + 6) // 7
+    n_weeks = int(week.max()) + 1
+    in_week = (week[:, None] == np.arange(n_weeks)).astype(np.int64)      # days x weeks
+    week_start = [dates[0] - timedelta(days=int(dow[0]) - 7 * w) for w in range(n_weeks)]
+
+    # --- per-row text parsing (the only Python loop) ---
+    shape = (E, n_days)
+    c7 = np.zeros(shape, dtype=np.int64)
+    v7 = np.zeros(shape, dtype=bool)
+    has_start = np.zeros(shape, dtype=bool)
+    has_end = np.zeros(shape, dtype=bool)
+    start_hour = np.full(shape, -1, dtype=np.int64)
+    hour_ok = np.zeros(shape, dtype=bool)
+    sick = np.zeros(shape, dtype=bool)
+    sick_value = np.zeros(shape, dtype=np.int64)
+    vacation = np.zeros(shape, dtype=bool)
+    vacation_hours = np.zeros(shape, dtype=np.int64)
+    vacation_value = np.zeros(shape, dtype=np.int64)
+    rows = []
+
+    for i, key in enumerate(keys):
+        days = _month_inputs(year, month, months[key])
+        rows.append(days)
+        for j, entry in enumerate(days):
+            if not entry:
+                continue
+            start = str(entry.get("start_time") or "").strip()
+            end = str(entry.get("end_time") or "").strip()
+            has_start[i, j], has_end[i, j] = bool(start), bool(end)
+            hours = hours_calculated(start, end)
+            if hours is not None:
+                c7[i, j], v7[i, j] = hours, True
+            hour = _start_hour(start)
+            if hour is not None:
+                start_hour[i, j], hour_ok[i, j] = hour, True
+
+            sick_text = str(entry.get("sick_day") or "").strip()
+            if sick_text:
+                sick[i, j] = True
+                sick_value[i, j] = to_hundredths(js_parse_float(sick_text) or 0)
+            day_off_text = str(entry.get("day_off") or "").strip()
+            if day_off_text:
+                vacation[i, j] = True
+                days_off = js_parse_float(day_off_text) or 0
+                vacation_hours[i, j] = to_hundredths(days_off * 8)
+                vacation_value[i, j] = to_hundredths(days_off)
+
+    # --- col 8: regular hours ---
+    night = hour_ok & ((start_hour >= 22) | (start_hour < 6))
+    cap = np.where(night, NIGHT_CAP, DAY_CAP)
+    capped = np.minimum(c7, cap)
+
+    # Friday: whatever Sunday..Thursday left of the 42-hour week
+    counted = has_start & v7 & (dow <= 4)
+    week_totals = np.where(counted, capped, 0) @ in_week
+    friday_hours = np.minimum(capped, WEEK_LIMIT - week_totals[:, week])
+
+    # sick day number counts the earlier sick marks col 16 kept (days with hours)
+    worked = v7 & (c7 != 0)
+    kept = sick & worked & (sick_value != 0)
+    sick_number = np.cumsum(kept, axis=1) - kept + 1
+    sick_hours = np.where(sick_number == 1, 0, np.where(sick_number <= 3, 400, 800))
+
+    normal = has_start & has_end & v7 & ~sat_hol
+    c8 = np.where(dow == 5, friday_hours, capped)
+    c8 = np.where(vacation, vacation_hours, c8)
+    c8 = np.where(sick, sick_hours, c8)
+    v8 = sick | vacation | normal
+    c8 = np.where(v8, c8, 0)
+
+    # --- cols 9-11: weekday overtime ---
+    v9 = v7 & v8 & (c7 > c8)
+    c9 = np.where(v9, c7 - c8, 0)
+    v10 = v7 & (c7 != 0) & ~sat_hol & v9
+    c10 = np.where(v10, np.minimum(c9, EXTRA_125), 0)
+    c11 = np.where(v10, c9 - c10, 0)
+    v11 = v10 & (c11 != 0)
+
+    # --- cols 12-15: Saturday / holiday ---
+    weekend = has_start & v7 & sat_hol
+    c12 = np.where(weekend, np.maximum(c7 - cap, 0), 0)
+    v12 = weekend & (c12 > 0)
+    c13 = np.where(weekend, np.minimum(c7, cap), 0)
+    v13 = weekend
+    c14 = np.where(v12, np.minimum(c12, EXTRA_125), 0)
+    v14 = v12
+    c15 = np.where(v12, c12 - c14, 0)
+    v15 = v12 & (c15 > 0)
+
+    # --- cols 16-18: sick / vacation marks are kept only on days with hours, food break ---
+    c16 = np.where(worked, sick_value, 0)
+    v16 = c16 != 0
+    c17 = np.where(worked, vacation_value, 0)
+    v17 = c17 != 0
+    c18 = np.where(v7 & (c7 > 1150), 100, np.where(v7 & (c7 > 850), 50, 0))
+    v18 = c18 != 0
+
+    # --- col 19: paid hours of the day ---
+    total = c8 + c10 + c11 + c13 + c14 + c15 - c18
+    c19 = np.where(c16 > 0, c16, np.where(c17 > 0, 800, np.where(c7 == 0, 0, total)))
+    v19 = c19 != 0
+
+    # --- cols 23-24 ---
+    c23 = np.where(has_start & has_end, 100, 0)
+    v23 = np.ones(shape, dtype=bool)
+    c24, v24 = c8, v8
+
+    values = {"c7": (c7, v7), "c8": (c8, v8), "c9": (c9, v9), "c10": (c10, v10), "c11": (c11, v11),
+              "c12": (c12, v12), "c13": (c13, v13), "c14": (c14, v14), "c15": (c15, v15),
+              "c16": (c16, v16), "c17": (c17, v17), "c18": (c18, v18), "c19": (c19, v19),
+              "c23": (c23, v23), "c24": (c24, v24)}
+
+    # --- monthly totals (sum of what each cell shows) ---
+    monthly = {col: np.where(valid, value, 0).sum(axis=1) for col, (value, valid) in values.items()}
+    extra_weekend = monthly["c19"] - monthly["c24"] - monthly["c9"]
+
+    # --- weekly check: hours - food break per Sunday week ---
+    weekly = np.where(v7, c7 - c18, 0) @ in_week
+
+    # --- back to entries ---
+    result = {}
+    for i, key in enumerate(keys):
+        entries = []
+        for j, d in enumerate(dates):
+            source = rows[i][j] or {}
+            entry = {
+                "day": DAY_NAMES[dow[j]],
+                "date": il_date(d),
+                "saturday": "true" if saturday[j] else "false",
+                "holiday": "true" if holiday[j] else "false",
+                "start_time": str(source.get("start_time") or "").strip(),
+                "end_time": str(source.get("end_time") or "").strip(),
+            }
+            for col, name in COLUMNS.items():
+                value, valid = values[col]
+                entry[name] = fmt(value[i, j]) if valid[i, j] else ""
+            for name in PASS_THROUGH:
+                entry[name] = source.get(name, "")
+            entries.append(entry)
+
+        monthly_totals = {name: (fmt(monthly[col][i]) if monthly[col][i] else "") for col, name in MONTHLY_COLUMNS.items()}
+        warnings = [
+            {"week_start": il_date(week_start[w]), "hours": fmt(weekly[i, w])}
+            for w in range(n_weeks) if weekly[i, w] > WEEK_LIMIT
+        ]
+        result[key] = {
+            "work_day_entries": entries,
+            "monthly_totals": monthly_totals,
+            "paid_totals": {"final_total_extra_hours_weekend_monthly": fmt(extra_weekend[i]) if extra_weekend[i] else ""},
+            "weekly_warnings": warnings,
+        }
+    return result
+
+
+def classify_month(year, month, entries, legal_holidays=False):
+    """One employee-month (see classify_months)."""
+    return classify_months(year, month, {0: entries}, legal_holidays)[0]
@@ -0,0 +1,461 @@
+import os, re, calendar, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+
+from overtime_engine import js_parse_float, classify_months
+import tax_tables
+
+# ----------------------
+# Payroll Engine (server copy of the tax form in static/formulas.js)
+# ----------------------
+#
+# validateAndCalculateForm() re-runs every 150 ms (preserveAdvancePaymentValue
+# schedules it again), so the form settles on one consistent set of values;
+# this module computes that settled form for many employees at once. Every
+# field is an array over employees, every step is the same float64 operation
+# in the same order as the JS, and every value the JS writes into an input and
+# parses back is rounded here the way the JS wrote it (toFixed or
+# toLocaleString, see scaled()).
+#
+#   paid row     hours x hourly_rate x 1 / 1.25 / 1.5 / 1.75 / 2, food break, lunch
+#   salary       basic_salary, additional_payments, above_ceiling_fund, gross_taxable
+#   employer     pension 6.5%, compensation 8.33%, study fund 7.5%, disability 1%,
+#                national insurance (2 levels), miscellaneous, salary tax
+#   employee     pension 6%, study fund 2.5%, self employed pension fund (5% / 7.5% from 50),
+#                national insurance and health (2 levels, reduced under 18 and from 67),
+#                income tax (brackets - credit points - pension refund - city benefit - child points)
+#
+# Ages are taken on `today` like the browser does; a month run takes them on
+# the last day of that month (month_end), so a rerun gives the same form.
+# income_tax_before_credit below 1 shekel of taxable income counts as 0 (a
+# fresh form's rawValue).
+
+EMPLOYER_PENSION = 0.065
+EMPLOYER_COMPENSATION = 0.0833
+EMPLOYER_STUDY_FUND = 0.075
+EMPLOYER_DISABILITY = 0.01
+EMPLOYEE_PENSION = 0.06
+STUDY_FUND_DEDUCTION = 0.025
+
+# national insurance / health levels and the pension benefit: tax_tables (per tax year)
+NATIONAL_INSURANCE_REDUCED = 0.01
+HEALTH_INSURANCE_REDUCED = 0.03
+
+CEILING_FUND_AMOUNT = 15712.00
+CEILING_FUND_PERCENT = 0.075
+
+PROVIDENT_FUND_CREDIT = 0.35
+SELF_EMPLOYED_MAX_MONTHLY = 38412 / 12
+STUDY_FUND_MAX_MONTHLY = 13202 / 12
+
+PERSONAL_CONTRACT = "אישי"
+
+# tax form inputs read from EmployeeData / the month's saved tax form
+INPUT_FIELDS = (
+    "hourly_rate", "lunch_value", "thirteenth_salary", "mobile_value", "clothing_value", "cars_value",
+    "tax_credit_points", "tax_point_child", "monthly_city_tax_tops", "city_value_percentage",
+    "miscellaneous", "salary_tax", "miscellaneous_deductions", "contract_status", "date_of_birth",
+)
+
+SHARD_SIZE = int(os.getenv("PAYROLL_SHARD_SIZE", "250"))
+WORKERS = int(os.getenv("PAYROLL_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+_NOT_NUMBER_RE = re.compile(r"[^0-9.-]+")
+
+
+# ----------------------
+# JS parsing / rounding
+# ----------------------
+
+def parse_number(value):
+    """parseFloat(value.replace(/[^0-9.-]+/g, "")) || 0"""
+    if value is None:
+        return 0.0
+    number = js_parse_float(_NOT_NUMBER_RE.sub("", str(value)))
+    return number if number else 0.0
+
+
+def parse_plain(value):
+    """parseFloat(value.replace(/[,]/g, "").trim()) || 0 (no currency stripping)"""
+    if value is None:
+        return 0.0
+    number = js_parse_float(str(value).replace(",", "").strip())
+    return number if number else 0.0
+
+
+def _parse_nan(value):
+    """parseFloat(value.replace(/[^0-9.-]+/g, "")) keeping NaN."""
+    number = js_parse_float(_NOT_NUMBER_RE.sub("", str(value if value is not None else "")))
+    return np.nan if number is None else number
+
+
+def scaled(values, digits=2, shortest=False):
+    """
+    Round to integer units of 10^-digits, halves away from zero.
+    toFixed rounds the exact value of the double; toLocaleString (ICU) rounds
+    its shortest decimal form (shortest=True), so 168.285 gives 168.28 / 168.29.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    y = np.abs(x) * 10 ** digits
+    n = np.floor(y + 0.5)
+    # x * 10^digits is not exact: values close to a half are settled in Decimal
+    near = np.abs(y - np.floor(y) - 0.5) < 1e-9 + 1e-12 * y
+    if near.any():
+        quantum = Decimal(1).scaleb(-digits)
+        for i in zip(*np.nonzero(near)) if x.ndim else [()]:
+            exact = Decimal(repr(float(x[i]))) if shortest else Decimal(float(x[i]))
+            n[i] = abs(int(exact.quantize(quantum, rounding=ROUND_HALF_UP).scaleb(digits)))
+    return np.where(x < 0, -n, n).astype(np.int64)
+
+
+def rounded(values):
+    """What the JS reads back from a field it wrote with toLocaleString."""
+    return scaled(values, shortest=True) / 100.0
+
+
+def rounded_fixed(values):
+    """What the JS reads back from a field it wrote with toFixed(2)."""
+    return scaled(values) / 100.0
+
+
+def to_fixed(values, digits=2):
+    """toFixed(digits) strings ('-' only for negative numbers)."""
+    x = np.asarray(values, dtype=np.float64)
+    units = scaled(x, digits)
+    out = []
+    for value, unit in zip(x.ravel(), units.ravel()):
+        sign = "-" if value < 0 else ""
+        whole, part = divmod(abs(int(unit)), 10 ** digits)
+        out.append(f"{sign}{whole}.{part:0{digits}d}" if digits else f"{sign}{whole}")
+    return out
+
+
+def money(values):
+    """toLocaleString('en-US', 2 decimals): '1,234.56' ('-0.00' for negative zero, like Intl)."""
+    x = np.asarray(values, dtype=np.float64)
+    units = scaled(x, shortest=True)
+    out = []
+    for value, unit in zip(x.ravel(), units.ravel()):
+        sign = "-" if np.signbit(value) else ""
+        whole, part = divmod(abs(int(unit)), 100)
+        out.append(f"{sign}{whole:,}.{part:02d}")
+    return out
+
+
+# ----------------------
+# Employee inputs
+# ----------------------
+
+def _birth_date(text):
+    text = str(text or "").strip()
+    try:
+        if "-" in text:
+            y, m, d = text.split("-")[:3]
+            return date(int(y), int(m), int(d[:2]))
+        if "/" in text:
+            d, m, y = text.split("/")[:3]
+            return date(int(y), int(m), int(d))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def month_end(year, month):
+    """Last day of the month: the `today` of a month's payroll."""
+    year, month = int(year), int(month)
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def age_on(date_of_birth, today):
+    """Age the way the form computes it, None without a readable date."""
+    born = _birth_date(date_of_birth)
+    if born is None:
+        return None
+    age = today.year - born.year
+    if (today.month, today.day) < (born.month, born.day):
+        age -= 1
+    return age
+
+
+def _column(forms, key, parse=parse_number):
+    return np.array([parse(form.get(key)) for form in forms], dtype=np.float64)
+
+
+# ----------------------
+# Month payroll (many employees, one pass)
+# ----------------------
+
+def _levels(gross, levels, rate1, rate2):
+    """updateNationalInsuranceDeductions / updateHealthInsuranceDeductions level sums."""
+    (_, to1, _), (from2, to2, _) = levels
+    level1 = np.where(gross <= to1, gross * rate1, to1 * rate1)
+    level2 = np.where(gross > from2, (np.minimum(gross, to2) - from2) * rate2, 0.0)
+    return level1 + level2
+
+
+def run_payroll(forms, months, today=None, year=None):
+    """
+    forms: tax form inputs per employee (EmployeeData fields, overridden by the
+    month's saved tax form). months: overtime_engine results of the same
+    employees (monthly_totals, paid_totals, work_day_entries). year: tax year
+    of the brackets, credit point, insurance levels and pension benefit
+    (None -> the latest, like formulas.js).
+    Returns [{"paid_totals": {...}, "tax": {...}}] with the strings the browser shows.
+    """
+    today = today or date.today()
+    rates = tax_tables.table(year)
+    E = len(forms)
+    if not E:
+        return []
+
+    monthly = [m.get("monthly_totals", {}) for m in months]
+    weekend = [m.get("paid_totals", {}) for m in months]
+
+    def total(key, source=monthly):
+        return np.array([parse_number(t.get(key)) for t in source], dtype=np.float64)
+
+    m8 = total("hours_calculated_regular_day_monthly")
+    m9 = total("total_extra_hours_regular_day_monthly")
+    m10 = total("extra_hours125_regular_day_monthly")
+    m11 = total("extra_hours150_regular_day_monthly")
+    m13 = total("extra_hours150_holidays_saturday_monthly")
+    m14 = total("extra_hours175_holidays_saturday_monthly")
+    m15 = total("extra_hours200_holidays_saturday_monthly")
+    m16 = total("sick_day_monthly")
+    m17 = total("day_off_monthly")
+    m18 = total("food_break_monthly")
+    m23 = total("work_day_monthly")
+    m24 = total("missing_work_day_monthly")
+    extra_weekend = total("final_total_extra_hours_weekend_monthly", weekend)
+
+    advance_days = np.array([
+        sum((js_parse_float(_NOT_NUMBER_RE.sub("", str(e.get("advance_payment") or ""))) or 0.0)
+            for e in m.get("work_day_entries", []))
+        for m in months
+    ], dtype=np.float64)
+
+    rate = _column(forms, "hourly_rate")
+    lunch_value = _column(forms, "lunch_value")
+    thirteenth = _column(forms, "thirteenth_salary", parse_plain)
+    mobile = _column(forms, "mobile_value", parse_plain)
+    clothing = _column(forms, "clothing_value", parse_plain)
+    cars = _column(forms, "cars_value")
+    credit_points = _column(forms, "tax_credit_points")
+    child_points = _column(forms, "tax_point_child")
+    city_tops = _column(forms, "monthly_city_tax_tops")
+    city_rate = np.nan_to_num(_column(forms, "city_value_percentage", _parse_nan) / 100, nan=0.0)
+    misc_employer = _column(forms, "miscellaneous")
+    salary_tax_input = _column(forms, "salary_tax")
+    misc_deductions = _column(forms, "miscellaneous_deductions")
+    personal = np.array([str(f.get("contract_status") or "").strip() == PERSONAL_CONTRACT for f in forms])
+
+    ages = [age_on(f.get("date_of_birth"), today) for f in forms]
+    reduced = np.array([a is not None and (a < 18 or a >= 67) for a in ages])
+    over_50 = np.array([(a or 0) >= 50 for a in ages])
+
+    # --- paid row (calculate*PaymentForMonth) ---
+    regular_paid = rounded_fixed(m8 * rate)
+    paid_125 = rounded_fixed(m10 * rate * 1.25)
+    paid_150 = rounded_fixed(m11 * rate * 1.5)
+    paid_150_holidays = rounded_fixed(m13 * rate * 1.5)
+    paid_175_holidays = rounded_fixed(m14 * rate * 1.75)
+    paid_200_holidays = rounded_fixed(m15 * rate * 2)
+    food_unpaid = rounded_fixed(m18 * rate)
+    final_paid_raw = (m8 * rate + m10 * rate * 1.25 + m11 * rate * 1.5 + m13 * rate * 1.5
+                      + m14 * rate * 1.75 + m15 * rate * 2.0 - m18 * rate)
+    final_paid = rounded(final_paid_raw)
+    lunch_paid = rounded_fixed(m23 * lunch_value)
+    advance = rounded(rounded(advance_days))
+
+    # --- salary ---
+    additional_raw = np.where(personal, thirteenth + mobile + clothing + lunch_paid, final_paid - regular_paid)
+    additional = np.where(final_paid != 0, rounded(additional_raw), 0.0)
+    basic = regular_paid
+    gross_salary_raw = basic + additional
+    ceiling = rounded(np.where((rounded(gross_salary_raw) >= 1) & (regular_paid > CEILING_FUND_AMOUNT),
+                               (regular_paid - CEILING_FUND_AMOUNT) * CEILING_FUND_PERCENT, 0.0))
+    net_value_raw = basic + additional + cars
+    gross_taxable_raw = net_value_raw + ceiling
+    gross_taxable = rounded(gross_taxable_raw)
+
+    # --- employer ---
+    pension_fund = rounded(regular_paid * EMPLOYER_PENSION)
+    compensation = rounded(regular_paid * EMPLOYER_COMPENSATION)
+    study_fund = rounded(regular_paid * EMPLOYER_STUDY_FUND)
+    disability = rounded(regular_paid * EMPLOYER_DISABILITY)
+    (_, level1_to, level1_rate), (level2_from, level2_to, level2_rate) = rates.national_insurance_employer
+    national_insurance = rounded(np.minimum(gross_taxable, level1_to) * level1_rate
+                                 + np.maximum(0, np.minimum(gross_taxable, level2_to) - level2_from) * level2_rate)
+    miscellaneous = rounded(misc_employer)
+    salary_tax = rounded(salary_tax_input)
+    employer_total_raw = (pension_fund + compensation + study_fund + disability
+                          + miscellaneous + national_insurance + salary_tax)
+    salary_cost_raw = gross_salary_raw + employer_total_raw
+
+    # --- employee ---
+    has_basic = basic != 0
+    employee_pension = np.where(has_basic, rounded(regular_paid * EMPLOYEE_PENSION), 0.0)
+    study_fund_deductions = np.where(has_basic, rounded(regular_paid * STUDY_FUND_DEDUCTION), 0.0)
+    ni_levels, health_levels = rates.national_insurance_employee, rates.health_insurance
+    ni_deductions = rounded(_levels(
+        gross_taxable, ni_levels,
+        np.where(reduced, NATIONAL_INSURANCE_REDUCED, ni_levels[0][2]),
+        np.where(reduced, NATIONAL_INSURANCE_REDUCED, ni_levels[1][2])))
+    health_deductions = rounded(_levels(
+        gross_taxable, health_levels,
+        np.where(reduced, HEALTH_INSURANCE_REDUCED, health_levels[0][2]),
+        np.where(reduced, HEALTH_INSURANCE_REDUCED, health_levels[1][2])))
+    self_employed = rounded(np.where(cars > 0, additional + cars, additional) * np.where(over_50, 0.075, 0.05))
+
+    # --- income tax ---
+    taxable = (gross_taxable - np.minimum(self_employed, SELF_EMPLOYED_MAX_MONTHLY)
+               - np.minimum(study_fund_deductions, STUDY_FUND_MAX_MONTHLY))
+    bracket_tax = rates.tax_many(taxable)
+    taxed = taxable >= 1
+    tax_before_credit = np.where(taxed, rounded_fixed(bracket_tax), 0.0)
+
+    credit_raw = (rates.credit_point_value * credit_points) / 12
+    credit = rounded(credit_raw)
+    city_benefit = np.minimum(gross_taxable * city_rate, city_tops * city_rate)
+    refund = np.where((tax_before_credit > 0) & (employee_pension > 0),
+                      np.minimum(employee_pension, np.minimum(gross_taxable * 0.07, rates.pension_benefit_monthly))
+                      * PROVIDENT_FUND_CREDIT, 0.0)
+    after_credits = tax_before_credit - credit - refund
+    final_tax = after_credits - city_benefit - child_points
+    income_tax = rounded(np.where(final_tax > 0, final_tax, 0.0))
+
+    deductions_raw = (employee_pension + self_employed + study_fund_deductions + misc_deductions
+                      + ni_deductions + health_deductions + income_tax + advance)
+    net_payment_raw = gross_salary_raw - deductions_raw
+
+    tax_level = [f"{level:.2f}%" if level == level else "" for level in rates.levels(gross_taxable)]
+
+    # --- strings as the form shows them ---
+    def blank_zero(values, digits):
+        return [text if value != 0 else "" for value, text in zip(values, to_fixed(values, digits))]
+
+    paid_columns = {
+        "hours_calculated_regular_day_paid": to_fixed(regular_paid),
+        "extra_hours125_regular_day_paid": to_fixed(paid_125),
+        "extra_hours150_regular_day_paid": to_fixed(paid_150),
+        "extra_hours150_holidays_saturday_paid": to_fixed(paid_150_holidays),
+        "extra_hours175_holidays_saturday_paid": to_fixed(paid_175_holidays),
+        "extra_hours200_holidays_saturday_paid": to_fixed(paid_200_holidays),
+        "food_break_unpaid": to_fixed(food_unpaid),
+        "final_totals_hours_paid": money(final_paid_raw),
+        "final_totals_lunch_value_paid": to_fixed(lunch_paid),
+        "advance_payment_paid": money(advance_days),
+    }
+    additional_text = money(additional_raw)
+    tax_columns = {
+        "sick_days_salary": blank_zero(m16, 2),
+        "vacation_days_salary": blank_zero(m17, 2),
+        "total_work_days": to_fixed(m23, 1),
+        "total_missing_hours": to_fixed(m24, 1),
+        "final_extra_hours_weekend": to_fixed(extra_weekend, 1),
+        "final_extra_hours_regular": to_fixed(m9, 1),
+        "basic_salary": money(basic),
+        "totals_lunch_value": money(lunch_paid),
+        "additional_payments": [
+            text if paid != 0 and raw != 0 else ""
+            for paid, raw, text in zip(final_paid, additional_raw, additional_text)
+        ],
+        "net_value": money(net_value_raw),
+        "gross_salary": money(gross_salary_raw),
+        "above_ceiling_fund": money(ceiling),
+        "gross_taxable": money(gross_taxable_raw),
+        "pension_fund": money(pension_fund),
+        "compensation": money(compensation),
+        "study_fund": money(study_fund),
+        "disability": money(disability),
+        "miscellaneous": money(miscellaneous),
+        "national_insurance": money(national_insurance),
+        "salary_tax": money(salary_tax),
+        "total_employer_contributions": money(employer_total_raw),
+        "total_salary_cost": money(salary_cost_raw),
+        "total_salary_pension_funds": money(regular_paid),
+        "employee_pension_fund": money(employee_pension),
+        "self_employed_pension_fund": money(self_employed),
+        "study_fund_deductions": money(study_fund_deductions),
+        "national_insurance_deductions": money(ni_deductions),
+        "health_insurance_deductions": money(health_deductions),
+        "income_tax_before_credit": money(np.where(taxed, bracket_tax, 0.0)),
+        "tax_level_precente": tax_level,
+        "amount_tax_credit_points_monthly": money(credit_raw),
+        "final_city_tax_benefit": money(city_benefit),
+        "income_tax": money(income_tax),
+        "advance_payment_salary": money(advance),
+        "total_deductions": money(deductions_raw),
+        "net_payment": money(net_payment_raw),
+        "food_break_unpaid_salary": money(food_unpaid),
+        "hours125_regular_salary": money(paid_125),
+        "hours150_regular_salary": money(paid_150),
+        "hours150_holidays_saturday_salary": money(paid_150_holidays),
+        "hours175_holidays_saturday_salary": money(paid_175_holidays),
+        "hours200_holidays_saturday_salary": money(paid_200_holidays),
+    }
+
+    results = []
+    for i in range(E):
+        paid = {name: column[i] for name, column in paid_columns.items()}
+        paid["final_total_extra_hours_weekend_monthly"] = weekend[i].get("final_total_extra_hours_weekend_monthly", "")
+        tax = {name: column[i] for name, column in tax_columns.items()}
+        tax["miscellaneous_deductions"] = str(forms[i].get("miscellaneous_deductions") or "")
+        results.append({"paid_totals": paid, "tax": tax})
+    return results
+
+
+# ----------------------
+# Payroll Run (hours + tax form, process pool)
+# ----------------------
+
+def compute_shard(year, month, months, forms, today_iso):
+    """Worker: overtime and payroll of one shard -> {key: hours table of the month}."""
+    hours = classify_months(year, month, months)
+    keys = list(hours)
+    payroll = run_payroll([forms[k] for k in keys], [hours[k] for k in keys], date.fromisoformat(today_iso), year)
+    return {
+        key: {
+            "work_day_entries": hours[key]["work_day_entries"],
+            "monthly_totals": hours[key]["monthly_totals"],
+            "paid_totals": {**hours[key]["paid_totals"], **result["paid_totals"]},
+            "tax": result["tax"],
+        }
+        for key, result in zip(keys, payroll)
+    }
+
+
+def compute(year, month, months, forms, today=None, workers=None, shard_size=None, on_progress=None):
+    """
+    months: {key: entries of the month}, forms: {key: tax form inputs}.
+    today: date ages are taken on (default: the last day of the month).
+    Shards of employees run in a process pool when there is more than one;
+    on_progress(done, total) is called as shards finish.
+    """
+    today = today or month_end(year, month)
+    workers = workers or WORKERS
+    shard_size = shard_size or SHARD_SIZE
+    keys = list(months)
+    shards = [keys[i:i + shard_size] for i in range(0, len(keys), shard_size)]
+    jobs = [({k: months[k] for k in shard}, {k: forms[k] for k in shard}) for shard in shards]
+
+    results, done = {}, 0
+    if len(jobs) > 1 and workers > 1:
+        # spawn: workers import only the engines, never the Flask app
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context) as pool:
+            futures = {pool.submit(compute_shard, year, month, m, f, today.isoformat()): len(m) for m, f in jobs}
+            for future in as_completed(futures):
+                results.update(future.result())
+                done += futures[future]
+                if on_progress:
+                    on_progress(done, len(keys))
+    else:
+        for m, f in jobs:
+            results.update(compute_shard(year, month, m, f, today.isoformat()))
+            done += len(m)
+            if on_progress:
+                on_progress(done, len(keys))
+    return results
@@ -0,0 +1,267 @@
+import os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from graphlib import TopologicalSorter
+
+import overtime_engine
+import payroll_engine
+import yearly_totals
+import employer_totals
+
+# ----------------------
+# Payroll Field Dependency Graph (incremental recompute)
+# ----------------------
+#
+# Every field of a saved hours table (monthly_totals, paid_totals, tax and the
+# *_yearly fields) is a node; its edges are the fields formulas.js reads to
+# compute it. An edit names the inputs it changed (work_day_entries for day
+# rows, or tax form inputs such as hourly_rate); only the engines that own an
+# affected field run, and only affected fields whose value really changed are
+# written back, so a small correction does not rewrite the whole month.
+#
+#   work_day_entries -> monthly_totals          overtime_engine (one month: the
+#                                               42-hour week couples the days);
+#                                               only its computed columns are
+#                                               merged into the saved day rows
+#   monthly_totals + inputs -> paid / tax       payroll_engine
+#   tax -> *_yearly (this and later months)     yearly_totals
+#   tax -> employer totals of the month         employer_totals
+
+ENTRIES = "work_day_entries"
+
+RETRO_SHARD_SIZE = int(os.getenv("RETRO_SHARD_SIZE", "12"))     # months per worker task
+
+COMPUTED = list(overtime_engine.COLUMNS.values())       # day row columns the engine owns
+MONTHLY = list(overtime_engine.MONTHLY_COLUMNS.values())
+WEEKEND = "final_total_extra_hours_weekend_monthly"
+
+PAID_HOURS = {
+    "hours_calculated_regular_day_paid": "hours_calculated_regular_day_monthly",
+    "extra_hours125_regular_day_paid": "extra_hours125_regular_day_monthly",
+    "extra_hours150_regular_day_paid": "extra_hours150_regular_day_monthly",
+    "extra_hours150_holidays_saturday_paid": "extra_hours150_holidays_saturday_monthly",
+    "extra_hours175_holidays_saturday_paid": "extra_hours175_holidays_saturday_monthly",
+    "extra_hours200_holidays_saturday_paid": "extra_hours200_holidays_saturday_monthly",
+    "food_break_unpaid": "food_break_monthly",
+}
+REGULAR_PAID = "hours_calculated_regular_day_paid"
+
+DEPENDS = {
+    # hours engine
+    **{name: (ENTRIES,) for name in MONTHLY},
+    WEEKEND: (ENTRIES,),
+
+    # paid row
+    **{paid: (hours, "hourly_rate") for paid, hours in PAID_HOURS.items()},
+    "final_totals_hours_paid": tuple(PAID_HOURS.values()) + ("hourly_rate",),
+    "final_totals_lunch_value_paid": ("work_day_monthly", "lunch_value"),
+    "advance_payment_paid": (ENTRIES,),
+
+    # salary
+    "sick_days_salary": ("sick_day_monthly",),
+    "vacation_days_salary": ("day_off_monthly",),
+    "total_work_days": ("work_day_monthly",),
+    "total_missing_hours": ("missing_work_day_monthly",),
+    "final_extra_hours_weekend": (WEEKEND,),
+    "final_extra_hours_regular": ("total_extra_hours_regular_day_monthly",),
+    "basic_salary": (REGULAR_PAID,),
+    "total_salary_pension_funds": (REGULAR_PAID,),
+    "totals_lunch_value": ("final_totals_lunch_value_paid",),
+    "additional_payments": ("contract_status", "thirteenth_salary", "mobile_value", "clothing_value",
+                            "final_totals_lunch_value_paid", "final_totals_hours_paid", REGULAR_PAID),
+    "gross_salary": ("basic_salary", "additional_payments"),
+    "above_ceiling_fund": ("gross_salary", REGULAR_PAID),
+    "net_value": ("basic_salary", "additional_payments", "cars_value"),
+    "gross_taxable": ("net_value", "above_ceiling_fund"),
+    "food_break_unpaid_salary": ("food_break_unpaid",),
+    "hours125_regular_salary": ("extra_hours125_regular_day_paid",),
+    "hours150_regular_salary": ("extra_hours150_regular_day_paid",),
+    "hours150_holidays_saturday_salary": ("extra_hours150_holidays_saturday_paid",),
+    "hours175_holidays_saturday_salary": ("extra_hours175_holidays_saturday_paid",),
+    "hours200_holidays_saturday_salary": ("extra_hours200_holidays_saturday_paid",),
+
+    # employer
+    "pension_fund": (REGULAR_PAID,),
+    "compensation": (REGULAR_PAID,),
+    "study_fund": (REGULAR_PAID,),
+    "disability": (REGULAR_PAID,),
+    "national_insurance": ("gross_taxable",),
+    "total_employer_contributions": ("pension_fund", "compensation", "study_fund", "disability",
+                                     "miscellaneous", "national_insurance", "salary_tax"),
+    "total_salary_cost": ("gross_salary", "total_employer_contributions"),
+
+    # employee
+    "employee_pension_fund": ("basic_salary",),
+    "study_fund_deductions": ("basic_salary",),
+    "national_insurance_deductions": ("gross_taxable", "date_of_birth"),
+    "health_insurance_deductions": ("gross_taxable", "date_of_birth"),
+    "self_employed_pension_fund": ("additional_payments", "cars_value", "date_of_birth"),
+    "income_tax_before_credit": ("gross_taxable", "self_employed_pension_fund", "study_fund_deductions"),
+    "tax_level_precente": ("gross_taxable",),
+    "amount_tax_credit_points_monthly": ("tax_credit_points",),
+    "final_city_tax_benefit": ("gross_taxable", "city_value_percentage", "monthly_city_tax_tops"),
+    "income_tax": ("income_tax_before_credit", "amount_tax_credit_points_monthly", "employee_pension_fund",
+                   "gross_taxable", "final_city_tax_benefit", "tax_point_child"),
+    "advance_payment_salary": ("advance_payment_paid",),
+    "total_deductions": ("employee_pension_fund", "self_employed_pension_fund", "study_fund_deductions",
+                         "miscellaneous_deductions", "national_insurance_deductions",
+                         "health_insurance_deductions", "income_tax", "advance_payment_salary"),
+    "net_payment": ("gross_salary", "total_deductions"),
+
+    # yearly (running totals January .. month)
+    **{f"{name}_yearly": (name,) for name in yearly_totals.YEARLY_FIELDS},
+    "sick_days_balance_yearly": ("sick_days_salary_yearly",),
+    "vacation_balance_yearly": ("vacation_days_salary_yearly",),
+}
+
+INPUTS = {ENTRIES, *payroll_engine.INPUT_FIELDS}
+YEARLY = {f"{name}_yearly" for name in yearly_totals.YEARLY_FIELDS} | {"sick_days_balance_yearly", "vacation_balance_yearly"}
+EMPLOYER_TOTALS = set(employer_totals.TAX_FIELDS) | {"date_of_birth"}
+
+ORDER = list(TopologicalSorter(DEPENDS).static_order())
+
+DEPENDENTS = {}
+for _field, _inputs in DEPENDS.items():
+    for _input in _inputs:
+        DEPENDENTS.setdefault(_input, set()).add(_field)
+
+
+def affected(changed):
+    """Fields downstream of the changed inputs (inputs included), in evaluation order."""
+    seen, stack = set(), list(changed)
+    while stack:
+        field = stack.pop()
+        if field in seen:
+            continue
+        seen.add(field)
+        stack.extend(DEPENDENTS.get(field, ()))
+    return [field for field in ORDER if field in seen]
+
+
+def needs_yearly(changes):
+    return any(f in DEPENDENTS and any(d in YEARLY for d in DEPENDENTS[f]) for f in changes.get("tax", {}))
+
+
+def needs_employer_totals(changes):
+    return any(f in EMPLOYER_TOTALS for f in changes.get("tax", {}))
+
+
+# ----------------------
+# Recompute One Employee-Month
+# ----------------------
+
+def merge_entries(saved, edited):
+    """Saved day rows with the edited ones replaced (matched by date)."""
+    rows = {overtime_engine.parse_date(e.get("date")): e for e in saved or []}
+    for entry in edited or []:
+        day = overtime_engine.parse_date(entry.get("date"))
+        if day is not None:
+            rows[day] = {**rows.get(day, {}), **entry}
+    return [rows[d] for d in sorted(d for d in rows if d is not None)]
+
+
+def merge_classified(rows, classified):
+    """
+    Day rows of classify_month with everything but the computed columns taken
+    from the saved rows (day names, saturday / holiday marks and extra fields
+    stay as they were saved). Days without a saved row are the engine's rows.
+    """
+    saved = {overtime_engine.parse_date(e.get("date")): e for e in rows}
+    merged = []
+    for row in classified:
+        source = saved.get(overtime_engine.parse_date(row["date"]))
+        merged.append(row if source is None else {**source, **{name: row[name] for name in COMPUTED}})
+    return merged
+
+
+def recompute(table, year, month, form, entries=None, fields=None, today=None):
+    """
+    table: the saved hours table of the month (work_day_entries, monthly_totals,
+    paid_totals, tax). entries: edited day rows; fields: changed tax form inputs.
+    today: date ages are taken on (default: the last day of the month).
+    Returns (new table, {"work_day_entries": [changed rows], "monthly_totals",
+    "paid_totals", "tax": {changed field: value}}). *_yearly fields are left to
+    yearly_totals (see needs_yearly).
+    """
+    table = {block: (dict(table.get(block) or {}) if block != ENTRIES else list(table.get(block) or []))
+             for block in (ENTRIES, "monthly_totals", "paid_totals", "tax")}
+    fields = dict(fields or {})
+    form = {**form, **fields}
+    today = today or payroll_engine.month_end(year, month)
+    complete = bool(table["monthly_totals"]) and bool(table["tax"].get("net_payment"))
+
+    changed = set(fields) | ({ENTRIES} if entries else set())
+    todo = set(affected(changed)) if complete else set(DEPENDS) | INPUTS
+    changes = {ENTRIES: [], "monthly_totals": {}, "paid_totals": {}, "tax": {}}
+
+    for name in fields:
+        if table["tax"].get(name) != fields[name]:
+            table["tax"][name] = changes["tax"][name] = fields[name]
+
+    hours = {k: table[k] for k in (ENTRIES, "monthly_totals", "paid_totals")}
+    if ENTRIES in todo:
+        source = merge_entries(table[ENTRIES], entries)
+        hours = overtime_engine.classify_month(year, month, source)
+        hours[ENTRIES] = merge_classified(source, hours[ENTRIES])
+        old_rows = {overtime_engine.parse_date(e.get("date")): e for e in table[ENTRIES]}
+        changes[ENTRIES] = [row for row in hours[ENTRIES]
+                            if old_rows.get(overtime_engine.parse_date(row["date"])) != row]
+        table[ENTRIES] = hours[ENTRIES]
+        _apply(table, changes, "monthly_totals", hours["monthly_totals"], todo)
+        _apply(table, changes, "paid_totals", hours["paid_totals"], todo)
+
+    if todo & (set(DEPENDS) - set(MONTHLY) - {WEEKEND} - YEARLY):
+        payroll = payroll_engine.run_payroll([form], [hours], today, year)[0]
+        _apply(table, changes, "paid_totals", payroll["paid_totals"], todo)
+        _apply(table, changes, "tax", payroll["tax"], todo)
+
+    return table, changes
+
+
+def _apply(table, changes, block, values, todo):
+    for name, value in values.items():
+        if name in todo and table[block].get(name) != value:
+            table[block][name] = changes[block][name] = value
+
+
+# ----------------------
+# Recompute Many Months (retro changes, process pool)
+# ----------------------
+
+def recompute_shard(items, today_iso=None):
+    """
+    Worker: [(key, table, year, month, form, fields)] -> [(key, new table, changes)].
+    Without today_iso every month takes ages on its own last day.
+    """
+    today = date.fromisoformat(today_iso) if today_iso else None
+    return [(key, *recompute(table, year, month, form, None, fields, today))
+            for key, table, year, month, form, fields in items]
+
+
+def recompute_months(items, today=None, workers=None, shard_size=None, on_progress=None):
+    """
+    recompute() of many saved months with changed inputs; shards run in a spawn
+    pool. today: one date for every month (default: each month's last day).
+    """
+    today_iso = today.isoformat() if today else None
+    workers = workers or payroll_engine.WORKERS
+    shard_size = shard_size or RETRO_SHARD_SIZE
+    shards = [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+
+    results, done = {}, 0
+    if len(shards) > 1 and workers > 1:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=context) as pool:
+            futures = {pool.submit(recompute_shard, shard, today_iso): len(shard) for shard in shards}
+            for future in as_completed(futures):
+                results.update({key: (table, changes) for key, table, changes in future.result()})
+                done += futures[future]
+                if on_progress:
+                    on_progress(done, len(items))
+    else:
+        for shard in shards:
+            results.update({key: (table, changes) for key, table, changes in recompute_shard(shard, today_iso)})
+            done += len(shard)
+            if on_progress:
+                on_progress(done, len(items))
+    return results
@@ -0,0 +1,474 @@
+import os, re
+from datetime import datetime
+
+from sqlalchemy import or_
+
+from database import db, EmployeeData, Timesheet, User
+from employee_identity import identity_cache
+from export_worker import ExportQueue
+import file_store
+import hours_store
+import hours_sql
+import clock_store
+import clock_archive
+import employer_totals
+import yearly_totals
+import overtime_engine
+import payroll_engine
+import payroll_graph
+
+# ----------------------
+# Payroll Jobs (clock year close, overtime, payroll run / recompute / retro)
+# ----------------------
+#
+# The orchestration behind the payroll routes and CLI commands: which rows and
+# shards feed the engines, what gets written back and which background jobs
+# run. Functions that only need the clock folder are plain functions; the
+# payroll side is a PayrollJobs object that main builds once with the app and
+# its hours helpers (read backend, SQL mirror, CSV/XLSX exports, Socket.IO):
+#
+#   jobs = PayrollJobs(app, clock_dir, get_base_dir, load_month=..., ...)
+#   jobs.queue.submit(run_key(year, month), jobs.run_payroll_month, year, month)
+
+CLOCK_FILE_RE = re.compile(r"^clock_hours_(.+)_(\d{4})-(\d{2})\.json$")
+
+# work_percent is stored only: the tax form does not read it
+RETRO_FIELDS = payroll_engine.INPUT_FIELDS + ("work_percent",)
+
+
+# ----------------------
+# Clock Year Close (pack closed months into the yearly archive)
+# ----------------------
+
+def closed_clock_months(year, today=None):
+    today = today or datetime.now()
+    year = int(year)
+    if year < today.year:
+        return list(range(1, 13))
+    if year == today.year:
+        return list(range(1, today.month))
+    return []
+
+
+def close_clock_year(clock_dir, year, keep_files=False):
+    """
+    Pack the closed months of a year into clock_archive_{year}.bin:
+    Timesheet rows first, then month files whose month has no rows, then
+    whatever an earlier archive already held. Packed month files are removed.
+    """
+    year = str(year)
+    months = closed_clock_months(year)
+    if not months:
+        return {"year": year, "months": [], "rows": 0, "files_removed": 0}
+
+    packed = {}     # (employee_id, month) -> pack_year tuple
+
+    # 1) Timesheet rows (source of truth)
+    first, _ = clock_store.month_bounds(year, months[0])
+    _, last = clock_store.month_bounds(year, months[-1])
+    rows = (
+        Timesheet.query.filter(Timesheet.date >= first, Timesheet.date <= last)
+        .order_by(Timesheet.employee_id, Timesheet.date).all()
+    )
+    identities = identity_cache.get_many({row.employee_id for row in rows})
+    grouped = {}
+    for row in rows:
+        group = grouped.setdefault((row.employee_id, int(row.date[5:7])), (row, []))
+        group[1].append(clock_store.to_entry(row))
+    for (employee_id, month), (first_row, entries) in grouped.items():
+        identity = identities.get(employee_id) or first_row
+        name = identity.employee_name or ""
+        packed[(employee_id, month)] = (employee_id, name, identity.id_number or "", name.replace(" ", "_"), month, entries)
+
+    # 2) Month files not imported yet
+    files = []
+    for month in months:
+        folder = os.path.join(clock_dir, year, f"month_{month:02d}")
+        if not os.path.isdir(folder):
+            continue
+        for filename in os.listdir(folder):
+            m = CLOCK_FILE_RE.match(filename)
+            if not m or m.group(2) != year or int(m.group(3)) != month:
+                continue
+            path = os.path.join(folder, filename)
+            data = file_store.read_json(path, {}) or {}
+            employee_id = str(data.get("employee_id", "")).strip()
+            if not employee_id.isdigit():
+                print(f"⚠️ close_clock_year: {path} has no employee_id, left in place")
+                continue
+            files.append(path)
+            key = (int(employee_id), month)
+            if key not in packed:
+                entries = data.get("hours_table_clock", {}).get("work_day_entries", [])
+                packed[key] = (int(employee_id), data.get("employee_name", ""), data.get("id_number", ""),
+                               m.group(1), month, entries)
+
+    # 3) Months an earlier pack already holds (no rows, no file any more), read
+    #    under the lock so a drop_month in between is not packed back
+    with file_store.lock(clock_archive.archive_path(clock_dir, year)):
+        archive = clock_archive.open_archive(clock_dir, year)
+        if archive is not None:
+            for item in clock_archive.archived_months(archive, skip=set(packed)):
+                packed[(item[0], item[4])] = item
+        stats = clock_archive.pack_year(clock_archive.archive_path(clock_dir, year), year, packed.values())
+
+    removed = 0
+    if not keep_files:
+        for path in files:
+            os.remove(path)
+            removed += 1
+        for month in months:
+            folder = os.path.join(clock_dir, year, f"month_{month:02d}")
+            if os.path.isdir(folder) and not os.listdir(folder):
+                os.rmdir(folder)
+
+    return {"year": year, "months": months, **stats, "files_removed": removed}
+
+
+# ----------------------
+# Overtime Classification (server-side formulas.js rules)
+# ----------------------
+
+def clock_months_for_overtime(clock_dir, year, month, employee_ids=None):
+    """{employee_id: clock entries} of one month: Timesheet rows, closed months from the archive."""
+    months = clock_store.months_entries(year, month, employee_ids)
+    archive = clock_archive.open_archive(clock_dir, year)
+    if archive is not None:
+        wanted = archive.employee_ids() if employee_ids is None else [int(e) for e in employee_ids]
+        for employee_id in wanted:
+            if employee_id not in months and archive.has_month(employee_id, month):
+                months[employee_id] = archive.month_entries(employee_id, month)
+    return months
+
+
+def classify_clock_month(clock_dir, year, month, employee_ids=None, legal_holidays=False):
+    """Overtime buckets, food breaks, monthly totals and 42-hour weeks of every employee in one pass."""
+    months = clock_months_for_overtime(clock_dir, year, month, employee_ids)
+    results = overtime_engine.classify_months(year, month, months, legal_holidays)
+    identities = identity_cache.get_many(results)
+    for employee_id, result in results.items():
+        identity = identities.get(employee_id)
+        result["employee_name"] = identity.employee_name if identity else ""
+        result["id_number"] = identity.id_number if identity else ""
+    return results
+
+
+# ----------------------
+# Payroll Inputs
+# ----------------------
+
+def payroll_form(employee, saved_tax):
+    # Same precedence as the index page: EmployeeData, then the month's saved tax form
+    form = {}
+    for field in payroll_engine.INPUT_FIELDS:
+        value = getattr(employee, field, None)
+        form[field] = "" if value is None else value
+    for field, value in (saved_tax or {}).items():
+        if field in form and value not in (None, ""):
+            form[field] = value
+    return form
+
+
+def active_employees(employee_ids=None):
+    """EmployeeData rows whose user (if any) is not blocked."""
+    query = EmployeeData.query.outerjoin(User, EmployeeData.user_id == User.id) \
+        .filter(or_(User.id.is_(None), User.is_active.isnot(False)))
+    if employee_ids is not None:
+        query = query.filter(EmployeeData.id.in_([int(e) for e in employee_ids]))
+    return {e.id: e for e in query.all()}
+
+
+def run_key(year, month):
+    return f"payroll/{year}-{str(month).zfill(2)}"
+
+
+def retro_key(employee_id):
+    return f"retro/{employee_id}"
+
+
+def retro_months(base_dir, employee_id, effective):
+    """[(year, month_key)] of the employee's saved months from the effective month on."""
+    start = f"{effective.year}-{effective.month:02d}"
+    months = []
+    for name in sorted(os.listdir(base_dir)):
+        m = re.match(r"^hours_data_(\d{4})$", name)
+        if not m or int(m.group(1)) < effective.year:
+            continue
+        entry = hours_store.load_manifest(base_dir, m.group(1))["employees"].get(str(employee_id)) or {}
+        months.extend((m.group(1), key) for key in entry.get("months", []) if key >= start)
+    return sorted(months, key=lambda item: item[1])
+
+
+def _retro_row(month_key, old_tax, new_tax):
+    row = {"month_key": month_key}
+    for field in ("gross_salary", "income_tax", "net_payment"):
+        old, new = hours_sql.clean_number(old_tax.get(field)), hours_sql.clean_number(new_tax.get(field))
+        row.update({f"{field}_old": round(old, 2), f"{field}_new": round(new, 2), f"{field}_diff": round(new - old, 2)})
+    return row
+
+
+# ----------------------
+# Payroll Jobs (month run, recompute, retro)
+# ----------------------
+#
+# Month run: one job per month (a second submit while it runs re-runs it once
+# afterwards). The job computes all employees in worker processes
+# (payroll_engine.compute) and writes the results in one batch: shards + one
+# manifest write, yearly totals, the month's employer totals rebuilt once, and
+# the SQL mirror together with the EmployeeData rows in one commit.
+#
+# Retro: new values (hourly_rate, tax_credit_points, ...) are stored on
+# EmployeeData and every saved month from the effective month on is recomputed
+# with them (payroll_graph: only dependent fields, months in a process pool).
+# The *_yearly totals are re-derived month by month, only months that changed
+# are written, and a report of old / new net and income tax per month is kept
+# in retro_reports/.
+#
+# Progress is emitted as 'payroll_progress', job state as 'payroll_status'.
+
+class PayrollJobs:
+    """
+    app: the Flask app (jobs run in its app context). clock_dir: clock_hours_data.
+    base_dir(): hours_data folder. load_month(year, employee_id, month_key),
+    apply_yearly(year, employee_id, employee_name, month_key, tax),
+    mirror_month(employee_id, employee_name, month_key, month_data, fields=None),
+    mirror_months(items) and submit_export(year, employee_id, employee_name,
+    month_key, month_data) are main's hours helpers; emit(event, payload)
+    sends job status to the people allowed to see it.
+    """
+
+    def __init__(self, app, clock_dir, base_dir, load_month, apply_yearly, mirror_month, mirror_months,
+                 submit_export, emit):
+        self.app = app
+        self.clock_dir = clock_dir
+        self.base_dir = base_dir
+        self.load_month = load_month
+        self.apply_yearly = apply_yearly
+        self.mirror_month = mirror_month
+        self.mirror_months = mirror_months
+        self.submit_export = submit_export
+        self.emit = emit
+        self.progress = {}       # job key -> {"phase", "done", "total"}
+        self.reports = {}        # retro key -> last report
+        self.queue = ExportQueue(workers=1, on_status=self.publish_status)
+
+    def publish_status(self, status):
+        self.emit('payroll_status', {**status, **self.progress.get(status["key"], {})})
+
+    def _progress(self, key):
+        def progress(phase, done, total):
+            self.progress[key] = {"phase": phase, "done": done, "total": total}
+            self.emit('payroll_progress', {"key": key, **self.progress[key]})
+        return progress
+
+    def queued(self, key):
+        self.progress[key] = {"phase": "queued", "done": 0, "total": 0}
+        return self.progress[key]
+
+    # --- payroll month ---
+
+    def payroll_inputs(self, year, month, employees):
+        """({employee_id: saved hours table}, {employee_id: entries}, {employee_id: tax form inputs}) of one month."""
+        month_key = f"{year}-{month}"
+        # Saved hours table of the month when there is one, the clock otherwise
+        saved = {}
+        for employee_id in employees:
+            saved[employee_id] = (self.load_month(year, employee_id, month_key) or {}).get("hours_table") or {}
+        months = {e: t["work_day_entries"] for e, t in saved.items() if t.get("work_day_entries")}
+        missing = [e for e in employees if e not in months]
+        if missing:
+            months.update(clock_months_for_overtime(self.clock_dir, year, month, missing))
+        forms = {e: payroll_form(employees[e], saved[e].get("tax")) for e in months}
+        return saved, months, forms
+
+    def payroll_month(self, year, month, employee_ids=None, today=None):
+        """Hours, overtime and the tax form of every employee for one month (ages on the month's last day)."""
+        month = str(month).zfill(2)
+        employees = active_employees(employee_ids)
+        if not employees:
+            return {}
+        saved, months, forms = self.payroll_inputs(year, month, employees)
+        tables = payroll_engine.compute(year, month, months, forms, today or payroll_engine.month_end(year, month))
+
+        results = {}
+        for employee_id, table in tables.items():
+            employee = employees[employee_id]
+            results[employee_id] = {
+                "employee_name": employee.employee_name,
+                "id_number": employee.id_number,
+                "source": "hours_table" if saved[employee_id].get("work_day_entries") else "clock",
+                "monthly_totals": table["monthly_totals"],
+                "paid_totals": table["paid_totals"],
+                "tax": table["tax"],
+            }
+        return results
+
+    # --- payroll run ---
+
+    def save_payroll_month(self, year, month, employees, saved, forms, tables):
+        base_dir = self.base_dir()
+        month_key = f"{year}-{month}"
+        items = []
+        for employee_id, table in tables.items():
+            employee = employees[employee_id]
+            tax = {**(saved[employee_id].get("tax") or {}), **forms[employee_id], **table["tax"]}
+            yearly, later_months = yearly_totals.record_month(base_dir, year, employee_id, month_key, tax)
+            tax.update(yearly)
+            items.append((employee_id, employee.employee_name, month_key, {"hours_table": {
+                "work_day_entries": table["work_day_entries"],
+                "monthly_totals": table["monthly_totals"],
+                "paid_totals": table["paid_totals"],
+                "tax": tax,
+            }}))
+            # retro run: later months of the year get their *_yearly fields rewritten
+            for later_key, later_yearly in later_months.items():
+                later_data = hours_store.load_month(base_dir, year, employee_id, later_key)
+                if later_data:
+                    later_data.setdefault("hours_table", {}).setdefault("tax", {}).update(later_yearly)
+                    items.append((employee_id, employee.employee_name, later_key, later_data))
+
+        hours_store.save_months(base_dir, year, items)
+        employer_totals.rebuild_month(base_dir, year, month_key)
+
+        # EmployeeData keeps the last computed month (inputs are left as they are)
+        columns = EmployeeData.__table__.columns
+        for employee_id, table in tables.items():
+            employee = employees[employee_id]
+            for field, value in table["tax"].items():
+                if field in columns and isinstance(columns[field].type, db.Float) and field not in payroll_engine.INPUT_FIELDS:
+                    setattr(employee, field, hours_sql.clean_number(value))
+            employee.employeeMonth, employee.employeeYear = month, str(year)
+            employee.month_key, employee.date = month_key, f"{month}/{year}"
+        self.mirror_months(items)     # one commit: HoursData / MonthlyRecord + EmployeeData
+
+        for employee_id, employee_name, key, month_data in items:
+            self.submit_export(year, employee_id, employee_name, key, month_data)
+        return len(items)
+
+    def run_payroll_month(self, year, month, workers=None):
+        """Compute and save the month of every active employee."""
+        year, month = str(year), str(month).zfill(2)
+        progress = self._progress(run_key(year, month))
+
+        with self.app.app_context():
+            employees = active_employees()
+            progress("load", 0, len(employees))
+            saved, months, forms = self.payroll_inputs(year, month, employees)
+            tables = payroll_engine.compute(year, month, months, forms, payroll_engine.month_end(year, month),
+                                            workers=workers,
+                                            on_progress=lambda done, total: progress("compute", done, total))
+            progress("save", 0, len(tables))
+            saved_months = self.save_payroll_month(year, month, employees, saved, forms, tables)
+            progress("done", len(tables), len(tables))
+        return {"employees": len(tables), "saved_months": saved_months}
+
+    # --- recompute (one edit, field dependency graph) ---
+
+    def recompute_payroll_month(self, year, employee_id, month, entries=None, fields=None):
+        """
+        Apply an edit (day rows and/or tax form inputs) to a saved employee-month,
+        recompute only the fields that depend on it and persist only what changed.
+        Returns the changes by block ({} blocks when nothing changed).
+        """
+        employee = db.session.get(EmployeeData, int(employee_id))
+        if employee is None:
+            raise ValueError("Employee not found")
+        base_dir = self.base_dir()
+        month = str(month).zfill(2)
+        month_key = f"{year}-{month}"
+
+        month_data = self.load_month(year, employee.id, month_key) or {}
+        saved = month_data.get("hours_table") or {}
+        form = payroll_form(employee, saved.get("tax"))
+        table, changes = payroll_graph.recompute(saved, year, month, form, entries, fields,
+                                                 payroll_engine.month_end(year, month))
+        if not any(changes.values()):
+            return changes
+
+        if payroll_graph.needs_yearly(changes):
+            before = {k: v for k, v in table["tax"].items() if k in payroll_graph.YEARLY}
+            self.apply_yearly(year, employee.id, employee.employee_name, month_key, table["tax"])
+            changes["tax"].update({k: v for k, v in table["tax"].items()
+                                   if k in payroll_graph.YEARLY and before.get(k) != v})
+
+        month_data["hours_table"] = {**saved, **table}
+        hours_store.save_month(base_dir, year, employee.id, employee.employee_name, month_key, month_data)
+        if payroll_graph.needs_employer_totals(changes):
+            employer_totals.update_month(base_dir, year, employee.id, month_key, month_data)
+        if changes["work_day_entries"] or changes["monthly_totals"] or changes["paid_totals"]:
+            self.mirror_month(employee.id, employee.employee_name, month_key, month_data)
+        else:
+            self.mirror_month(employee.id, employee.employee_name, month_key, month_data, changes["tax"])
+        self.submit_export(year, employee.id, employee.employee_name, month_key, month_data)
+        return changes
+
+    # --- retro rate change ---
+
+    def run_retro_change(self, employee_id, effective_date, values, workers=None):
+        """Recompute every saved month of an employee from effective_date with new input values."""
+        key = retro_key(employee_id)
+        effective = datetime.strptime(str(effective_date), "%Y-%m-%d").date()
+        fields = {k: v for k, v in values.items() if k in payroll_engine.INPUT_FIELDS}
+        progress = self._progress(key)
+
+        with self.app.app_context():
+            base_dir = self.base_dir()
+            employee = db.session.get(EmployeeData, int(employee_id))
+            if employee is None:
+                raise ValueError("Employee not found")
+            columns = EmployeeData.__table__.columns
+            for field, value in values.items():
+                if field in columns:
+                    is_float = isinstance(columns[field].type, db.Float)
+                    setattr(employee, field, hours_sql.clean_number(value) if is_float else str(value))
+
+            months = retro_months(base_dir, employee.id, effective)
+            progress("load", 0, len(months))
+            saved, items = {}, []
+            for year, month_key in months:
+                month_data = self.load_month(year, employee.id, month_key) or {}
+                table = month_data.get("hours_table") or {}
+                saved[month_key] = (year, month_data, dict(table.get("tax") or {}))
+                items.append((month_key, table, int(year), int(month_key[5:7]), payroll_form(employee, table.get("tax")), fields))
+            results = payroll_graph.recompute_months(items, workers=workers,
+                                                     on_progress=lambda done, total: progress("compute", done, total))
+
+            # yearly running totals in month order (earlier months first)
+            report, writes = [], {}
+            for year, month_key in months:
+                table, changes = results[month_key]
+                _, month_data, old_tax = saved[month_key]
+                yearly, _ = yearly_totals.record_month(base_dir, year, employee.id, month_key, table["tax"])
+                for field, value in yearly.items():
+                    if table["tax"].get(field) != value:
+                        table["tax"][field] = changes["tax"][field] = value
+                report.append(_retro_row(month_key, old_tax, table["tax"]))
+                if any(changes.values()):
+                    month_data["hours_table"] = {**(month_data.get("hours_table") or {}), **table}
+                    writes.setdefault(year, []).append((employee.id, employee.employee_name, month_key, month_data))
+
+            progress("save", 0, sum(len(w) for w in writes.values()))
+            for year, batch in writes.items():
+                hours_store.save_months(base_dir, year, batch)
+                for _, _, month_key, month_data in batch:
+                    employer_totals.update_month(base_dir, year, employee.id, month_key, month_data)
+            self.mirror_months([item for batch in writes.values() for item in batch])   # commits EmployeeData too
+            for year, batch in writes.items():
+                for _, employee_name, month_key, month_data in batch:
+                    self.submit_export(year, employee.id, employee_name, month_key, month_data)
+
+            result = {
+                "employee_id": employee.id,
+                "employee_name": employee.employee_name,
+                "effective_date": effective.isoformat(),
+                "values": values,
+                "months": report,
+                "saved_months": sum(len(w) for w in writes.values()),
+                "net_payment_diff": round(sum(r["net_payment_diff"] for r in report), 2),
+                "income_tax_diff": round(sum(r["income_tax_diff"] for r in report), 2),
+            }
+            file_store.write_json(os.path.join(base_dir, "retro_reports",
+                                               f"retro_{employee.id}_{effective.isoformat()}.json"), result)
+            self.reports[key] = result
+            progress("done", len(months), len(months))
+        return result
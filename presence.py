@@ -0,0 +1,156 @@
+import os, time, threading
+from datetime import datetime, timedelta
+
+import time_engine
+from database import Timesheet
+from employee_identity import identity_cache
+
+# ----------------------
+# Presence Board (who is clocked in right now)
+# ----------------------
+#
+# In-memory table per company, fed by the clock APIs: every write to a
+# Timesheet row of an employee goes through update(), which returns a delta
+# when the employee's presence changed (today's row, or yesterday's night
+# shift, also when a clock-out after midnight closes it). Managers get a
+# snapshot when they subscribe and then only deltas; every company has its
+# own seq counter, so a client that sees a gap asks for a new snapshot.
+#
+# The table is (re)loaded from today's/yesterday's Timesheet rows on first
+# use and whenever a snapshot is older than PRESENCE_RELOAD_SECONDS, which
+# also covers day rollover and writes made by other worker processes.
+
+RELOAD_SECONDS = float(os.getenv("PRESENCE_RELOAD_SECONDS", "30"))
+
+ALL_COMPANIES = "*"
+
+
+def room(company):
+    return f"presence:{company}"
+
+
+def _hours(value):
+    try:
+        return round(float(value or 0), 2)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _since(row):
+    """Start of the open shift as YYYY-MM-DDTHH:MM (rows without shifts: startTime)."""
+    if row.shifts:
+        start, end = row.shifts[-1]
+        if start is None or end is not None:
+            return None
+        return f"{time_engine.day_string(time_engine.stamp_day(start))}T{time_engine.stamp_hm(start)}"
+    return f"{row.date}T{row.startTime}" if row.startTime else None
+
+
+def _entry(identity, row):
+    since = _since(row) if (row.isClockedIn or "").lower() == "true" else None
+    return {
+        "employee_id": identity.id,
+        "employee_name": identity.employee_name,
+        "date": row.date,
+        "clocked_in": since is not None,
+        "since": since,
+        "task": row.task or "",
+        "start_time": row.startTime or "",
+        "end_time": row.endTime or "",
+        # closed shifts of the day; the open one runs on top of it
+        "hours_today": _hours(row.totalHours) if row.shifts or since is None else 0.0,
+    }
+
+
+def running_hours(entry, now=None):
+    if not entry["clocked_in"] or not entry["since"]:
+        return entry["hours_today"]
+    now = now or datetime.now()
+    since = time_engine.stamp(entry["since"][:10], entry["since"][11:16])
+    minutes = max(time_engine.stamp_of(now) - since, 0)
+    return round(entry["hours_today"] + time_engine.hours(minutes), 2)
+
+
+class PresenceBoard:
+    def __init__(self, reload_seconds=RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._companies = {}     # company -> {employee_id: entry}
+        self._seq = {}           # company -> last delta seq
+        self._loaded_at = None
+
+    def _next_seq(self, company):
+        self._seq[company] = self._seq.get(company, 0) + 1
+        return self._seq[company]
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.reload_seconds
+
+    def reload(self, today=None):
+        """Rebuild from the DB: today's rows, plus anyone still clocked in since yesterday."""
+        today = today or datetime.now().date()
+        dates = [today.isoformat(), (today - timedelta(days=1)).isoformat()]
+        rows = Timesheet.query.filter(Timesheet.date.in_(dates)).order_by(Timesheet.date).all()
+        identities = identity_cache.get_many({row.employee_id for row in rows})
+
+        companies = {}
+        for row in rows:
+            identity = identities.get(row.employee_id)
+            if identity is None:
+                continue
+            entry = _entry(identity, row)
+            if row.date != dates[0] and not entry["clocked_in"]:
+                continue
+            companies.setdefault(identity.company, {})[identity.id] = entry
+
+        with self._lock:
+            for company in set(self._companies) | set(companies):
+                if self._companies.get(company) != companies.get(company):
+                    self._next_seq(company)
+            self._companies = companies
+            self._loaded_at = time.monotonic()
+
+    def update(self, identity, row, today=None):
+        """Apply a written row of an employee; returns the delta to publish, or None."""
+        if self._loaded_at is None:
+            self.reload(today)
+        today = today or datetime.now().date()
+        entry = _entry(identity, row)
+        with self._lock:
+            table = self._companies.setdefault(identity.company, {})
+            current = table.get(identity.id)
+            if current == entry:
+                return None
+            if row.date != today.isoformat():
+                # an earlier day only matters as yesterday's night shift: opened, or closed after midnight
+                if row.date < (today - timedelta(days=1)).isoformat():
+                    return None
+                if current is not None and current["date"] > row.date:
+                    return None
+                if not entry["clocked_in"] and (current is None or current["date"] != row.date):
+                    return None
+            table[identity.id] = entry
+            return {
+                "company": identity.company,
+                "seq": self._next_seq(identity.company),
+                "type": "clock_in" if entry["clocked_in"] else "clock_out",
+                "employee": entry,
+                "server_time": datetime.now().isoformat(timespec="seconds"),
+            }
+
+    def snapshot(self, company):
+        if self._stale():
+            self.reload()
+        now = datetime.now()
+        with self._lock:
+            companies = self._companies if company == ALL_COMPANIES else {company: self._companies.get(company, {})}
+            result = []
+            for name, table in companies.items():
+                employees = []
+                for entry in sorted(table.values(), key=lambda e: (not e["clocked_in"], e["employee_name"] or "")):
+                    employees.append({**entry, "running_hours": running_hours(entry, now)})
+                result.append({"company": name, "seq": self._seq.get(name, 0), "employees": employees})
+        return {"server_time": now.isoformat(timespec="seconds"), "companies": result}
+
+
+board = PresenceBoard()
@@ -1566,6 +1566,30 @@ const taxBrackets = [
   { fromAmount: 60131, toAmount: Infinity, taxRate: 50.00 }
 ];
 
+// Start of each bracket (brackets are taken by width, in order) and the tax
+// accumulated before it, so a taxable income needs one binary search
+const taxBracketTable = (() => {
+  const starts = [], base = [];
+  let start = 0, tax = 0;
+  for (const bracket of taxBrackets) {
+    starts.push(start);
+    base.push(tax);
+    start += bracket.toAmount - bracket.fromAmount;
+    tax += (bracket.toAmount - bracket.fromAmount) * (bracket.taxRate / 100);
+  }
+  return { starts, base };
+})();
+
+function bracketTax(taxableIncome) {
+  const { starts, base } = taxBracketTable;
+  let lo = 0, hi = starts.length - 1;
+  while (lo < hi) {
+    const mid = (lo + hi + 1) >> 1;
+    if (starts[mid] <= taxableIncome) lo = mid; else hi = mid - 1;
+  }
+  return base[lo] + (taxableIncome - starts[lo]) * (taxBrackets[lo].taxRate / 100);
+}
+
 // Number Formatter (no currency symbol)
 function formatNumber(value) {
   return value.toLocaleString('en-US', {
@@ -1634,17 +1658,7 @@ function updateIncomeTaxBeforeCredit() {
     return;
   }
 
-  let totalTax = 0;
-  let remaining = taxableIncome;
-
-  for (const bracket of taxBrackets) {
-    const taxable = Math.min(remaining, bracket.toAmount - bracket.fromAmount);
-    if (taxable > 0) {
-      totalTax += taxable * (bracket.taxRate / 100);
-      remaining -= taxable;
-    }
-    if (remaining <= 0) break;
-  }
+  const totalTax = bracketTax(taxableIncome);
 
   if (output) {
     output.value = formatNumber(totalTax);
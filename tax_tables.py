@@ -0,0 +1,181 @@
+import threading
+from bisect import bisect_right
+import numpy as np
+
+# ----------------------
+# Income Tax, National Insurance And Health Tables (per tax year)
+# ----------------------
+#
+# Brackets are written the way taxBrackets is written in static/formulas.js
+# (from, to, rate %) and are taken the same way: by width (to - from), in
+# order. A table precomputes where each bracket starts on that scale and the
+# tax accumulated before it, so the tax of any income is one bisect plus one
+# multiply (searchsorted for an array of employees). The cumulative sums are
+# added in the JS order, so the results are the same doubles the form gets.
+#
+# A month is taxed with the table of its year; years after the last table use
+# the last one, years before the first use the first. credit_point_value is the
+# yearly value of one credit point (points x value / 12 per month).
+#
+# National insurance (employer / employee) and health insurance are two
+# levels (from, to, rate) on the monthly gross taxable; the second level ends
+# at the ceiling. pension_benefit_monthly caps the employee pension that earns
+# the 35% provident fund credit (7% of the insured wage). The 2025 figures are
+# the ones static/formulas.js uses.
+
+TAX_YEARS = {
+    2022: {
+        "brackets": [
+            (0, 6450, 10.00),
+            (6451, 9240, 14.00),
+            (9241, 14840, 20.00),
+            (14841, 20620, 31.00),
+            (20621, 42910, 35.00),
+            (42911, 55270, 47.00),
+            (55271, float("inf"), 50.00),
+        ],
+        "credit_point_value": 2676.0,
+        "national_insurance_employer": [(0, 6331, 0.0355), (6331, 45075, 0.076)],
+        "national_insurance_employee": [(0, 6331, 0.004), (6331, 45075, 0.07)],
+        "health_insurance": [(0, 6331, 0.031), (6331, 45075, 0.05)],
+        "pension_benefit_monthly": 609,
+    },
+    2023: {
+        "brackets": [
+            (0, 6790, 10.00),
+            (6791, 9730, 14.00),
+            (9731, 15620, 20.00),
+            (15621, 21710, 31.00),
+            (21711, 45180, 35.00),
+            (45181, 58190, 47.00),
+            (58191, float("inf"), 50.00),
+        ],
+        "credit_point_value": 2820.0,
+        "national_insurance_employer": [(0, 7122, 0.0355), (7122, 47465, 0.076)],
+        "national_insurance_employee": [(0, 7122, 0.004), (7122, 47465, 0.07)],
+        "health_insurance": [(0, 7122, 0.031), (7122, 47465, 0.05)],
+        "pension_benefit_monthly": 679,
+    },
+    # 2024 and 2025: brackets and credit point frozen
+    2024: {
+        "brackets": [
+            (0, 7010, 10.00),
+            (7011, 10060, 14.00),
+            (10061, 16150, 20.00),
+            (16151, 22440, 31.00),
+            (22441, 46690, 35.00),
+            (46691, 60130, 47.00),
+            (60131, float("inf"), 50.00),
+        ],
+        "credit_point_value": 2904.0,
+        "national_insurance_employer": [(0, 7522, 0.0355), (7522, 49030, 0.076)],
+        "national_insurance_employee": [(0, 7522, 0.004), (7522, 49030, 0.07)],
+        "health_insurance": [(0, 7522, 0.031), (7522, 49030, 0.05)],
+        "pension_benefit_monthly": 679,
+    },
+    2025: {
+        "brackets": [
+            (0, 7010, 10.00),
+            (7011, 10060, 14.00),
+            (10061, 16150, 20.00),
+            (16151, 22440, 31.00),
+            (22441, 46690, 35.00),
+            (46691, 60130, 47.00),
+            (60131, float("inf"), 50.00),
+        ],
+        "credit_point_value": 2904.0,
+        "national_insurance_employer": [(0, 7522, 0.0451), (7522, 50695, 0.076)],
+        "national_insurance_employee": [(0, 7522, 0.0104), (7522, 50695, 0.07)],
+        "health_insurance": [(0, 7522, 0.0323), (7522, 50695, 0.0517)],
+        "pension_benefit_monthly": 679,
+    },
+}
+
+FIRST_YEAR, LAST_YEAR = min(TAX_YEARS), max(TAX_YEARS)
+
+
+class TaxTable:
+    """Precomputed brackets of one tax year (plus its insurance levels and pension benefit)."""
+
+    def __init__(self, year, brackets, credit_point_value, national_insurance_employer=(),
+                 national_insurance_employee=(), health_insurance=(), pension_benefit_monthly=0.0):
+        self.year = year
+        self.brackets = list(brackets)
+        self.credit_point_value = credit_point_value
+        self.national_insurance_employer = list(national_insurance_employer)
+        self.national_insurance_employee = list(national_insurance_employee)
+        self.health_insurance = list(health_insurance)
+        self.pension_benefit_monthly = pension_benefit_monthly
+
+        self.froms = [low for low, _, _ in self.brackets]
+        self.tos = [high for _, high, _ in self.brackets]
+        self.rates = [percent / 100 for _, _, percent in self.brackets]
+        self.percents = [percent for _, _, percent in self.brackets]
+
+        # start of each bracket on the width scale + tax before it
+        self.starts, self.base = [], []
+        start, tax = 0, 0.0
+        for (low, high, _), rate in zip(self.brackets, self.rates):
+            self.starts.append(start)
+            self.base.append(tax)
+            start += high - low
+            tax += (high - low) * rate
+
+        self._starts = np.array(self.starts, dtype=np.float64)
+        self._base = np.array(self.base, dtype=np.float64)
+        self._rates = np.array(self.rates, dtype=np.float64)
+        self._froms = np.array(self.froms, dtype=np.float64)
+        self._tos = np.array(self.tos, dtype=np.float64)
+        self._percents = np.array(self.percents, dtype=np.float64)
+
+    def tax(self, income):
+        """Bracket tax of one monthly taxable income (0 when nothing is taxable)."""
+        if income <= 0:
+            return 0.0
+        i = bisect_right(self.starts, income) - 1
+        return self.base[i] + (income - self.starts[i]) * self.rates[i]
+
+    def tax_many(self, incomes):
+        incomes = np.asarray(incomes, dtype=np.float64)
+        i = np.maximum(np.searchsorted(self._starts, incomes, side="right") - 1, 0)
+        tax = self._base[i] + (incomes - self._starts[i]) * self._rates[i]
+        return np.where(incomes > 0, tax, 0.0)
+
+    def level(self, income):
+        """Rate % of the bracket an income falls in (from <= income < to), None in a gap."""
+        i = bisect_right(self.froms, income) - 1
+        return self.percents[i] if i >= 0 and income < self.tos[i] else None
+
+    def levels(self, incomes):
+        """level() for an array; NaN where there is no bracket."""
+        incomes = np.asarray(incomes, dtype=np.float64)
+        i = np.searchsorted(self._froms, incomes, side="right") - 1
+        safe = np.maximum(i, 0)
+        found = (i >= 0) & (incomes < self._tos[safe])
+        return np.where(found, self._percents[safe], np.nan)
+
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def tax_year(year=None):
+    """Table year used for a calendar year (None -> the latest, as in formulas.js)."""
+    if year is None:
+        return LAST_YEAR
+    return min(max(int(year), FIRST_YEAR), LAST_YEAR)
+
+
+def table(year=None):
+    year = tax_year(year)
+    found = _tables.get(year)
+    if found is None:
+        with _lock:
+            found = _tables.get(year)
+            if found is None:
+                found = _tables[year] = TaxTable(year, **TAX_YEARS[year])
+    return found
+
+
+def income_tax_before_credit(income, year=None):
+    return table(year).tax(income)
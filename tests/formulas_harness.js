@@ -0,0 +1,286 @@
+// ----------------------
+// formulas.js harness for the parity tests
+// ----------------------
+//
+// Loads the browser functions of static/formulas.js into node with a stub DOM
+// and runs them on JSON read from stdin:
+//
+//   node tests/formulas_harness.js overtime   [{year, month, entries}]  -> [{rows, monthly, warnings}]
+//   node tests/formulas_harness.js holidays   {years: [...]}            -> ["DD/MM/YYYY", ...]
+//   node tests/formulas_harness.js payroll    [{form, monthly, weekend, entries, today, tax_keys, paid_keys}]
+//                                                                       -> [{tax, paid}]
+//
+// The overtime mode fills the index hours table of one month the way the page
+// does (updateHours + updateColumn8..24 per row), sums the *_monthly totals and
+// the weekly hours of checkWeeklyHours. The payroll mode fills the tax form
+// inputs and the month's totals, runs the paid row calculations and lets
+// validateAndCalculateForm settle (the page re-runs it on a timer), with
+// new Date() fixed to `today` so ages match the server's.
+
+const fs = require('fs');
+const path = require('path');
+
+const src = fs.readFileSync(path.join(__dirname, '..', 'static', 'formulas.js'), 'utf8');
+
+function extractAt(i) {
+    let depth = 0;
+    for (let k = src.indexOf('{', i); k < src.length; k++) {
+        if (src[k] === '{') depth++;
+        else if (src[k] === '}' && --depth === 0) return src.slice(i, k + 1);
+    }
+}
+
+function extract(name) {
+    const i = src.indexOf('function ' + name + '(');
+    if (i < 0) throw new Error('formulas.js has no function ' + name);
+    return extractAt(i);
+}
+
+function extractConst(name, end) {
+    const i = src.indexOf('const ' + name + ' =');
+    if (i < 0) throw new Error('formulas.js has no const ' + name);
+    return src.slice(i, src.indexOf(end, i) + end.length);
+}
+
+// run code in its own scope (the given globals as parameters), return the named functions
+function load(code, names, scope) {
+    return new Function(...Object.keys(scope), code + '\nreturn {' + names.join(', ') + '};')(...Object.values(scope));
+}
+
+// ----------------------
+// Overtime: stub DOM (one hours table row per day)
+// ----------------------
+
+const ROW_CLASSES = [
+    'start-time', 'end-time', 'hours-calculated', 'hours-calculated-regular-day', 'total-extra-hours-regular-day',
+    'extra-hours125-regular-day', 'extra-hours150-regular-day', 'hours-holidays-day', 'extra-hours150-holidays-saturday',
+    'extra-hours175-holidays-saturday', 'extra-hours200-holidays-saturday', 'sick-day', 'day-off', 'food-break',
+    'final-totals-hours', 'calc1', 'calc2', 'calc3', 'work-day', 'missing-work-day', 'advance-payment',
+];
+
+const MONTHLY_CLASSES = [
+    'hours-calculated', 'hours-calculated-regular-day', 'total-extra-hours-regular-day', 'extra-hours125-regular-day',
+    'extra-hours150-regular-day', 'extra-hours150-holidays-saturday', 'extra-hours175-holidays-saturday',
+    'extra-hours200-holidays-saturday', 'sick-day', 'day-off', 'food-break', 'final-totals-hours', 'work-day',
+    'missing-work-day',
+];
+
+const snake = cls => cls.replace(/-/g, '_');
+
+function makeRow(date, saturday, holiday) {
+    const inputs = {};
+    const cells = [{textContent: ''}, {textContent: date}, {textContent: String(saturday)}, {textContent: String(holiday)}];
+    ROW_CLASSES.forEach(cls => {
+        inputs[cls] = {className: cls, value: '', dispatchEvent() {}};
+        cells.push({textContent: '', input: inputs[cls]});
+    });
+    return {
+        cells, children: cells, style: {display: ''}, inputs,
+        querySelector(sel) {
+            let m = sel.match(/^\.([\w-]+)$/);
+            if (m) return inputs[m[1]] || null;
+            m = sel.match(/^td:nth-child\((\d+)\)( input)?$/);
+            if (m) {
+                const cell = cells[+m[1] - 1];
+                return m[2] ? (cell && cell.input) || null : cell || null;
+            }
+            throw new Error('unsupported selector ' + sel);
+        },
+    };
+}
+
+let rows = [];
+const overtimeDocument = {
+    querySelectorAll(sel) {
+        if (sel === '#table-body tr') return rows;
+        throw new Error('unsupported selector ' + sel);
+    },
+};
+
+const OVERTIME_FUNCTIONS = [
+    'calculateTimeDifference', 'getWeekStart', 'formatDateIL', 'isHoliday',
+    'updateColumn8', 'updateColumn9', 'updateColumn10', 'updateColumn11', 'updateColumn12', 'updateColumn13',
+    'updateColumn14', 'updateColumn15', 'updateColumn16', 'updateColumn17', 'updateColumn18', 'updateColumn19',
+    'updateColumn23', 'updateColumn24',
+];
+
+// updateColumn8 assigns a const on sick days and throws; overtime_engine applies
+// the sick ladder it was written for, so the tests compare against that intent.
+const {
+    calculateTimeDifference, getWeekStart, formatDateIL, isHoliday,
+    updateColumn8, updateColumn9, updateColumn10, updateColumn11, updateColumn12, updateColumn13,
+    updateColumn14, updateColumn15, updateColumn16, updateColumn17, updateColumn18, updateColumn19,
+    updateColumn23, updateColumn24,
+} = load(
+    OVERTIME_FUNCTIONS.map(extract).join('\n').replace('const sickValue = parseFloat', 'let sickValue = parseFloat'),
+    OVERTIME_FUNCTIONS, {document: overtimeDocument, Event: function () {}});
+
+// ----------------------
+// Payroll: stub DOM (tax form inputs by id, totals by class) and a fixed clock
+// ----------------------
+
+const elements = {};
+let payrollRows = [];
+
+function element(key) {
+    if (!elements[key]) {
+        elements[key] = {
+            value: '', textContent: '', dataset: {}, style: {},
+            addEventListener() {}, classList: {add() {}, remove() {}},
+        };
+    }
+    return elements[key];
+}
+
+const payrollDocument = {
+    getElementById: id => element('#' + id),
+    querySelector: sel => (sel.startsWith('.') || sel.startsWith('#') ? element(sel) : null),
+    querySelectorAll(sel) {
+        if (sel === '#table-body tr') return payrollRows;
+        if (sel === '#table-body tr .advance-payment') return payrollRows.map(row => row.querySelector('.advance-payment'));
+        if (sel.startsWith('.')) return [element(sel)];
+        return [];
+    },
+    addEventListener() {},
+};
+
+let clockToday = null;
+class ClockDate extends Date {
+    constructor(...args) {
+        if (!args.length && clockToday) super(clockToday.getTime());
+        else super(...args);
+    }
+}
+
+const PAYROLL_FUNCTIONS = [
+    'calculateTotalRegularDayPaymentForMonth', 'calculateTotalExtraHours125RegularDayPaymentForMonth',
+    'calculateTotalExtraHours150RegularDayPaymentForMonth', 'calculateTotalExtraHours150HolidaysSaturdayPaymentForMonth',
+    'calculateTotalExtraHours175HolidaysSaturdayPaymentForMonth', 'calculateTotalExtraHours200HolidaysSaturdayPaymentForMonth',
+    'calculateTotalFoodBreakUnpaidOffPaymentForMonth', 'calculateFinalTotalsHoursPaidForMonth',
+    'calculateAdvancePaymentForMonth',
+];
+
+function payrollCode() {
+    let code = '';
+    const re = /^\s*function (\w+)\(/mg;
+    let m;
+    while ((m = re.exec(src))) code += extractAt(m.index + m[0].indexOf('function')) + '\n';
+    ['nationalInsuranceEmployerData', 'nationalInsuranceData', 'healthInsuranceData', 'taxBrackets']
+        .forEach(name => { code += extractConst(name, '];') + '\n'; });
+    return code + extractConst('taxBracketTable', '})();') + '\n';
+}
+
+const payrollForm = load(payrollCode(), [...PAYROLL_FUNCTIONS, 'validateAndCalculateForm'],
+    {document: payrollDocument, setTimeout() {}, Date: ClockDate});
+
+const pad = n => String(n).padStart(2, '0');
+
+// ----------------------
+// Modes
+// ----------------------
+
+function overtime(months) {
+    return months.map(({year, month, entries}) => {
+        const nDays = new Date(year, month, 0).getDate();
+        rows = [];
+        for (let d = 1; d <= nDays; d++) {
+            const date = `${pad(d)}/${pad(month)}/${year}`;
+            rows.push(makeRow(date, new Date(year, month - 1, d).getDay() === 6, isHoliday(date)));
+        }
+        entries.forEach(e => {
+            const row = rows[+e.date.split('/')[0] - 1];
+            row.inputs['start-time'].value = e.start_time || '';
+            row.inputs['end-time'].value = e.end_time || '';
+            row.inputs['sick-day'].value = e.sick_day || '';
+            row.inputs['day-off'].value = e.day_off || '';
+        });
+
+        rows.forEach(row => {
+            // updateHours
+            const start = row.inputs['start-time'].value.trim(), end = row.inputs['end-time'].value.trim();
+            const hours = start && end ? calculateTimeDifference(start, end) : NaN;
+            row.inputs['hours-calculated'].value = isNaN(hours) ? '' : hours.toFixed(2);
+            [updateColumn8, updateColumn9, updateColumn10, updateColumn11, updateColumn12, updateColumn13,
+                updateColumn14, updateColumn15, updateColumn16, updateColumn17, updateColumn18, updateColumn19,
+                updateColumn23, updateColumn24].forEach(update => update(row));
+        });
+
+        const monthly = {};
+        MONTHLY_CLASSES.forEach(cls => {
+            let total = 0;
+            rows.forEach(row => { if (row.inputs[cls].value) total += parseFloat(row.inputs[cls].value) || 0; });
+            monthly[snake(cls) + '_monthly'] = total === 0 ? '' : total.toFixed(2);
+        });
+
+        // checkWeeklyHours
+        const weekly = {};
+        rows.forEach(row => {
+            const hours = parseFloat(row.inputs['hours-calculated'].value);
+            if (isNaN(hours)) return;
+            const [d, m, y] = row.cells[1].textContent.split('/').map(Number);
+            const week = formatDateIL(getWeekStart(new Date(y, m - 1, d)));
+            weekly[week] = (weekly[week] || 0) + hours - (parseFloat(row.inputs['food-break'].value) || 0);
+        });
+        const warnings = Object.entries(weekly)
+            .filter(([, hours]) => hours > 42)
+            .map(([week, hours]) => ({week_start: week, hours: hours.toFixed(2)}));
+
+        return {
+            rows: rows.map(row => ({
+                date: row.cells[1].textContent,
+                saturday: row.cells[2].textContent,
+                holiday: row.cells[3].textContent,
+                ...Object.fromEntries(ROW_CLASSES.map(cls => [snake(cls), row.inputs[cls].value])),
+            })),
+            monthly,
+            warnings,
+        };
+    });
+}
+
+function holidays({years}) {
+    const dates = [];
+    years.forEach(year => {
+        for (let d = new Date(year, 0, 1); d.getFullYear() === year; d.setDate(d.getDate() + 1)) {
+            const date = `${pad(d.getDate())}/${pad(d.getMonth() + 1)}/${year}`;
+            if (isHoliday(date)) dates.push(date);
+        }
+    });
+    return dates;
+}
+
+function payroll(cases) {
+    return cases.map(c => {
+        Object.keys(elements).forEach(key => delete elements[key]);
+        const [y, m, d] = c.today.split('-').map(Number);
+        clockToday = new Date(y, m - 1, d);
+
+        Object.entries(c.form).forEach(([id, value]) => { element('#' + id).value = value; });
+        Object.entries(c.monthly).forEach(([name, value]) => { element('.' + name.replace(/_/g, '-')).value = value; });
+        element('.final-total-extra-hours-weekend-monthly').value = c.weekend;
+        payrollRows = c.entries.map(entry => {
+            const cells = {};
+            Object.entries(entry).forEach(([name, value]) => {
+                cells['.' + name.replace(/_/g, '-')] = {value: String(value), style: {}};
+            });
+            return {querySelector: sel => cells[sel] || null};
+        });
+
+        PAYROLL_FUNCTIONS.forEach(name => payrollForm[name]());
+        for (let i = 0; i < 8; i++) payrollForm.validateAndCalculateForm();
+
+        return {
+            tax: Object.fromEntries(c.tax_keys.map(name => [name, element('#' + name).value])),
+            paid: Object.fromEntries(c.paid_keys.map(name => [name, element('.' + name.replace(/_/g, '-')).value])),
+        };
+    });
+}
+
+const MODES = {overtime, holidays, payroll};
+
+const mode = MODES[process.argv[2]];
+if (!mode) {
+    process.stderr.write('usage: node formulas_harness.js ' + Object.keys(MODES).join('|') + ' < input.json\n');
+    process.exit(2);
+}
+process.stdout.write(JSON.stringify(mode(JSON.parse(fs.readFileSync(0, 'utf8')))));
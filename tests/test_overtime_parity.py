@@ -0,0 +1,98 @@
+import os, sys, json, random, shutil, subprocess, unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import overtime_engine
+
+# ----------------------
+# Overtime Parity (overtime_engine vs static/formulas.js)
+# ----------------------
+#
+# Every fixture month is classified by overtime_engine and by the browser
+# functions of formulas.js (tests/formulas_harness.js under node); day rows,
+# monthly totals and 42-hour week warnings must match field by field.
+#
+#   python -m pytest tests          (or python -m unittest discover tests)
+
+NODE = shutil.which("node")
+HARNESS = os.path.join(HERE, "formulas_harness.js")
+FIXTURES = os.path.join(HERE, "fixtures", "overtime_months.json")
+RANDOM_MONTHS = 60
+
+
+def run_harness(mode, payload):
+    result = subprocess.run([NODE, HARNESS, mode], input=json.dumps(payload, ensure_ascii=False),
+                            capture_output=True, text=True, encoding="utf-8", check=True)
+    return json.loads(result.stdout)
+
+
+def load_fixtures():
+    with open(FIXTURES, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def random_months(seed=18, count=RANDOM_MONTHS):
+    """Seeded random months on top of the fixtures: any time, blanks, bad input, sick / off days."""
+    rnd = random.Random(seed)
+
+    def clock():
+        r = rnd.random()
+        if r < 0.05:
+            return ""
+        if r < 0.08:
+            return rnd.choice(["8", "8:", "x:10", "7:5", " 9:00"])
+        return f"{rnd.randint(0, 23)}:{rnd.choice([0, 15, 30, 45, rnd.randint(0, 59)]):02d}"
+
+    months = []
+    for n in range(count):
+        year, month = rnd.randint(2021, 2028), rnd.randint(1, 12)
+        entries = []
+        for day in range(1, 29):
+            if rnd.random() < 0.2:
+                continue
+            entry = {"date": f"{day:02d}/{month:02d}/{year}", "start_time": clock(), "end_time": clock()}
+            if rnd.random() < 0.05:
+                entry["sick_day"] = rnd.choice(["1", "1.00", "0.5"])
+            if rnd.random() < 0.05:
+                entry["day_off"] = rnd.choice(["1", "1.00", "0"])
+            entries.append(entry)
+        months.append({"name": f"random #{n}", "year": year, "month": month, "entries": entries})
+    return months
+
+
+@unittest.skipUnless(NODE, "node is not installed")
+class OvertimeParityTest(unittest.TestCase):
+
+    def assert_parity(self, months):
+        browser = run_harness("overtime", months)
+        for case, js in zip(months, browser):
+            server = overtime_engine.classify_month(case["year"], case["month"], case["entries"])
+            name = case["name"]
+
+            rows = server["work_day_entries"]
+            self.assertEqual(len(rows), len(js["rows"]), name)
+            for row, js_row in zip(rows, js["rows"]):
+                for field in ("date", "saturday", "holiday", *overtime_engine.COLUMNS.values()):
+                    with self.subTest(case=name, date=row["date"], field=field):
+                        self.assertEqual(row[field], js_row[field])
+
+            for field, value in js["monthly"].items():
+                with self.subTest(case=name, monthly=field):
+                    self.assertEqual(server["monthly_totals"][field], value)
+            with self.subTest(case=name, weekly_warnings=True):
+                self.assertEqual(server["weekly_warnings"], js["warnings"])
+
+    def test_fixture_months(self):
+        self.assert_parity(load_fixtures())
+
+    def test_random_months(self):
+        self.assert_parity(random_months())
+
+    def test_holiday_list(self):
+        years = sorted({int(d[-4:]) for d in overtime_engine.HOLIDAYS})
+        self.assertEqual(overtime_engine.HOLIDAYS, set(run_harness("holidays", {"years": years})))
+
+
+if __name__ == "__main__":
+    unittest.main()
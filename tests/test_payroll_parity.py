@@ -0,0 +1,123 @@
+import os, sys, json, random, shutil, subprocess, unittest
+from datetime import date
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import overtime_engine
+import payroll_engine
+
+# ----------------------
+# Payroll Parity (payroll_engine vs the tax form in static/formulas.js)
+# ----------------------
+#
+# Every fixture month is classified by overtime_engine, then computed by
+# payroll_engine.run_payroll and by the tax form of formulas.js
+# (tests/formulas_harness.js under node) from the same totals and inputs; the
+# paid row and every tax form field must match as the browser shows them.
+# formulas.js carries the 2025 tax year, so the cases are 2025 months.
+
+NODE = shutil.which("node")
+HARNESS = os.path.join(HERE, "formulas_harness.js")
+FIXTURES = os.path.join(HERE, "fixtures", "payroll_months.json")
+RANDOM_CASES = 150
+TAX_YEAR = 2025
+
+
+def run_harness(mode, payload):
+    result = subprocess.run([NODE, HARNESS, mode], input=json.dumps(payload, ensure_ascii=False),
+                            capture_output=True, text=True, encoding="utf-8", check=True)
+    return json.loads(result.stdout)
+
+
+def load_fixtures():
+    with open(FIXTURES, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def random_cases(seed=21, count=RANDOM_CASES):
+    """Seeded random months and tax forms: odd number formats, blanks, ages around 18 / 50 / 67."""
+    rnd = random.Random(seed)
+
+    def clock():
+        return f"{rnd.randint(0, 23):02d}:{rnd.choice([0, 15, 30, 45, 7, 59]):02d}"
+
+    def number(low, high, blank=0.2):
+        if rnd.random() < blank:
+            return rnd.choice(["", "0", "None"])
+        value = rnd.uniform(low, high)
+        return rnd.choice([f"{value:.2f}", f"{value:.0f}", f"{value:,.2f}", f"{value:.3f}", f"₪{value:.2f}"])
+
+    cases = []
+    for n in range(count):
+        month = rnd.randint(1, 12)
+        entries = []
+        for day in range(1, 29):
+            if rnd.random() < 0.7:
+                entry = {"date": f"{day:02d}/{month:02d}/{TAX_YEAR}", "start_time": clock(), "end_time": clock()}
+                if rnd.random() < 0.05:
+                    entry["sick_day"] = "1"
+                if rnd.random() < 0.05:
+                    entry["day_off"] = "1"
+                if rnd.random() < 0.1:
+                    entry["advance_payment"] = number(0, 900, 0)
+                entries.append(entry)
+        form = {
+            "hourly_rate": number(25, rnd.choice([30, 60, 150, 400]), 0.05), "lunch_value": number(0, 50),
+            "thirteenth_salary": number(0, 3000), "mobile_value": number(0, 300), "clothing_value": number(0, 300),
+            "cars_value": number(0, 4000, 0.6), "contract_status": rnd.choice(["אישי", "קיבוצי", "", " אישי "]),
+            "tax_credit_points": rnd.choice(["2.25", "2.75", "0", "", "1", "4.5"]),
+            "tax_point_child": number(0, 400, 0.6), "monthly_city_tax_tops": number(0, 20000, 0.5),
+            "city_value_percentage": rnd.choice(["", "7", "10", "12.5", "None", "0"]),
+            "date_of_birth": rnd.choice(["1950-05-01", "2010-01-01", "1970-12-31", "20/10/1960", "", "bad",
+                                         f"{TAX_YEAR - 18}-{month:02d}-15", f"{TAX_YEAR - 67}-{month:02d}-01",
+                                         f"{TAX_YEAR - 50}-{month:02d}-28"]),
+            "miscellaneous": number(0, 200, 0.7), "salary_tax": number(0, 200, 0.7),
+            "miscellaneous_deductions": number(0, 200, 0.7),
+        }
+        today = date(TAX_YEAR, month, rnd.randint(1, 28)).isoformat()
+        cases.append({"name": f"random #{n}", "year": TAX_YEAR, "month": month, "today": today,
+                      "form": form, "entries": entries})
+    return cases
+
+
+@unittest.skipUnless(NODE, "node is not installed")
+class PayrollParityTest(unittest.TestCase):
+
+    def assert_parity(self, cases):
+        hours = [overtime_engine.classify_month(c["year"], c["month"], c["entries"]) for c in cases]
+        server = [
+            payroll_engine.run_payroll([c["form"]], [h], date.fromisoformat(c["today"]), c["year"])[0]
+            for c, h in zip(cases, hours)
+        ]
+        tax_keys = list(server[0]["tax"])
+        paid_keys = [k for k in server[0]["paid_totals"] if k not in hours[0]["paid_totals"]]
+
+        browser = run_harness("payroll", [
+            {
+                "form": c["form"], "today": c["today"],
+                "monthly": h["monthly_totals"],
+                "weekend": h["paid_totals"]["final_total_extra_hours_weekend_monthly"],
+                "entries": h["work_day_entries"],
+                "tax_keys": tax_keys, "paid_keys": paid_keys,
+            }
+            for c, h in zip(cases, hours)
+        ])
+
+        for case, result, js in zip(cases, server, browser):
+            for field in tax_keys:
+                with self.subTest(case=case["name"], tax=field):
+                    self.assertEqual(result["tax"][field], js["tax"][field])
+            for field in paid_keys:
+                with self.subTest(case=case["name"], paid=field):
+                    self.assertEqual(result["paid_totals"][field], js["paid"][field])
+
+    def test_fixture_months(self):
+        self.assert_parity(load_fixtures())
+
+    def test_random_months(self):
+        self.assert_parity(random_cases())
+
+
+if __name__ == "__main__":
+    unittest.main()
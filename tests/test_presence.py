@@ -0,0 +1,93 @@
+import os, sys, unittest
+from datetime import date, datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from flask import Flask
+
+from database import db, EmployeeData
+from employee_identity import identity_cache
+import clock_store
+import presence
+
+# ----------------------
+# Presence Board (night shifts closed after midnight)
+# ----------------------
+#
+# Rows are written the way the clock routes write them (clock_store on an
+# in-memory SQLite database); the board must publish a clock_out delta when a
+# punch after midnight closes yesterday's open shift.
+
+TODAY = date(2025, 3, 10)
+YESTERDAY = TODAY - timedelta(days=1)
+
+
+class PresenceNightShiftTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        row = EmployeeData(employee_name="Dana Levi", id_number="123456789", role="עובד")
+        db.session.add(row)
+        db.session.commit()
+        identity_cache.invalidate()
+        self.employee = identity_cache.get(row.id)
+        self.board = presence.PresenceBoard()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        identity_cache.invalidate()
+
+    def clock_in_yesterday(self):
+        start = datetime.combine(YESTERDAY, datetime.min.time()).replace(hour=22)
+        row = clock_store.upsert_day(self.employee, YESTERDAY.isoformat(), {}, defaults=clock_store.day_defaults(start),
+                                     prepare=lambda r: clock_store.punch_in(r, start))
+        return self.board.update(self.employee, row, TODAY)
+
+    def test_clock_out_after_midnight(self):
+        self.clock_in_yesterday()
+        self.assertTrue(self.board.snapshot(presence.ALL_COMPANIES)["companies"][0]["employees"][0]["clocked_in"])
+
+        # api_clockout: today's row, else yesterday's open night shift
+        end = datetime.combine(TODAY, datetime.min.time()).replace(hour=2)
+        day = clock_store.get_day(self.employee.id, TODAY.isoformat())
+        previous = clock_store.get_day(self.employee.id, YESTERDAY.isoformat())
+        day = clock_store.open_row(day, previous) or day
+        row = clock_store.upsert_day(self.employee, day.date, {}, row=day, prepare=lambda r: clock_store.punch_out(r, end))
+
+        delta = self.board.update(self.employee, row, TODAY)
+        self.assertIsNotNone(delta)
+        self.assertEqual(delta["type"], "clock_out")
+        self.assertEqual(delta["employee"]["date"], YESTERDAY.isoformat())
+        self.assertFalse(delta["employee"]["clocked_in"])
+        self.assertEqual(delta["employee"]["hours_today"], 4.0)
+
+    def test_batch_end_after_midnight(self):
+        self.clock_in_yesterday()
+        events = [{"idempotency_key": "t-1", "employee_id": self.employee.id, "type": "END",
+                   "timestamp": f"{TODAY.isoformat()}T02:00", "task": ""}]
+        results, changed = clock_store.apply_punch_batch(events)
+        self.assertEqual(results[0]["status"], "applied")
+
+        # /api/clock/batch publishes every row the batch wrote
+        dates = changed[(self.employee, str(YESTERDAY.year), f"{YESTERDAY.month:02d}")]
+        self.assertEqual(dates, {YESTERDAY.isoformat()})
+        delta = self.board.update(self.employee, clock_store.get_day(self.employee.id, YESTERDAY.isoformat()), TODAY)
+        self.assertEqual(delta["type"], "clock_out")
+
+    def test_older_rows_leave_the_board(self):
+        self.clock_in_yesterday()
+        old = clock_store.upsert_day(self.employee, (TODAY - timedelta(days=5)).isoformat(), {"task": "edit"})
+        self.assertIsNone(self.board.update(self.employee, old, TODAY))
+
+
+if __name__ == "__main__":
+    unittest.main()
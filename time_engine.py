@@ -0,0 +1,208 @@
+from datetime import date, datetime
+import numpy as np
+
+# ----------------------
+# Time Engine (integer minutes)
+# ----------------------
+#
+# All clock math is done on integer minutes:
+#   minute of day   0..1439, parsed from "HH:MM" without strptime
+#   minute stamp    days since 1970-01-01 * 1440 + minute of day
+# A day holds any number of shifts [start_stamp, end_stamp] (end None while
+# clocked in); the day total is the length of the union of its closed
+# shifts, so overlapping punches are never counted twice. Hours are
+# rounded to 2 decimals with integer math: hundredths = (minutes*100 + 30) // 60,
+# which equals round(minutes / 60, 2) for every whole minute count.
+
+MINUTES_PER_DAY = 1440
+EPOCH = date(1970, 1, 1)
+
+
+def parse_hm(text):
+    """'8:05' / '08:05' -> 485; anything else -> None."""
+    if text is None:
+        return None
+    text = str(text).strip()
+    hours, sep, minutes = text.partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit() or len(minutes) != 2 or len(hours) > 2:
+        return None
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def format_hm(minutes):
+    minutes = int(minutes) % MINUTES_PER_DAY
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def day_number(value):
+    """date / datetime / 'YYYY-MM-DD' -> days since 1970-01-01."""
+    if isinstance(value, datetime):
+        value = value.date()
+    elif not isinstance(value, date):
+        value = date.fromisoformat(str(value)[:10])
+    return (value - EPOCH).days
+
+
+def day_string(day):
+    return date.fromordinal(EPOCH.toordinal() + int(day)).isoformat()
+
+
+def stamp(day_value, hm):
+    """Minute stamp of HH:MM (or minute of day) on a day; None when hm is empty/invalid."""
+    minute = hm if isinstance(hm, int) else parse_hm(hm)
+    if minute is None:
+        return None
+    return day_number(day_value) * MINUTES_PER_DAY + minute
+
+
+def stamp_of(dt):
+    return day_number(dt) * MINUTES_PER_DAY + dt.hour * 60 + dt.minute
+
+
+def stamp_day(value):
+    return int(value) // MINUTES_PER_DAY
+
+
+def stamp_hm(value):
+    return format_hm(int(value) % MINUTES_PER_DAY)
+
+
+def hundredths(minutes):
+    return (int(minutes) * 100 + 30) // 60
+
+
+def hours(minutes):
+    return hundredths(minutes) / 100
+
+
+def shift_minutes(start_hm, end_hm):
+    """Minutes from start to end (end before start -> next day); None when either is missing."""
+    start, end = parse_hm(start_hm), parse_hm(end_hm)
+    if start is None or end is None:
+        return None
+    if end < start:
+        end += MINUTES_PER_DAY
+    return end - start
+
+
+def calculate_hours(start_hm, end_hm):
+    minutes = shift_minutes(start_hm, end_hm)
+    return 0.0 if minutes is None else hours(minutes)
+
+
+# ----------------------
+# Shifts Of One Day
+# ----------------------
+
+def day_shift(day_value, start_hm, end_hm):
+    """[start, end] stamps of an HH:MM pair on a day (overnight end -> next day)."""
+    start = stamp(day_value, start_hm)
+    end = stamp(day_value, end_hm)
+    if start is not None and end is not None and end < start:
+        end += MINUTES_PER_DAY
+    return [start, end]
+
+
+def merge_intervals(shifts):
+    """Sorted union of the closed shifts: [[start, end], ...] without overlaps."""
+    closed = sorted((s, e) for s, e in shifts if s is not None and e is not None and e > s)
+    merged = []
+    for start, end in closed:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def total_minutes(shifts):
+    return sum(end - start for start, end in merge_intervals(shifts))
+
+
+def is_open(shifts):
+    return bool(shifts) and shifts[-1][0] is not None and shifts[-1][1] is None
+
+
+def shifts_text(shifts):
+    """'08:00-12:00,13:00-' for exports; '' when the day has a single shift or none."""
+    if len(shifts) < 2:
+        return ""
+    return ",".join(
+        f"{stamp_hm(s) if s is not None else ''}-{stamp_hm(e) if e is not None else ''}" for s, e in shifts
+    )
+
+
+def parse_shifts_text(day_value, text):
+    shifts = []
+    for part in str(text or "").split(","):
+        if "-" not in part:
+            continue
+        start_hm, end_hm = part.split("-", 1)
+        start, end = day_shift(day_value, start_hm, end_hm)
+        if start is None and end is None:
+            continue
+        if start is not None and end is not None and shifts and shifts[-1][1] is not None and start < shifts[-1][1]:
+            # a later shift that wrapped past midnight
+            start += MINUTES_PER_DAY
+            end += MINUTES_PER_DAY
+        shifts.append([start, end])
+    return shifts
+
+
+# ----------------------
+# Vectorized Month Totals
+# ----------------------
+
+def month_minutes(owners, starts, ends, n_days):
+    """
+    Union length per day for a month of shifts in one array pass.
+    owners: day index of each shift (0..n_days-1), starts/ends: minute of day
+    of start and end (-1 missing); an end before its start runs into the next day.
+    Returns (minutes per day, has_closed_shift per day).
+    """
+    owners = np.asarray(owners, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    closed = (starts >= 0) & (ends >= 0)
+    owners, starts, ends = owners[closed], starts[closed], ends[closed]
+    ends = np.where(ends < starts, ends + MINUTES_PER_DAY, ends)
+
+    has_closed = np.bincount(owners, minlength=n_days) > 0
+    if not len(owners):
+        return np.zeros(n_days, dtype=np.int64), has_closed
+
+    # days are pushed apart on one timeline so a running max never crosses days
+    offset = owners * (3 * MINUTES_PER_DAY)
+    starts, ends = starts + offset, ends + offset
+    order = np.lexsort((starts, owners))
+    starts, ends, owners = starts[order], ends[order], owners[order]
+
+    reach = np.maximum.accumulate(ends)
+    previous = np.concatenate(([np.iinfo(np.int64).min], reach[:-1]))
+    contribution = np.maximum(ends - np.maximum(starts, previous), 0)
+    return np.bincount(owners, weights=contribution, minlength=n_days).astype(np.int64), has_closed
+
+
+def entries_hours(entries):
+    """
+    Hours of every work_day_entries item of a month (multi-shift aware) in one
+    array pass; '' for days without a complete shift.
+    """
+    owners, starts, ends = [], [], []
+    for i, entry in enumerate(entries):
+        pairs = entry.get("shifts") or [[entry.get("start_time"), entry.get("end_time")]]
+        for start_hm, end_hm in pairs:
+            start, end = parse_hm(start_hm), parse_hm(end_hm)
+            owners.append(i)
+            starts.append(-1 if start is None else start)
+            ends.append(-1 if end is None else end)
+
+    minutes, has_closed = month_minutes(owners, starts, ends, len(entries))
+    result = []
+    for m, ok in zip(minutes, has_closed):
+        result.append(hundredths(m) / 100 if ok else "")
+    return result
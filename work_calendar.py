@@ -0,0 +1,235 @@
+import calendar, hashlib, json, threading
+from datetime import date, timedelta
+import numpy as np
+
+# ----------------------
+# Work Calendar (day names, Saturdays, holidays, holiday eves)
+# ----------------------
+#
+# One table per Gregorian year, built lazily on first use and kept for the
+# life of the process. Month and range queries are slices of that table, so
+# the day lists of the forms, /get_days and the server-side hours engines all
+# read the same precomputed rows. Israeli holidays are computed from the
+# Hebrew calendar (Rosh Hashanah by the molad rules), so every year the UI
+# offers is covered, not only the years typed into isHoliday() in formulas.js.
+
+YEARS = range(2020, 2041)       # same range as the year selects
+MIN_YEAR, MAX_YEAR = 1900, 2199
+
+VERSION = 1                     # bump when the table format / rules change
+
+# short names, JS getDay() order (Sunday = 0)
+DAY_NAMES = ['ראשון', 'שני', 'שלישי', 'רביעי', 'חמישי', 'שישי', 'שבת']
+
+HOLIDAY_NAMES = [
+    'ראש השנה', 'ראש השנה ב', 'יום כיפור', 'סוכות', 'שמיני עצרת',
+    'פסח', 'שביעי של פסח', 'יום העצמאות', 'שבועות',
+]
+EVE_NAMES = [
+    'ערב ראש השנה', 'ערב יום כיפור', 'ערב סוכות', 'ערב שמיני עצרת',
+    'ערב פסח', 'ערב שביעי של פסח', 'ערב שבועות',
+]
+
+
+# ----------------------
+# Hebrew Calendar
+# ----------------------
+
+HEBREW_EPOCH = -1373427         # R.D. ordinal of 1 Tishrei AM 1
+
+
+def _elapsed_days(h_year):
+    months = (235 * h_year - 234) // 19
+    parts = 12084 + 13753 * months
+    days = 29 * months + parts // 25920
+    if (3 * (days + 1)) % 7 < 3:
+        days += 1
+    return days
+
+
+def _year_length_correction(h_year):
+    ny0, ny1, ny2 = _elapsed_days(h_year - 1), _elapsed_days(h_year), _elapsed_days(h_year + 1)
+    if ny2 - ny1 == 356:
+        return 2
+    if ny1 - ny0 == 382:
+        return 1
+    return 0
+
+
+def rosh_hashanah(h_year):
+    """Date of 1 Tishrei of a Hebrew year."""
+    return date.fromordinal(HEBREW_EPOCH + _elapsed_days(h_year) + _year_length_correction(h_year))
+
+
+def _independence_day(pesach):
+    """5 Iyar with the Israeli moves: Fri/Sat -> Thursday, Monday -> Tuesday."""
+    day = pesach + timedelta(days=20)
+    weekday = day.weekday()
+    if weekday == 4:
+        return day - timedelta(days=1)
+    if weekday == 5:
+        return day - timedelta(days=2)
+    if weekday == 0:
+        return day + timedelta(days=1)
+    return day
+
+
+def holidays_of_year(year):
+    """{date: (holiday index | -1, eve index | -1)} for a Gregorian year."""
+    rh = rosh_hashanah(year + 3761)                 # autumn of `year`
+    pesach = rosh_hashanah(year + 3761) - timedelta(days=163)   # 15 Nisan, spring of `year`
+
+    holidays = [
+        rh, rh + timedelta(days=1), rh + timedelta(days=9), rh + timedelta(days=14), rh + timedelta(days=21),
+        pesach, pesach + timedelta(days=6), _independence_day(pesach), pesach + timedelta(days=50),
+    ]
+    eves = [
+        rh - timedelta(days=1), rh + timedelta(days=8), rh + timedelta(days=13), rh + timedelta(days=20),
+        pesach - timedelta(days=1), pesach + timedelta(days=5), pesach + timedelta(days=49),
+    ]
+
+    marks = {}
+    for i, d in enumerate(holidays):
+        marks[d] = (i, marks.get(d, (-1, -1))[1])
+    for i, d in enumerate(eves):
+        if d not in marks:
+            marks[d] = (-1, i)
+    return {d: mark for d, mark in marks.items() if d.year == year}
+
+
+# ----------------------
+# Year Tables
+# ----------------------
+
+class YearTable:
+    """Precomputed rows of one Gregorian year (numpy columns + per-month day lists)."""
+
+    def __init__(self, year):
+        self.year = year
+        first = date(year, 1, 1)
+        n_days = 366 if calendar.isleap(year) else 365
+        self.dates = [first + timedelta(days=i) for i in range(n_days)]
+
+        self.weekday = np.array([(d.weekday() + 1) % 7 for d in self.dates], dtype=np.int8)
+        self.holiday = np.full(n_days, -1, dtype=np.int8)
+        self.eve = np.full(n_days, -1, dtype=np.int8)
+        for d, (holiday, eve) in holidays_of_year(year).items():
+            i = (d - first).days
+            self.holiday[i], self.eve[i] = holiday, eve
+
+        self.saturday = self.weekday == 6
+        self.friday = self.weekday == 5
+        self.is_holiday = self.holiday >= 0
+        self.is_eve = self.eve >= 0
+        self.working = (self.weekday < 5) & ~self.is_holiday
+
+        lengths = [calendar.monthrange(year, m)[1] for m in range(1, 13)]
+        self.month_start = np.concatenate(([0], np.cumsum(lengths))).astype(int)
+
+        self.rows = [self._row(i) for i in range(n_days)]
+        self.months = [self.rows[self.month_start[m]:self.month_start[m + 1]] for m in range(12)]
+        self.etags = [_etag(year, m + 1, rows) for m, rows in enumerate(self.months)]
+
+    def _row(self, i):
+        d = self.dates[i]
+        holiday, eve = int(self.holiday[i]), int(self.eve[i])
+        return {
+            "day": DAY_NAMES[int(self.weekday[i])],
+            "date": f"{d.day:02d}-{d.month:02d}-{d.year}",
+            "iso": d.isoformat(),
+            "saturday": bool(self.saturday[i]),
+            "holiday": HOLIDAY_NAMES[holiday] if holiday >= 0 else "",
+            "holiday_eve": EVE_NAMES[eve] if eve >= 0 else "",
+            "working_day": bool(self.working[i]),
+        }
+
+    def month_slice(self, month):
+        return slice(int(self.month_start[month - 1]), int(self.month_start[month]))
+
+
+def _etag(*parts):
+    payload = json.dumps([VERSION, *parts], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
+
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def year_table(year):
+    year = int(year)
+    if not MIN_YEAR <= year <= MAX_YEAR:
+        raise ValueError(f"year out of range: {year}")
+    table = _tables.get(year)
+    if table is None:
+        with _lock:
+            table = _tables.get(year)
+            if table is None:
+                table = _tables[year] = YearTable(year)
+    return table
+
+
+def warm(years=YEARS):
+    for year in years:
+        year_table(year)
+
+
+# ----------------------
+# Queries
+# ----------------------
+
+def _check_month(month):
+    month = int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f"month out of range: {month}")
+    return month
+
+
+def month_days(year, month):
+    """Day rows of a month (shared, do not mutate)."""
+    return year_table(year).months[_check_month(month) - 1]
+
+
+def month_etag(year, month):
+    return year_table(year).etags[_check_month(month) - 1]
+
+
+def month_arrays(year, month):
+    """numpy columns of a month for the hours engines (index 0 = day 1)."""
+    table = year_table(year)
+    part = table.month_slice(_check_month(month))
+    return {
+        "weekday": table.weekday[part],
+        "saturday": table.saturday[part],
+        "friday": table.friday[part],
+        "holiday": table.is_holiday[part],
+        "holiday_eve": table.is_eve[part],
+        "working_day": table.working[part],
+    }
+
+
+def range_days(start, end):
+    """Day rows from start to end (dates, inclusive)."""
+    if end < start:
+        raise ValueError("end before start")
+    rows = []
+    for year in range(start.year, end.year + 1):
+        table = year_table(year)
+        first = (start - date(year, 1, 1)).days if year == start.year else 0
+        last = (end - date(year, 1, 1)).days if year == end.year else len(table.rows) - 1
+        rows.extend(table.rows[first:last + 1])
+    return rows
+
+
+def range_etag(start, end):
+    tags = [year_table(y).etags for y in range(start.year, end.year + 1)]
+    return _etag(start.isoformat(), end.isoformat(), tags)
+
+
+def is_holiday(d):
+    table = year_table(d.year)
+    return bool(table.is_holiday[(d - date(d.year, 1, 1)).days])
+
+
+def holidays_between(start, end):
+    return [row for row in range_days(start, end) if row["holiday"]]
@@ -0,0 +1,91 @@
+import os, re
+import xlsxwriter
+
+import file_store
+
+# ----------------------
+# Streaming XLSX Writer
+# ----------------------
+#
+# Rows are written one at a time with xlsxwriter's constant_memory mode, so a
+# workbook never has to be held in memory (no pandas DataFrame in between).
+# Column widths are tracked while writing and applied when the sheet closes.
+
+_NUMBER_RE = re.compile(r"^-?(0|[1-9]\d*)(\.\d+)?$")
+
+HEADER_FORMAT = {
+    'bold': True,
+    'bg_color': '#000000',   # black background
+    'font_color': '#FFFFFF', # white text
+    'align': 'center',
+    'valign': 'vcenter',
+    'border': 1
+}
+
+BODY_FORMAT = {
+    'border': 1,
+    'border_color': '#FFFFFF',  # white grid lines
+    'bg_color': '#D9EAF7'       # light blue background
+}
+
+ALT_BODY_FORMAT = {
+    'border': 1,
+    'border_color': '#FFFFFF',
+    'bg_color': '#F2F2F2'       # light gray alternate rows
+}
+
+
+def _cell_value(value):
+    """Plain numeric strings become numbers (like the old CSV->DataFrame path); the rest stays text."""
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    text = str(value)
+    if _NUMBER_RE.match(text):
+        return float(text) if "." in text else int(text)
+    return text
+
+
+def write_xlsx(xlsx_path, fieldnames, rows, sheet_name):
+    """Stream rows (dicts keyed by fieldnames, or sequences in fieldnames order) into xlsx_path."""
+    os.makedirs(os.path.dirname(xlsx_path) or ".", exist_ok=True)
+    tmp_path = f"{file_store.temp_path(xlsx_path)}.xlsx"
+
+    workbook = xlsxwriter.Workbook(tmp_path, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    # Freeze the first row, RTL Hebrew view
+    worksheet.freeze_panes(1, 0)
+    worksheet.right_to_left()
+
+    header_format = workbook.add_format(HEADER_FORMAT)
+    body_format = workbook.add_format(BODY_FORMAT)
+    alt_body_format = workbook.add_format(ALT_BODY_FORMAT)
+
+    widths = [len(str(name)) for name in fieldnames]
+    for col_num, name in enumerate(fieldnames):
+        worksheet.write(0, col_num, name, header_format)
+
+    row_num = 0
+    for row_num, row in enumerate(rows, start=1):
+        fmt = body_format if row_num % 2 else alt_body_format
+        values = [row.get(name, "") for name in fieldnames] if isinstance(row, dict) else row
+
+        for col_num, value in enumerate(values):
+            if col_num >= len(widths):
+                widths.append(0)
+            value = _cell_value(value)
+            worksheet.write(row_num, col_num, value, fmt)
+            length = len(str(value)) if value != "" else 0
+            if length > widths[col_num]:
+                widths[col_num] = length
+
+    # Auto-adjust column widths
+    for col_num, width in enumerate(widths):
+        worksheet.set_column(col_num, col_num, width + 2)
+
+    workbook.close()
+    file_store.commit_temp(tmp_path, xlsx_path)
+    return row_num
+
@@ -0,0 +1,200 @@
+import os, threading
+
+import hours_store
+import file_store
+
+# ----------------------
+# Yearly Totals Accumulator (*_yearly fields)
+# ----------------------
+#
+# hours_data/hours_data_{year}/yearly_totals/{emp_id}.json
+#   {"monthly": {"01": [...], ...}, "prefix": {"01": [...], ..., "12": [...]}}
+#
+# "monthly" holds the parsed tax values of each saved month, "prefix" the
+# running sums from January up to and including that month. Saving month N
+# rewrites prefix N..12 only; reading the yearly figures of a month is a
+# single lookup. Accumulators are kept in memory once loaded and re-read
+# when another worker process rewrote the file (stat check under its lock).
+
+YEARLY_FIELDS = [
+    "sick_days_salary",
+    "vacation_days_salary",
+    "sick_days_balance",
+    "vacation_balance",
+    "gross_taxable",
+    "employee_pension_fund",
+    "self_employed_pension_fund",
+    "study_fund_deductions",
+    "miscellaneous_deductions",
+    "national_insurance_deductions",
+    "health_insurance_deductions",
+    "income_tax",
+    "amount_tax_credit_points_monthly",
+    "final_city_tax_benefit",
+    "pension_fund",
+    "compensation",
+    "study_fund",
+    "disability",
+    "miscellaneous",
+    "national_insurance",
+    "salary_tax",
+    "total_employer_contributions",
+    "total_salary_cost"
+]
+
+SICK_DAYS_ENTITLEMENT = 18
+VACATION_DAYS_ENTITLEMENT = 12
+
+MONTHS = [f"{m:02d}" for m in range(1, 13)]
+ACCUMULATOR_DIR = "yearly_totals"
+
+_lock = threading.Lock()
+_accumulators = {}   # (base_dir, year, emp_id) -> (file stat, {"monthly": ..., "prefix": ...})
+
+
+def clean_number(value):
+    try:
+        return float(str(value).replace("₪", "").replace(",", "").strip())
+    except:
+        return 0.0
+
+
+def _month_of(month_key):
+    return str(month_key).split("-")[1].zfill(2)
+
+
+def _accumulator_path(base_dir, year, employee_id):
+    return os.path.join(
+        hours_store.year_folder(base_dir, year), ACCUMULATOR_DIR,
+        f"{hours_store._safe_part(employee_id)}.json"
+    )
+
+
+def tax_vector(tax):
+    tax = tax or {}
+    return [clean_number(tax.get(field, 0)) for field in YEARLY_FIELDS]
+
+
+def _zero():
+    return [0.0] * len(YEARLY_FIELDS)
+
+
+def _fill_prefix(acc, start_month):
+    """Recompute prefix sums from start_month to December: O(12 x fields)."""
+    start = MONTHS.index(start_month)
+    running = list(acc["prefix"][MONTHS[start - 1]]) if start > 0 else _zero()
+    for month in MONTHS[start:]:
+        values = acc["monthly"].get(month)
+        if values:
+            running = [round(a + b, 6) for a, b in zip(running, values)]
+        acc["prefix"][month] = running
+
+
+def _file_stat(path):
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _save(base_dir, year, employee_id, acc):
+    path = _accumulator_path(base_dir, year, employee_id)
+    file_store.write_json(path, acc, indent=None)
+    _accumulators[(base_dir, str(year), str(employee_id))] = (_file_stat(path), acc)
+
+
+def _build_from_shards(base_dir, year, employee_id):
+    acc = {"monthly": {}, "prefix": {}}
+    for month_key, month_data in hours_store.load_employee(base_dir, year, employee_id).items():
+        if not str(month_key).startswith(str(year)):
+            continue
+        try:
+            month = _month_of(month_key)
+        except IndexError:
+            continue
+        acc["monthly"][month] = tax_vector(month_data.get("hours_table", {}).get("tax", {}))
+    _fill_prefix(acc, MONTHS[0])
+    return acc
+
+
+def _load(base_dir, year, employee_id):
+    key = (base_dir, str(year), str(employee_id))
+    path = _accumulator_path(base_dir, year, employee_id)
+    stat = _file_stat(path)
+    cached = _accumulators.get(key)
+    if cached is not None and stat is not None and cached[0] == stat:
+        return cached[1]
+
+    if stat is not None:
+        acc = file_store.read_json(path, {})
+        _accumulators[key] = (stat, acc)
+    else:
+        acc = _build_from_shards(base_dir, year, employee_id)
+        _save(base_dir, year, employee_id, acc)
+    return acc
+
+
+def format_totals(values):
+    totals = {f"{field}_yearly": v for field, v in zip(YEARLY_FIELDS, values)}
+
+    totals["sick_days_balance_yearly"] = SICK_DAYS_ENTITLEMENT - totals["sick_days_salary_yearly"]
+    totals["vacation_balance_yearly"] = VACATION_DAYS_ENTITLEMENT - totals["vacation_days_salary_yearly"]
+
+    formatted = {}
+    for k, v in totals.items():
+        if "balance" in k or "days" in k:
+            formatted[k] = f"{v:.2f}"
+        else:
+            formatted[k] = f"{v:,.2f}"
+    return formatted
+
+
+# ----------------------
+# Public API
+# ----------------------
+
+def record_month(base_dir, year, employee_id, month_key, tax):
+    """
+    Store one month's tax values and return (yearly totals of that month,
+    later months whose yearly totals changed).
+    """
+    month = _month_of(month_key)
+    with _lock, file_store.lock(_accumulator_path(base_dir, year, employee_id)):
+        acc = _load(base_dir, year, employee_id)
+        new_values = tax_vector(tax)
+        changed = acc["monthly"].get(month) != new_values
+        acc["monthly"][month] = new_values
+        _fill_prefix(acc, month)
+        _save(base_dir, year, employee_id, acc)
+
+        later = [m for m in MONTHS[MONTHS.index(month) + 1:] if m in acc["monthly"]] if changed else []
+        return (
+            format_totals(acc["prefix"][month]),
+            {f"{year}-{m}": format_totals(acc["prefix"][m]) for m in later}
+        )
+
+
+def yearly_for(base_dir, year, employee_id, month_key):
+    """Yearly totals (January .. month) as the forms show them."""
+    with _lock:
+        acc = _load(base_dir, year, employee_id)
+        return format_totals(acc["prefix"][_month_of(month_key)])
+
+
+def forget(base_dir, year, employee_id=None):
+    """Drop accumulators after shards were written behind our back; rebuilt on next use."""
+    with _lock:
+        for key in [k for k in _accumulators if k[0] == base_dir and k[1] == str(year)
+                    and (employee_id is None or k[2] == str(employee_id))]:
+            del _accumulators[key]
+        folder = os.path.join(hours_store.year_folder(base_dir, year), ACCUMULATOR_DIR)
+        if employee_id is not None:
+            paths = [_accumulator_path(base_dir, year, employee_id)]
+        elif os.path.isdir(folder):
+            paths = [os.path.join(folder, name) for name in os.listdir(folder)]
+        else:
+            paths = []
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)